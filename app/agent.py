@@ -1,48 +1,259 @@
-from transformers import pipeline
 import time
+import copy
+import hashlib
 import json
 import os
+import queue
+import re
+import threading
+
+from app.backends import PipelineBackend, get_backend
+from app.cache import SQLiteCache
+from app.memory import IncidentMemory
+from app.scoring import ScoringEngine, DEFAULT_RULES_FILE
+from utils.metrics import ALERTS_PROCESSED, CACHE_REQUESTS, TOKENS_GENERATED, stage_timer
+
+_ALERT_IP_RE = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+_ALERT_TIME_RE = re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?\b', re.IGNORECASE)
+_ALERT_NUMBER_RE = re.compile(r'\d+')
+
+def normalize_alert(text):
+    """Reduce alert text to a template so alerts differing only in IPs, times or counts match"""
+    if not text:
+        return ""
+    text = _ALERT_IP_RE.sub("<ip>", text)
+    text = _ALERT_TIME_RE.sub("<time>", text)
+    text = _ALERT_NUMBER_RE.sub("<n>", text)
+    return " ".join(text.lower().split())
+
+# Fixed opening of every prompt; it never changes, so its key/value cache can be reused.
+# It ends on a non-space character so it tokenizes the same alone as inside the full prompt.
+PROMPT_PREAMBLE = (
+    "You are a cybersecurity expert conducting threat analysis.\n"
+    "Given the following information, provide a security assessment and recommendation.\n"
+    "Your assessment should include:\n"
+    "1. Is this likely a real security threat? Why or why not?\n"
+    "2. What MITRE ATT&CK tactics might this relate to?\n"
+    "3. What specific actions should the security team take?"
+)
+PROMPT_SUFFIX = "\n\nSecurity Assessment:"
+
+# Sent to on_token when generation fails after part of the answer was streamed
+STREAM_INTERRUPTED = "\n\n[Generation failed, falling back to a score-based recommendation]\n\n"
+
+# generate() skips prompt tokens already in past_key_values from this transformers release on
+PROMPT_CACHE_MIN_TRANSFORMERS = (4, 38)
+
+# Enrichment fields dropped first, in this order, when a prompt is over its token budget
+LOW_VALUE_FIELDS = ("Timezone", "Is Mobile", "Coordinates", "Region", "City", "AbuseIPDB",
+                    "Reputation Source", "ISP", "ASN", "Fallback", "Note")
+
+def load_generation_pipeline(model_name, backend=None):
+    """
+    Build a text-generation pipeline with an inference backend
+    
+    If the backend can't load the model, the plain pipeline is tried, then gpt2.
+    Returns the pipeline, the name of the model actually loaded and the backend used
+    """
+    backend = backend or get_backend()
+    try:
+        return backend.load(model_name), model_name, backend
+    except (ImportError, ValueError, OSError, RuntimeError) as e:
+        if backend.name == PipelineBackend.name:
+            print(f"Warning: Could not load {model_name}, falling back to gpt2. Error: {e}")
+        else:
+            print(f"Warning: Could not load {model_name} with the {backend.name} backend, "
+                  f"using the plain pipeline. Error: {e}")
+            return load_generation_pipeline(model_name, PipelineBackend())
+    
+    backend = PipelineBackend()
+    return backend.load("gpt2"), "gpt2", backend
+
+def prompt_cache_supported():
+    """Whether the installed transformers can generate from a reused prompt prefix cache"""
+    try:
+        import transformers
+        version = tuple(int(part) for part in re.findall(r"\d+", transformers.__version__)[:2])
+    except (ImportError, ValueError):
+        return False
+    return version >= PROMPT_CACHE_MIN_TRANSFORMERS
+
+def extract_assessment(generated_text):
+    """Keep only the text the model produced after the prompt"""
+    return generated_text.split('Security Assessment:')[-1].strip()
+
+def generate_assessments(model, prompts, batch_size, generation_kwargs):
+    """Run prompts through a pipeline in padded batches and keep only the generated assessments"""
+    # Decoder-only models need left padding and a pad token to batch prompts
+    tokenizer = model.tokenizer
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token_id = model.model.config.eos_token_id
+    tokenizer.padding_side = "left"
+    
+    responses = model(prompts, batch_size=batch_size, **generation_kwargs)
+    return [extract_assessment(response[0]['generated_text']) for response in responses]
 
 class IncidentResponder:
-    def __init__(self, model_name='gpt2'):
+    # Upper bounds of the low and medium score bands used by template recommendations
+    LOW_BAND_MAX = 30
+    MEDIUM_BAND_MAX = 70
+    
+    def __init__(self, model_name='gpt2', llm_threshold=None, memory_file="memory_log.jsonl",
+                 max_incidents=10000, max_verdicts_per_ip=5, recommendation_cache=True,
+                 cache_dir="./cache", recommendation_cache_ttl=7 * 24 * 3600,
+                 recommendation_cache_max_entries=50000, scoring_rules_file=DEFAULT_RULES_FILE,
+                 max_new_tokens=None, prompt_token_budget=None, reuse_prompt_cache=True, backend=None):
         """
         Initialize the Incident Responder agent
         
+        The model is loaded on first use, so paths that never generate text
+        don't pay for importing transformers or loading weights.
+        
         Args:
             model_name: Name of the HuggingFace model to use
                         For better results, use 'segolilylabs/Lily-Cybersecurity-7B-v0.2'
                         if your system has sufficient resources
+            llm_threshold: Minimum threat score sent to the model. Alerts scoring
+                           below it get a template recommendation instead.
+                           None sends every alert to the model.
+            memory_file: Append-only incident log
+            max_incidents: Number of incidents kept in memory history
+            max_verdicts_per_ip: Number of recent verdicts kept for each IP
+            recommendation_cache: Reuse model recommendations for identical analysis inputs
+            cache_dir: Directory holding the recommendation cache
+            recommendation_cache_ttl: Lifetime of a cached recommendation in seconds
+            recommendation_cache_max_entries: Cached recommendations kept before LRU eviction
+            scoring_rules_file: JSON file with threat scoring weights and high-risk countries
+            max_new_tokens: Tokens generated per recommendation (default 200 for gpt2, 400 otherwise)
+            prompt_token_budget: Maximum prompt length in tokens; low-value enrichment fields
+                                 are dropped to fit. Defaults to the model's context window
+                                 minus max_new_tokens, capped at 512.
+            reuse_prompt_cache: Encode PROMPT_PREAMBLE once and reuse its key/value cache
+                                for single-alert generation
+            backend: Inference backend name from app.backends ("pipeline", "int8", "onnx").
+                     Defaults to the THREATSAGE_BACKEND environment variable, then "pipeline".
         """
-        try:
-            self.model = pipeline("text-generation", model=model_name, trust_remote_code=True)
-            self.model_name = model_name
-        except (ImportError, ValueError, OSError) as e:
-            print(f"Warning: Could not load {model_name}, falling back to gpt2. Error: {e}")
-            self.model = pipeline("text-generation", model="gpt2")
-            self.model_name = "gpt2"
+        self.model_name = model_name
+        self.llm_threshold = llm_threshold
+        self.max_new_tokens = max_new_tokens
+        self.prompt_token_budget = prompt_token_budget
+        self.reuse_prompt_cache = reuse_prompt_cache
+        self.backend = get_backend(backend)
+        self._model = None
+        self._prompt_cache = None
+        self._prompt_cache_lock = threading.Lock()
+        # The model is shared between threads (e.g. the service's workers), so loading and generation take turns
+        self._generation_lock = threading.RLock()
+        self.scoring = ScoringEngine(rules_file=scoring_rules_file)
+        
+        self.recommendation_cache = recommendation_cache
+        self.cache_dir = cache_dir
+        self.recommendation_cache_ttl = recommendation_cache_ttl
+        self.recommendation_cache_max_entries = recommendation_cache_max_entries
+        self._recommendations = None
+        self._recommendations_lock = threading.Lock()
             
-        self.memory_file = "memory_dump.txt"
+        self.memory_file = memory_file
+        self.max_incidents = max_incidents
+        self.max_verdicts_per_ip = max_verdicts_per_ip
         self.load_memory()
     
-    def load_memory(self):
-        """Load past incidents from memory file with error handling"""
-        self.memory = {"incidents": [], "known_ips": {}}
+    @property
+    def model(self):
+        """The text-generation pipeline, loaded on first access"""
+        if self._model is None:
+            with self._generation_lock:
+                if self._model is None:
+                    self._model = self._load_model(self.model_name)
+        return self._model
+    
+    def _load_model(self, model_name):
+        """Load the text-generation pipeline through the configured backend"""
+        model, self.model_name, self.backend = load_generation_pipeline(model_name, self.backend)
+        return model
+    
+    def backend_stats(self):
+        """Inference backend, memory footprint and tokens per second so far"""
+        return self.backend.stats()
+    
+    @property
+    def recommendations(self):
+        """The persistent recommendation cache, opened on first access"""
+        if self._recommendations is None:
+            with self._recommendations_lock:
+                if self._recommendations is None:
+                    self._recommendations = SQLiteCache(
+                        os.path.join(self.cache_dir, "recommendations.sqlite3"),
+                        ttl=self.recommendation_cache_ttl,
+                        max_entries=self.recommendation_cache_max_entries
+                    )
+        return self._recommendations
+    
+    def _recommendation_key(self, enriched_data, raw_alert, threat_score):
+        """
+        Fingerprint the inputs that determine a model recommendation
         
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        self.memory = json.loads(content)
-            except (json.JSONDecodeError, FileNotFoundError) as e:
-                print(f"Warning: Could not load memory file: {e}")
-                self.memory = {"incidents": [], "known_ips": {}}
+        LOW_VALUE_FIELDS are left out, so alerts that differ only in details
+        like the city or ISP share a recommendation.
+        """
+        ignored = ("Error",) + LOW_VALUE_FIELDS
+        features = {
+            "enrichment": {key: value for key, value in enriched_data.items() if key not in ignored},
+            "score": threat_score,
+            "alert": normalize_alert(raw_alert),
+            "model": self.model_name,
+            "backend": self.backend.name,
+            "generation": self._generation_kwargs(),
+        }
+        canonical = json.dumps(features, sort_keys=True, default=str)
+        return "rec:" + hashlib.sha256(canonical.encode()).hexdigest()
+    
+    def _cached_recommendation(self, enriched_data, raw_alert, threat_score):
+        """Return a previously generated recommendation for the same inputs, if any"""
+        if not self.recommendation_cache:
+            return None
+        cached = self.recommendations.get(self._recommendation_key(enriched_data, raw_alert, threat_score))
+        CACHE_REQUESTS.inc(cache="recommendation", result="hit" if cached is not None else "miss")
+        return cached
+    
+    def _load_changes_key(self):
+        """
+        Load the model; True if that changed the model or backend in the recommendation key
+        
+        Cache lookups before loading are keyed by the requested names. If
+        loading falls back (to gpt2, or the plain pipeline), the key changes,
+        and a recommendation from the fallback model may already be cached.
+        """
+        if not self.recommendation_cache or self._model is not None:
+            return False
+        requested = (self.model_name, self.backend.name)
+        try:
+            self.model
+        except Exception:
+            return False  # reported when generation tries to load it again
+        return (self.model_name, self.backend.name) != requested
+    
+    def _store_recommendation(self, enriched_data, raw_alert, threat_score, recommendation):
+        """
+        Remember a generated recommendation
+        Called after generation, so the key names the model and backend that produced it
+        """
+        if self.recommendation_cache:
+            key = self._recommendation_key(enriched_data, raw_alert, threat_score)
+            self.recommendations.set(key, recommendation)
+    
+    def load_memory(self):
+        """Open the incident memory log and rebuild its index"""
+        self.memory = IncidentMemory(
+            self.memory_file,
+            max_incidents=self.max_incidents,
+            max_verdicts_per_ip=self.max_verdicts_per_ip
+        )
     
     def save_memory(self):
-        """Save current state to memory file with error handling"""
+        """Flush pending memory writes to disk with error handling"""
         try:
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.memory, f, indent=2)
+            self.memory.flush()
         except IOError as e:
             print(f"Warning: Could not save memory to {self.memory_file}: {e}")
     
@@ -51,163 +262,507 @@ class IncidentResponder:
         if not ip_address:
             return {"seen_count": 0, "previous_verdicts": []}
             
-        if ip_address in self.memory.get("known_ips", {}):
-            return self.memory["known_ips"][ip_address]
-        return {"seen_count": 0, "previous_verdicts": []}
+        return self.memory.ip_history(ip_address)
+    
+    def _seen_count(self, enriched_data):
+        """How many times this record's IP appears in memory"""
+        ip = enriched_data.get("IP")
+        if not ip:
+            return 0
+        return self.analyze_ip_history(ip).get("seen_count", 0)
     
     def calculate_threat_score(self, enriched_data):
         """
         Calculate a threat score based on IP intelligence
         Returns score from 0-100 (higher is more suspicious)
         """
-        score = 0
+        return self.scoring.score(enriched_data, self._seen_count(enriched_data))
+    
+    def calculate_threat_scores(self, enriched_list):
+        """Score a batch of IP intelligence records in one vectorized pass"""
+        seen_counts = [self._seen_count(data) for data in enriched_list]
+        return self.scoring.score_many(enriched_list, seen_counts)
+    
+    def _build_prompt(self, enriched_data, raw_alert, threat_score):
+        """
+        Build the model prompt from IP intelligence, score and IP history
         
-        if enriched_data.get("Is Proxy", False):
-            score += 30
-        if enriched_data.get("Is Hosting", False):
-            score += 20
-            
+        The prompt starts with the fixed PROMPT_PREAMBLE. If it comes out longer
+        than the token budget, LOW_VALUE_FIELDS are dropped first, then the
+        previous incident list, and finally the alert text is shortened.
+        """
+        fields = [(key, f"- {key}: {value}") for key, value in enriched_data.items() if key != "Error"]
+        
+        history_lines = []
+        incident_lines = []
         ip = enriched_data.get("IP")
         if ip:
             history = self.analyze_ip_history(ip)
-            previous_incidents = history.get("seen_count", 0)
-            score += min(previous_incidents * 10, 30)
+            history_lines.append(f"\nIP History:")
+            history_lines.append(f"- Previously seen: {history.get('seen_count', 0)} times")
+            
+            if history.get("previous_verdicts", []):
+                incident_lines.append("- Previous incidents:")
+                for i, verdict in enumerate(history.get("previous_verdicts", [])[:3]):
+                    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', 
+                                             time.localtime(verdict.get("timestamp", 0)))
+                    incident_lines.append(f"  {i+1}. [{timestamp}] Score: {verdict.get('threat_score', 0)}/100")
         
-        if enriched_data.get("Reputation") == "Suspicious":
-            confidence = enriched_data.get("Confidence", "Low")
-            if confidence == "High":
-                score += 30
-            else:
-                score += 15
+        alert_line = f"Alert: {raw_alert}" if raw_alert else None
         
-        high_risk_countries = ["Russia", "China", "North Korea", "Iran"]
-        if enriched_data.get("Country") in high_risk_countries:
-            score += 20
-            
-        return min(score, 100)  # Cap at 100
+        def assemble():
+            context = [alert_line] if alert_line else []
+            context.append("IP Intelligence:")
+            context.extend(line for _, line in fields)
+            context.append(f"\nThreat Score: {threat_score}/100")
+            context.extend(history_lines + incident_lines)
+            return PROMPT_PREAMBLE + "\n\n" + "\n".join(context) + PROMPT_SUFFIX
+        
+        budget = self._prompt_budget()
+        prompt = assemble()
+        used = self._count_tokens(prompt)
+        if used <= budget:
+            return prompt
+        
+        # Per-line costs are close enough to additive to decide what to drop
+        for field in LOW_VALUE_FIELDS:
+            if used <= budget:
+                break
+            for i, (key, line) in enumerate(fields):
+                if key == field:
+                    used -= self._count_tokens(line) + 1
+                    del fields[i]
+                    break
+        
+        if used > budget and incident_lines:
+            used -= sum(self._count_tokens(line) + 1 for line in incident_lines)
+            incident_lines = []
+        
+        if used > budget and alert_line:
+            alert_tokens = self._count_tokens(alert_line)
+            keep = max(0.0, 1 - (used - budget) / max(alert_tokens, 1))
+            alert_line = alert_line[:max(len("Alert: ") + 80, int(len(alert_line) * keep))] + " ..."
+        
+        # Anything still over is cut by the pipeline's truncation
+        return assemble()
+    
+    def _max_new_tokens(self):
+        if self.max_new_tokens:
+            return self.max_new_tokens
+        return 200 if "gpt2" in self.model_name else 400
+    
+    def _prompt_budget(self):
+        """Prompt length limit in tokens"""
+        if self.prompt_token_budget:
+            return self.prompt_token_budget
+        window = getattr(getattr(self._model, "tokenizer", None), "model_max_length", None)
+        if not isinstance(window, int) or window > 131072:
+            window = 1024 if "gpt2" in self.model_name else 4096
+        return max(64, min(512, window - self._max_new_tokens()))
+    
+    def _generation_kwargs(self):
+        """Sampling settings for the loaded model"""
+        if "gpt2" in self.model_name:
+            return {"max_new_tokens": self._max_new_tokens(), "num_return_sequences": 1,
+                    "temperature": 0.7, "truncation": True}
+        return {"max_new_tokens": self._max_new_tokens(), "num_return_sequences": 1,
+                "temperature": 0.3, "top_p": 0.85, "truncation": True}
+    
+    def _generate_text(self, prompt, streamer=None):
+        """
+        Generate the assessment for one prompt
+        
+        Uses the cached PROMPT_PREAMBLE key/values when possible and the plain
+        pipeline otherwise. If the cached path fails after it started feeding
+        streamer, the error is raised rather than retried through the pipeline.
+        """
+        if (self.reuse_prompt_cache and self.backend.supports_prompt_cache
+                and prompt.startswith(PROMPT_PREAMBLE) and prompt_cache_supported()):
+            try:
+                generated = self._generate_with_prompt_cache(prompt, streamer)
+                if generated is not None:
+                    return generated
+            except Exception as e:
+                # Unsupported model; don't try again
+                self.reuse_prompt_cache = False
+                if streamer is not None and not getattr(streamer, "next_tokens_are_prompt", True):
+                    # generate() already fed the streamer, which skips only the first prompt it
+                    # sees; a retry through it would stream the whole prompt to the reader
+                    raise
+                print(f"Warning: Prompt cache unavailable, using the plain pipeline. Error: {e}")
+        
+        kwargs = self._generation_kwargs()
+        if streamer is not None:
+            kwargs["streamer"] = streamer
+        response = self.model(prompt, **kwargs)
+        return self._extract_assessment(response[0]['generated_text'])
+    
+    def _generate_with_prompt_cache(self, prompt, streamer=None):
+        """
+        Generate with model.generate, starting from a copy of the preamble's key/value cache
+        Returns None, before generating anything, if the prompt's tokens don't start with the cached preamble
+        """
+        import torch
+        
+        tokenizer = self.model.tokenizer
+        language_model = self.model.model
+        
+        if self._prompt_cache is None:
+            with self._prompt_cache_lock:
+                if self._prompt_cache is None:
+                    prefix_ids = tokenizer(PROMPT_PREAMBLE, return_tensors="pt").input_ids.to(language_model.device)
+                    with torch.no_grad():
+                        output = language_model(prefix_ids, use_cache=True)
+                    self._prompt_cache = (prefix_ids, output.past_key_values)
+        prefix_ids, past_key_values = self._prompt_cache
+        
+        # Tokenize the whole prompt once: BPE/SentencePiece merges can cross the preamble
+        # boundary, so the cache is only valid if the prompt starts with exactly its tokens
+        input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(language_model.device)
+        prefix_length = prefix_ids.shape[1]
+        if input_ids.shape[1] <= prefix_length or not torch.equal(input_ids[:, :prefix_length], prefix_ids):
+            return None
+        
+        kwargs = {key: value for key, value in self._generation_kwargs().items() if key != "truncation"}
+        with torch.no_grad():
+            # Full input_ids: generate() only runs the tokens past the cached prefix through the model
+            output_ids = language_model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                # generate() extends the cache in place, so every call needs its own copy
+                past_key_values=copy.deepcopy(past_key_values),
+                pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else language_model.config.eos_token_id,
+                streamer=streamer,
+                **kwargs
+            )
+        return tokenizer.decode(output_ids[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+    
+    def _extract_assessment(self, generated_text):
+        """Keep only the text the model produced after the prompt"""
+        return extract_assessment(generated_text)
+    
+    def _fallback_recommendation(self, threat_score):
+        """Recommendation used when the model fails"""
+        return (
+            f"Unable to provide detailed analysis due to a model error. "
+            f"Based on the threat score of {threat_score}/100, "
+            f"this incident {'requires attention' if threat_score > 50 else 'should be monitored'}."
+        )
+    
+    def _count_tokens(self, text):
+        """Tokens in text, by the loaded tokenizer or estimated if no model is loaded here"""
+        tokenizer = getattr(self._model, "tokenizer", None)
+        try:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        except (AttributeError, TypeError):
+            return max(len(text.split()), len(text) // 4)
+    
+    def _needs_model(self, threat_score, force_llm=False):
+        """Decide whether an alert goes to the model or gets a template recommendation"""
+        return force_llm or self.llm_threshold is None or threat_score >= self.llm_threshold
+    
+    def _template_recommendation(self, threat_score, enriched_data):
+        """Build a recommendation from the score band and reputation fields, without the model"""
+        if threat_score <= self.LOW_BAND_MAX:
+            band = "Low"
+            actions = [
+                "No immediate action required; keep monitoring this IP",
+                "Confirm the activity matches expected user behavior",
+            ]
+        elif threat_score <= self.MEDIUM_BAND_MAX:
+            band = "Medium"
+            actions = [
+                "Review authentication and access logs for this IP over the last 24 hours",
+                "Verify the activity with the owner of the affected account",
+                "Consider a temporary block at the firewall if the activity continues",
+            ]
+        else:
+            band = "High"
+            actions = [
+                "Block this IP at the network perimeter",
+                "Reset credentials for any account it targeted",
+                "Search for other activity from this IP across your logs",
+            ]
+        
+        findings = [f"Threat score {threat_score}/100 ({band} risk)."]
+        
+        if enriched_data.get("Is Internal", False):
+            findings.append("The address is on the internal network.")
+        elif enriched_data.get("Reputation") == "Suspicious":
+            findings.append(
+                f"The IP has a suspicious reputation ({enriched_data.get('Confidence', 'Low')} confidence)."
+            )
+            activities = enriched_data.get("Reported Activities", [])
+            if activities:
+                findings.append(f"Reported activity: {', '.join(activities)}.")
+        else:
+            findings.append("No adverse reputation is recorded for this IP.")
+        
+        infrastructure = [label for key, label in (("Is Proxy", "a proxy"), ("Is Hosting", "a hosting provider"))
+                          if enriched_data.get(key, False)]
+        if infrastructure:
+            findings.append(f"Traffic originates from {' and '.join(infrastructure)}.")
+        
+        lines = [" ".join(findings), "", "Recommended actions:"]
+        lines.extend(f"{i+1}) {action}" for i, action in enumerate(actions))
+        return "\n".join(lines)
     
-    def reason(self, enriched_data, raw_alert=None):
+    def reason(self, enriched_data, raw_alert=None, force_llm=False, on_token=None):
         """
         Perform reasoning about the security incident
         
         Args:
             enriched_data: Dictionary of IP intelligence
             raw_alert: Original alert text if available
+            force_llm: Send the alert to the model even if it scores below llm_threshold
+            on_token: Optional callable receiving recommendation text as it is generated.
+                      Template and cached recommendations arrive in a single call. If generation
+                      fails partway, STREAM_INTERRUPTED is sent before the fallback recommendation.
         
         Returns:
             Dictionary with recommendation and analysis
         """
-        threat_score = self.calculate_threat_score(enriched_data)
-        
-        context = []
-        if raw_alert:
-            context.append(f"Alert: {raw_alert}")
-        
-        context.append("IP Intelligence:")
-        for key, value in enriched_data.items():
-            if key != "Error":
-                context.append(f"- {key}: {value}")
+        timings = {}
+        start = time.perf_counter()
+        with stage_timer("score", timings):
+            threat_score = self.calculate_threat_score(enriched_data)
+        cached = False
+        streamed = False
         
-        context.append(f"\nThreat Score: {threat_score}/100")
-        
-        ip = enriched_data.get("IP")
-        if ip:
-            history = self.analyze_ip_history(ip)
-            context.append(f"\nIP History:")
-            context.append(f"- Previously seen: {history.get('seen_count', 0)} times")
+        if self._needs_model(threat_score, force_llm):
+            tier = "model"
+            raw_response = self._cached_recommendation(enriched_data, raw_alert, threat_score)
+            if raw_response is None and self._load_changes_key():
+                raw_response = self._cached_recommendation(enriched_data, raw_alert, threat_score)
+            cached = raw_response is not None
             
-            if history.get("previous_verdicts", []):
-                context.append("- Previous incidents:")
-                for i, verdict in enumerate(history.get("previous_verdicts", [])[:3]):
-                    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', 
-                                             time.localtime(verdict.get("timestamp", 0)))
-                    context.append(f"  {i+1}. [{timestamp}] Score: {verdict.get('threat_score', 0)}/100")
-        
-        formatted_input = (
-            "You are a cybersecurity expert conducting threat analysis.\n"
-            "Given the following information, provide a security assessment and recommendation.\n\n"
-            f"{chr(10).join(context)}\n\n"
-            "Your assessment should include:\n"
-            "1. Is this likely a real security threat? Why or why not?\n"
-            "2. What MITRE ATT&CK tactics might this relate to?\n"
-            "3. What specific actions should the security team take?\n\n"
-            "Security Assessment:"
-        )
-
-        try:
-            if "gpt2" in self.model_name:
-                response = self.model(
-                    formatted_input, 
-                    max_length=400,
-                    num_return_sequences=1,
-                    temperature=0.7,
-                    truncation=True
-                )
-            else:
-                response = self.model(
-                    formatted_input, 
-                    max_length=800,
-                    num_return_sequences=1,
-                    temperature=0.3,
-                    top_p=0.85,
-                    truncation=True
-                )
-            
-            raw_response = response[0]['generated_text'].split('Security Assessment:')[-1].strip()
-            
-        except Exception as e:
-            print(f"Error generating recommendation: {e}")
-            raw_response = (
-                f"Unable to provide detailed analysis due to a model error. "
-                f"Based on the threat score of {threat_score}/100, "
-                f"this incident {'requires attention' if threat_score > 50 else 'should be monitored'}."
-            )
+            if not cached:
+                formatted_input = self._build_prompt(enriched_data, raw_alert, threat_score)
+                sent = []
+                
+                def stream_token(text):
+                    sent.append(text)
+                    on_token(text)
+                
+                try:
+                    with self._generation_lock, stage_timer("generate", timings):
+                        if on_token is None:
+                            raw_response = self._generate_text(formatted_input)
+                        else:
+                            streamed = True
+                            raw_response = self._generate_streaming(formatted_input, stream_token, timings, start)
+                    tokens = self._count_tokens(raw_response)
+                    TOKENS_GENERATED.inc(tokens)
+                    self.backend.record(tokens, timings["generate"])
+                    self._store_recommendation(enriched_data, raw_alert, threat_score, raw_response)
+                except Exception as e:
+                    print(f"Error generating recommendation: {e}")
+                    raw_response = self._fallback_recommendation(threat_score)
+                    streamed = False
+                    if sent:
+                        # Part of an answer already went out; mark the break so the fallback isn't read as its ending
+                        on_token(STREAM_INTERRUPTED)
+        else:
+            tier = "template"
+            raw_response = self._template_recommendation(threat_score, enriched_data)
         
-        self._update_memory(enriched_data.get("IP"), threat_score, raw_response)
+        if on_token is not None and not streamed:
+            timings.setdefault("first_token", round(time.perf_counter() - start, 6))
+            on_token(raw_response)
+        
+        with stage_timer("memory", timings):
+            self._update_memory(enriched_data.get("IP"), threat_score, raw_response)
+        ALERTS_PROCESSED.inc(tier=tier)
         
         return {
             "threat_score": threat_score,
             "recommendation": raw_response,
-            "timestamp": time.time()
+            "tier": tier,
+            "cached": cached,
+            "timestamp": time.time(),
+            "timings": timings
         }
     
-    def _update_memory(self, ip, threat_score, verdict):
-        """Update memory with new incident information"""
-        if not ip:
-            return
-            
-        if "known_ips" not in self.memory:
-            self.memory["known_ips"] = {}
-            
-        if ip not in self.memory["known_ips"]:
-            self.memory["known_ips"][ip] = {
-                "seen_count": 0,
-                "previous_verdicts": []
-            }
-            
-        self.memory["known_ips"][ip]["seen_count"] += 1
+    def _generate_streaming(self, prompt, on_token, timings, start):
+        """
+        Run generation on a background thread and pass text to on_token as it is decoded
+        Records the delay until the first text arrived as timings["first_token"]
+        """
+        try:
+            from transformers import TextIteratorStreamer
+        except ImportError:
+            # transformers without streaming support: send the whole answer at once
+            text = self._generate_text(prompt)
+            timings["first_token"] = round(time.perf_counter() - start, 6)
+            on_token(text)
+            return text
         
-        compact_verdict = {
-            "timestamp": time.time(),
-            "threat_score": threat_score,
-            "summary": verdict[:100] + "..." if len(verdict) > 100 else verdict
-        }
+        streamer = TextIteratorStreamer(self.model.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
         
-        self.memory["known_ips"][ip]["previous_verdicts"].append(compact_verdict)
+        def generate():
+            try:
+                self._generate_text(prompt, streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer loop below
+                streamer.end()
         
-        if len(self.memory["known_ips"][ip]["previous_verdicts"]) > 5:
-            self.memory["known_ips"][ip]["previous_verdicts"] = self.memory["known_ips"][ip]["previous_verdicts"][-5:]
-            
-        if "incidents" not in self.memory:
-            self.memory["incidents"] = []
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        
+        chunks = []
+        for text in streamer:
+            if not chunks:
+                # Match the stripped non-streaming text; leading whitespace doesn't count as output
+                text = text.lstrip()
+                if text:
+                    timings["first_token"] = round(time.perf_counter() - start, 6)
+            if not text:
+                continue
+            chunks.append(text)
+            on_token(text)
+        thread.join()
+        
+        if errors:
+            raise errors[0]
+        return "".join(chunks).strip()
+    
+    def reason_stream(self, enriched_data, raw_alert=None, force_llm=False):
+        """
+        Generator version of reason() that yields recommendation text as it is produced
+        
+        The analysis dictionary is the generator's return value:
+            analysis = yield from responder.reason_stream(ip_data)
+        """
+        chunks = queue.Queue()
+        done = object()
+        outcome = {}
+        
+        def run():
+            try:
+                outcome["analysis"] = self.reason(enriched_data, raw_alert, force_llm, on_token=chunks.put)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                chunks.put(done)
+        
+        threading.Thread(target=run, daemon=True).start()
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["analysis"]
+    
+    def _generate_many(self, prompts, batch_size):
+        """Generate assessments for several prompts with the in-process model"""
+        with self._generation_lock:
+            return generate_assessments(self.model, prompts, batch_size, self._generation_kwargs())
+    
+    def reason_many(self, enriched_list, alerts=None, batch_size=8, force_llm=False, generate=None):
+        """
+        Perform reasoning about several incidents with batched generation
+        
+        All prompts are built up front and run through the model in padded
+        batches of batch_size. Alerts below llm_threshold get template
+        recommendations and never reach the model, and alerts whose inputs
+        match a cached recommendation reuse it. Scores and IP history
+        reflect memory as it was before the call; memory is updated and saved
+        once at the end.
+        
+        Args:
+            enriched_list: List of IP intelligence dictionaries
+            alerts: Optional list of original alert texts, aligned with enriched_list
+            batch_size: Number of prompts per forward pass
+            force_llm: Send every alert to the model regardless of llm_threshold
+            generate: Optional callable(prompts, batch_size) returning one assessment
+                      per prompt (None for a prompt that failed on its own), used
+                      instead of the in-process model
+        
+        Returns:
+            List of analysis dictionaries, in input order
+        """
+        if not enriched_list:
+            return []
+        alerts = alerts or [None] * len(enriched_list)
+        
+        with stage_timer("score"):
+            scores = self.calculate_threat_scores(enriched_list)
+        recommendations = [None] * len(enriched_list)
+        tiers = ["template"] * len(enriched_list)
+        cached = [False] * len(enriched_list)
+        
+        model_indexes = []
+        for i, (data, score) in enumerate(zip(enriched_list, scores)):
+            if not self._needs_model(score, force_llm):
+                recommendations[i] = self._template_recommendation(score, data)
+                continue
+            tiers[i] = "model"
+            recommendations[i] = self._cached_recommendation(data, alerts[i], score)
+            if recommendations[i] is not None:
+                cached[i] = True
+            else:
+                model_indexes.append(i)
+        
+        if model_indexes and generate is None and self._load_changes_key():
+            missing = []
+            for i in model_indexes:
+                recommendations[i] = self._cached_recommendation(enriched_list[i], alerts[i], scores[i])
+                if recommendations[i] is not None:
+                    cached[i] = True
+                else:
+                    missing.append(i)
+            model_indexes = missing
+        
+        if model_indexes:
+            prompts = [self._build_prompt(enriched_list[i], alerts[i], scores[i]) for i in model_indexes]
+            try:
+                generate_timings = {}
+                with stage_timer("generate", generate_timings):
+                    generated = list((generate or self._generate_many)(prompts, batch_size))
+                if len(generated) != len(prompts):
+                    # Can't tell which prompt a shorter or longer list lost, so trust none of it
+                    raise ValueError(f"expected {len(prompts)} assessments, got {len(generated)}")
+                tokens = sum(self._count_tokens(text) for text in generated if text is not None)
+                TOKENS_GENERATED.inc(tokens)
+                self.backend.record(tokens, generate_timings["generate"])
+                for i, recommendation in zip(model_indexes, generated):
+                    if recommendation is not None:
+                        self._store_recommendation(enriched_list[i], alerts[i], scores[i], recommendation)
+            except Exception as e:
+                print(f"Error generating recommendations: {e}")
+                generated = [None] * len(model_indexes)
             
-        self.memory["incidents"].append({
-            "ip": ip,
-            "timestamp": time.time(),
-            "threat_score": threat_score
-        })
+            for i, recommendation in zip(model_indexes, generated):
+                if recommendation is None:
+                    recommendation = self._fallback_recommendation(scores[i])
+                recommendations[i] = recommendation
         
-        if len(self.memory["incidents"]) > 100:
-            self.memory["incidents"] = self.memory["incidents"][-100:]
+        results = []
+        for i, data in enumerate(enriched_list):
+            self._update_memory(data.get("IP"), scores[i], recommendations[i], save=False)
+            ALERTS_PROCESSED.inc(tier=tiers[i])
+            results.append({
+                "threat_score": scores[i],
+                "recommendation": recommendations[i],
+                "tier": tiers[i],
+                "cached": cached[i],
+                "timestamp": time.time()
+            })
+        self.save_memory()
+        
+        return results
+    
+    def _update_memory(self, ip, threat_score, verdict, save=True):
+        """Update memory with new incident information"""
+        if not ip:
+            return
+            
+        self.memory.record(ip, threat_score, verdict)
             
-        self.save_memory()
\ No newline at end of file
+        if save:
+            self.save_memory()
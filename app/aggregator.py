@@ -0,0 +1,154 @@
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Passed through an alert stream when no input arrived for a while, so open incidents can be closed
+IDLE = object()
+
+_SYSLOG_TIMESTAMP_RE = re.compile(r'^([A-Z][a-z]{2})\s+(\d{1,2})\s+(\d{2}:\d{2}:\d{2})\b')
+
+def alert_timestamp(alert, default=None):
+    """
+    Work out when an alert happened, as epoch seconds
+
+    Uses the record's "timestamp" (epoch number or ISO 8601 string), then an
+    RFC 3164 syslog prefix such as "Oct 17 03:44:01" (assumed to be in the
+    past year), and finally default or the current time.
+    """
+    value = alert.get("timestamp")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    
+    match = _SYSLOG_TIMESTAMP_RE.match(alert.get("alert") or "")
+    if match:
+        try:
+            parsed = datetime.strptime(" ".join(match.groups()), "%b %d %H:%M:%S")
+            now = datetime.now()
+            parsed = parsed.replace(year=now.year)
+            # Syslog has no year: a date ahead of now (beyond clock skew) is from last year, e.g. Dec 31 read on Jan 1
+            if parsed > now + timedelta(days=1):
+                parsed = parsed.replace(year=now.year - 1)
+            return parsed.timestamp()
+        except ValueError:
+            pass
+    
+    return default if default is not None else time.time()
+
+
+class AlertAggregator:
+    """
+    Collapse repeated alerts into incidents over a sliding time window
+
+    Alerts with the same IPs, usernames and action set are merged into one
+    open incident as long as each arrives within window_seconds of the
+    previous one. An incident is emitted, with its occurrence count, once
+    the window passes without a new matching alert. Windows are measured in
+    alert time; on a live stream, tick() also closes incidents that have had
+    no new alert for window_seconds of wall-clock time.
+    """
+    
+    def __init__(self, window_seconds=300, key_fields=("ips", "usernames", "actions"), max_open=10000):
+        """
+        Args:
+            window_seconds: Maximum gap between alerts merged into one incident
+            key_fields: Entity fields that must match for alerts to be merged
+            max_open: Open incidents kept before the least recently updated is emitted early
+        """
+        self.window_seconds = window_seconds
+        self.key_fields = key_fields
+        self.max_open = max_open
+        self._open = OrderedDict()  # ordered by last_seen, oldest first
+        self._arrived = {}  # key -> time.monotonic() of the incident's latest alert
+    
+    def _key(self, alert):
+        """Grouping key for an alert: its IPs, lowercased usernames and action set"""
+        entities = alert.get("entities", {})
+        parts = []
+        for field in self.key_fields:
+            values = entities.get(field, [])
+            if field == "usernames":
+                values = [value.lower() for value in values]
+            parts.append(tuple(sorted(set(values))))
+        return tuple(parts)
+    
+    def _incident(self, alert, timestamp):
+        """Start a new incident from its first alert"""
+        incident = dict(alert)
+        incident["occurrences"] = 1
+        incident["first_seen"] = timestamp
+        incident["last_seen"] = timestamp
+        incident["alert_ids"] = [alert.get("id")]
+        return incident
+    
+    def add(self, alert):
+        """
+        Add an alert and return the incidents that closed because of it
+        Alerts that failed parsing are passed straight through
+        """
+        if "error" in alert or "entities" not in alert:
+            return [alert]
+        
+        timestamp = alert_timestamp(alert)
+        closed = self.expire(timestamp)
+        
+        key = self._key(alert)
+        incident = self._open.get(key)
+        if incident is not None and timestamp - incident["last_seen"] <= self.window_seconds:
+            incident["occurrences"] += 1
+            incident["last_seen"] = max(incident["last_seen"], timestamp)
+            if len(incident["alert_ids"]) < 100:
+                incident["alert_ids"].append(alert.get("id"))
+            self._open.move_to_end(key)
+        else:
+            if incident is not None:
+                closed.append(self._close(key))
+            self._open[key] = self._incident(alert, timestamp)
+            if len(self._open) > self.max_open:
+                closed.append(self._close(next(iter(self._open))))
+        self._arrived[key] = time.monotonic()
+        
+        return closed
+    
+    def _close(self, key):
+        self._arrived.pop(key, None)
+        return self._open.pop(key)
+    
+    def expire(self, now):
+        """Close and return incidents whose window ended before now"""
+        closed = []
+        while self._open:
+            key, incident = next(iter(self._open.items()))
+            if now - incident["last_seen"] <= self.window_seconds:
+                break
+            closed.append(self._close(key))
+        return closed
+    
+    def tick(self):
+        """Close and return incidents with no new alert for window_seconds of wall-clock time"""
+        cutoff = time.monotonic() - self.window_seconds
+        return [self._close(key) for key in [key for key, arrived in self._arrived.items() if arrived < cutoff]]
+    
+    def flush(self):
+        """Close and return every open incident"""
+        closed = list(self._open.values())
+        self._open.clear()
+        self._arrived.clear()
+        return closed
+    
+    def aggregate(self, alerts):
+        """
+        Generator that turns a stream of alerts into a stream of incidents
+        IDLE items in the stream close incidents whose window has passed in wall-clock time
+        """
+        for alert in alerts:
+            if alert is IDLE:
+                yield from self.tick()
+            else:
+                yield from self.add(alert)
+        yield from self.flush()
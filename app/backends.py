@@ -0,0 +1,197 @@
+"""
+ThreatSage - Inference backends
+Each backend loads a model into a transformers-compatible text-generation pipeline
+
+    pipeline   transformers.pipeline with full-precision weights (default)
+    int8       the same model with its Linear layers dynamically quantized to int8
+    onnx       an ONNX Runtime export of the model through optimum (optional dependency)
+
+Select one with IncidentResponder(backend=...) or the THREATSAGE_BACKEND environment variable.
+"""
+import os
+import resource
+import sys
+import threading
+import time
+
+from utils.logger import configure_ml_logging
+
+DEFAULT_BACKEND = "pipeline"
+BACKEND_ENV = "THREATSAGE_BACKEND"
+
+
+def process_memory_bytes():
+    """Resident memory of this process (peak RSS where the current value is not available)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def model_memory_bytes(model):
+    """Bytes held by a torch model's parameters and buffers, counting packed int8 weights"""
+    try:
+        state = model.state_dict()
+    except AttributeError:
+        return None
+
+    def size(value):
+        if isinstance(value, (tuple, list)):
+            return sum(size(item) for item in value)
+        if hasattr(value, "element_size") and hasattr(value, "numel"):
+            return value.element_size() * value.numel()
+        return 0
+
+    return sum(size(value) for value in state.values())
+
+
+class InferenceBackend:
+    """
+    Base class: load() returns a text-generation pipeline and stats() reports usage
+
+    Generation time and token counts are reported back by IncidentResponder
+    through record(), so tokens per second reflect real workloads.
+    """
+
+    name = None
+    # Whether the loaded model supports generate() with a reused past_key_values cache
+    supports_prompt_cache = True
+
+    def __init__(self):
+        self.model_name = None
+        self.pipeline = None
+        self.load_seconds = None
+        self._tokens = 0
+        self._seconds = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, model_name):
+        """Build the pipeline for model_name; raises ImportError/ValueError/OSError on failure"""
+        configure_ml_logging()
+        start = time.perf_counter()
+        self.pipeline = self._build(model_name)
+        self.load_seconds = round(time.perf_counter() - start, 3)
+        self.model_name = model_name
+        return self.pipeline
+
+    def _build(self, model_name):
+        raise NotImplementedError
+
+    def record(self, tokens, seconds):
+        """Add generated tokens and the time they took"""
+        with self._lock:
+            self._tokens += tokens
+            self._seconds += seconds
+
+    def model_bytes(self):
+        return model_memory_bytes(getattr(self.pipeline, "model", None))
+
+    def stats(self):
+        """Backend name, model, memory footprint and generation throughput"""
+        with self._lock:
+            tokens, seconds = self._tokens, self._seconds
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "pid": os.getpid(),
+            "loaded": self.pipeline is not None,
+            "load_seconds": self.load_seconds,
+            "model_bytes": self.model_bytes() if self.pipeline is not None else None,
+            "process_rss_bytes": process_memory_bytes(),
+            "tokens_generated": tokens,
+            "generation_seconds": round(seconds, 3),
+            "tokens_per_second": round(tokens / seconds, 2) if seconds else None,
+        }
+
+
+class PipelineBackend(InferenceBackend):
+    """transformers.pipeline with the model's default full-precision weights"""
+
+    name = "pipeline"
+
+    def _build(self, model_name):
+        from transformers import pipeline
+        return pipeline("text-generation", model=model_name, trust_remote_code=True)
+
+
+class QuantizedBackend(InferenceBackend):
+    """
+    Dynamic int8 quantization of every torch.nn.Linear layer for CPU inference
+
+    Weights are stored as int8 and activations quantized on the fly, which
+    roughly quarters the memory of Linear-heavy models (Llama, Mistral) and
+    speeds up CPU matmuls. GPT-2 implements its projections as Conv1D, so
+    only its output head is quantized.
+    
+    The model is quantized in place, but it has to be loaded in fp32 first,
+    so loading still peaks at the full fp32 size (about 28 GB for a 7B model)
+    before dropping to the int8 footprint.
+    """
+
+    name = "int8"
+
+    def _build(self, model_name):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True, trust_remote_code=True
+        )
+        model.eval()
+        # In place: a copy would double the peak memory
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return pipeline("text-generation", model=model, tokenizer=tokenizer, device=-1)
+
+
+class ONNXBackend(InferenceBackend):
+    """ONNX Runtime export of the model via optimum, cached under export_dir"""
+
+    name = "onnx"
+    supports_prompt_cache = False
+
+    def __init__(self, export_dir="./cache/onnx"):
+        super().__init__()
+        self.export_dir = export_dir
+
+    def _build(self, model_name):
+        try:
+            from optimum.onnxruntime import ORTModelForCausalLM
+        except ImportError as e:
+            raise ImportError("the onnx backend needs 'optimum[onnxruntime]'") from e
+        from transformers import AutoTokenizer, pipeline
+
+        local_dir = os.path.join(self.export_dir, model_name.replace("/", "--"))
+        if os.path.isdir(local_dir):
+            model = ORTModelForCausalLM.from_pretrained(local_dir)
+        else:
+            # The first run exports the model to ONNX, later runs load the saved export
+            model = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+            model.save_pretrained(local_dir)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+    def model_bytes(self):
+        local_dir = os.path.join(self.export_dir, (self.model_name or "").replace("/", "--"))
+        if not os.path.isdir(local_dir):
+            return None
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(local_dir) for name in names if name.endswith((".onnx", ".onnx_data")))
+
+
+BACKENDS = {
+    PipelineBackend.name: PipelineBackend,
+    QuantizedBackend.name: QuantizedBackend,
+    ONNXBackend.name: ONNXBackend,
+}
+
+
+def get_backend(name=None):
+    """Instantiate a backend by name, defaulting to THREATSAGE_BACKEND and then the plain pipeline"""
+    name = name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,355 @@
+"""
+ThreatSage - Headless batch/streaming mode
+Reads alerts as JSONL or raw syslog lines and writes one JSON result per line
+"""
+import sys
+
+from app import setup_project_path
+setup_project_path()
+
+from utils.logger import configure_logging
+configure_logging()
+
+import argparse
+import itertools
+import json
+import queue
+import threading
+
+from app.enrichment import get_threat_intelligence
+from app.agent import IncidentResponder
+from app.extractor import EntityExtractor
+from app.aggregator import AlertAggregator, IDLE
+from app.workers import InferencePool
+from utils.metrics import stage_timer, write_textfile
+from app.main import is_valid_ip, suppress_warnings
+
+ALERT_TEXT_FIELDS = ("alert", "message", "msg", "text")
+# How long a live stream may be quiet before aggregated incidents are checked for expiry
+IDLE_SECONDS = 1.0
+TIMESTAMP_FIELDS = ("timestamp", "@timestamp", "time")
+
+
+def parse_alert_line(line, line_number):
+    """
+    Turn one input line into an alert record
+
+    JSONL lines may carry the alert text in any of ALERT_TEXT_FIELDS, or a bare
+    "ip" field, and an event time in any of TIMESTAMP_FIELDS. Anything that is
+    not a JSON object is treated as a raw syslog line.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    record = None
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+
+    if not isinstance(record, dict):
+        return {"id": line_number, "alert": line, "is_ip": is_valid_ip(line)}
+
+    alert_id = record.get("id", line_number)
+    text = next((record[field] for field in ALERT_TEXT_FIELDS if record.get(field)), None)
+    if text is None and record.get("ip"):
+        alert = {"id": alert_id, "alert": record["ip"], "is_ip": True}
+    elif text is None:
+        return {"id": alert_id, "alert": None, "is_ip": False,
+                "error": "No alert text found in record"}
+    else:
+        alert = {"id": alert_id, "alert": str(text), "is_ip": is_valid_ip(str(text))}
+
+    timestamp = next((record[field] for field in TIMESTAMP_FIELDS if record.get(field) is not None), None)
+    if timestamp is not None:
+        alert["timestamp"] = timestamp
+    return alert
+
+
+def read_alerts(stream, idle_timeout=None):
+    """
+    Yield alert records from a line-oriented stream
+    With idle_timeout set, IDLE is yielded whenever no line arrived for that many seconds
+    """
+    if idle_timeout is None:
+        lines = stream
+    else:
+        lines = _lines_with_idle(stream, idle_timeout)
+    line_number = 0
+    for line in lines:
+        if line is IDLE:
+            yield IDLE
+            continue
+        line_number += 1
+        alert = parse_alert_line(line, line_number)
+        if alert is not None:
+            yield alert
+
+
+def _lines_with_idle(stream, idle_timeout):
+    """Read lines on a background thread, yielding IDLE while the stream is quiet"""
+    lines = queue.Queue(maxsize=1000)
+    end = object()
+
+    def read():
+        try:
+            for line in stream:
+                lines.put(line)
+        finally:
+            lines.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        try:
+            line = lines.get(timeout=idle_timeout)
+        except queue.Empty:
+            yield IDLE
+            continue
+        if line is end:
+            return
+        yield line
+
+
+def extract_stage(alerts, extractor):
+    """Attach extracted entities to each alert"""
+    for alert in alerts:
+        if alert is not IDLE and "error" not in alert:
+            if alert["is_ip"]:
+                alert["entities"] = {"ips": [alert["alert"]], "usernames": [], "actions": [], "times": []}
+            else:
+                with stage_timer("extract"):
+                    alert["entities"] = extractor.extract_all(alert["alert"])
+        yield alert
+
+
+def enrich_stage(alerts, threat_intel, batch_size=100):
+    """
+    Attach IP intelligence for every extracted IP
+
+    Alerts are gathered into groups of batch_size so the cache misses of the
+    whole group can be resolved together through the bulk lookup.
+    """
+    while True:
+        group = list(itertools.islice(alerts, batch_size))
+        if not group:
+            return
+
+        ips = [ip for alert in group if "error" not in alert for ip in alert["entities"]["ips"]]
+        with stage_timer("enrich"):
+            ip_data = threat_intel.enrich_many(ips)
+
+        for alert in group:
+            if "error" not in alert:
+                alert["ip_data"] = {ip: ip_data[ip] for ip in alert["entities"]["ips"]}
+            yield alert
+
+
+def describe_alert(alert):
+    """Alert text passed to the model, noting how often an aggregated incident occurred"""
+    occurrences = alert.get("occurrences", 1)
+    if occurrences > 1:
+        return f"{alert['alert']} (repeated {occurrences} times)"
+    return alert["alert"]
+
+
+def analyze_stage(alerts, responder, batch_size=8):
+    """
+    Score the primary IP and generate a recommendation, like process_alert_or_ip
+
+    Alerts are analyzed in groups of batch_size so generation can run batched.
+    """
+    while True:
+        group = list(itertools.islice(alerts, batch_size))
+        if not group:
+            return
+
+        pending = []
+        for alert in group:
+            if "error" in alert:
+                continue
+            ips = alert["entities"]["ips"]
+            if ips and alert["ip_data"].get(ips[0]):
+                pending.append(alert)
+            else:
+                alert["error"] = "No IP addresses found in the input"
+
+        analyses = responder.reason_many(
+            [alert["ip_data"][alert["entities"]["ips"][0]] for alert in pending],
+            [describe_alert(alert) for alert in pending],
+            batch_size=batch_size
+        )
+        for alert, analysis in zip(pending, analyses):
+            alert["analysis"] = analysis
+
+        yield from group
+
+
+def run_pipeline(stream, extractor=None, threat_intel=None, responder=None, batch_size=100,
+                 llm_batch_size=8, aggregate_window=None):
+    """
+    Push alerts from a stream through extraction, enrichment, scoring and recommendation
+
+    Every stage is a generator, so results can be written as soon as they are
+    ready. Enrichment works on groups of batch_size alerts and generation on
+    groups of llm_batch_size; use 1 for both when following a live stream.
+    With aggregate_window set, repeated alerts within that many seconds are
+    collapsed into one incident before enrichment. On a live (non-seekable)
+    stream, incidents are also closed once no matching alert arrived for
+    aggregate_window seconds, without waiting for the next alert.
+    """
+    extractor = extractor or EntityExtractor()
+    threat_intel = threat_intel or get_threat_intelligence()
+    responder = responder or IncidentResponder()
+
+    # Files end at EOF, which flushes everything; pipes may go quiet with incidents still open
+    follow = bool(aggregate_window) and hasattr(stream, "seekable") and not stream.seekable()
+    alerts = read_alerts(stream, idle_timeout=IDLE_SECONDS if follow else None)
+    alerts = extract_stage(alerts, extractor)
+    if aggregate_window:
+        alerts = AlertAggregator(window_seconds=aggregate_window).aggregate(alerts)
+    alerts = enrich_stage(alerts, threat_intel, batch_size=batch_size)
+    return analyze_stage(alerts, responder, batch_size=llm_batch_size)
+
+
+def write_results(results, output, metrics_file=None, metrics_every=100):
+    """
+    Write each result as a single JSON line
+    With metrics_file set, metrics are exported there every metrics_every results and at the end
+    """
+    count = 0
+    for result in results:
+        result.pop("is_ip", None)
+        output.write(json.dumps(result, default=str) + "\n")
+        output.flush()
+        count += 1
+        if metrics_file and count % metrics_every == 0:
+            write_textfile(metrics_file)
+    if metrics_file:
+        write_textfile(metrics_file)
+    return count
+
+
+def scan_log(path, threat_intel=None, enrich=False, batch_size=1000):
+    """
+    Yield one record per distinct IP found in a log file, optionally enriched
+
+    IPs are enriched in groups of batch_size through the bulk lookup.
+    """
+    indicators = EntityExtractor().scan_log_file(path)
+    if enrich:
+        threat_intel = threat_intel or get_threat_intelligence()
+
+    ips = iter(indicators)
+    while True:
+        group = list(itertools.islice(ips, batch_size))
+        if not group:
+            return
+        ip_data = threat_intel.enrich_many(group) if enrich else {}
+        for ip in group:
+            record = {"ip": ip, **indicators[ip]}
+            if enrich:
+                record["ip_data"] = ip_data[ip]
+            yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze alerts from JSONL or syslog input without prompts")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="Input file with one alert per line (default: stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output file for JSONL results (default: stdout)")
+    parser.add_argument("--model", default="gpt2",
+                        help="HuggingFace model used for recommendations")
+    parser.add_argument("--geoip-db", default=None,
+                        help="Offline GeoIP database built with 'python -m app.geoip build'")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never query ip-api; resolve IPs only from --geoip-db")
+    parser.add_argument("--backend", choices=["pipeline", "int8", "onnx"], default=None,
+                        help="Inference backend (default: $THREATSAGE_BACKEND or pipeline)")
+    parser.add_argument("--llm-threshold", type=int, default=None,
+                        help="Only alerts scoring at least this much go to the model; "
+                             "the rest get a template recommendation")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Alerts grouped per bulk IP lookup (use 1 for live streams)")
+    parser.add_argument("--llm-batch-size", type=int, default=8,
+                        help="Prompts generated per model batch (use 1 for live streams)")
+    parser.add_argument("--reputation-lists", default=None, metavar="CONFIG",
+                        help="JSON config of CIDR blocklists used for IP reputation")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Generation processes, each loading its own copy of the model")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Torch threads per generation process (default: cores / workers)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Write Prometheus text-format metrics to this file while running")
+    parser.add_argument("--api-url", default="http://ip-api.com",
+                        help="Base URL of the ip-api compatible enrichment service")
+    parser.add_argument("--aggregate-window", type=float, default=None, metavar="SECONDS",
+                        help="Collapse alerts with the same IPs, usernames and actions "
+                             "arriving within this many seconds into one incident")
+    parser.add_argument("--scan-log", metavar="LOGFILE",
+                        help="Count every IP in a log file instead of analyzing alerts")
+    parser.add_argument("--enrich", action="store_true",
+                        help="With --scan-log, enrich each distinct IP in bulk")
+    args = parser.parse_args(argv)
+
+    if args.scan_log:
+        output_stream = sys.stdout if args.output == "-" else open(args.output, "w")
+        try:
+            threat_intel = get_threat_intelligence(
+                api_url=args.api_url, geoip_db=args.geoip_db, offline=args.offline,
+                reputation_lists=args.reputation_lists
+            ) if args.enrich else None
+            count = write_results(scan_log(args.scan_log, threat_intel, enrich=args.enrich), output_stream,
+                                  metrics_file=args.metrics_file)
+        finally:
+            if output_stream is not sys.stdout:
+                output_stream.close()
+        print(f"[*] Found {count} distinct IPs in {args.scan_log}", file=sys.stderr)
+        return 0
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, "r")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    responder = IncidentResponder(model_name=args.model, llm_threshold=args.llm_threshold,
+                                  backend=args.backend)
+    llm_batch_size = max(1, args.llm_batch_size)
+    pool = None
+    if args.workers > 1:
+        # Hand each analysis group enough prompts to keep every worker busy
+        pool = responder = InferencePool(responder, processes=args.workers,
+                                         threads_per_process=args.threads_per_worker)
+        llm_batch_size *= args.workers
+
+    try:
+        results = run_pipeline(
+            input_stream,
+            threat_intel=get_threat_intelligence(
+                api_url=args.api_url, geoip_db=args.geoip_db, offline=args.offline,
+                reputation_lists=args.reputation_lists
+            ),
+            responder=responder,
+            batch_size=max(1, args.batch_size),
+            llm_batch_size=llm_batch_size,
+            aggregate_window=args.aggregate_window,
+        )
+        count = write_results(results, output_stream, metrics_file=args.metrics_file)
+    finally:
+        if pool is not None:
+            pool.close()
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    print(f"[*] Processed {count} alerts", file=sys.stderr)
+    stats = responder.backend_stats()
+    if stats["tokens_generated"]:
+        print(f"[*] Inference: {json.dumps(stats)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    suppress_warnings()
+    sys.exit(main())
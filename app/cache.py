@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class SQLiteCache:
+    """
+    Bounded on-disk key/value cache backed by SQLite
+
+    Every entry carries its own expiry time and a last-access time. Reads and
+    writes touch a single row, so their cost does not depend on how many
+    entries are stored, and nothing is loaded at startup. Expired entries are
+    dropped when read and swept periodically; a write that takes the store
+    past max_entries evicts the least recently used entries.
+    """
+    
+    def __init__(self, path, ttl=3600, max_entries=100000, sweep_interval=500):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            ttl: Default lifetime of an entry in seconds
+            max_entries: Maximum number of entries kept before LRU eviction
+            sweep_interval: Number of writes between expiry/eviction sweeps
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sweep_interval = max(1, sweep_interval)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._count = None
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expiry ON entries(expires_at)")
+    
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                if self._count is not None:
+                    self._count -= 1
+                return None
+            
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+    
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds (defaults to the cache TTL)"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value)
+        
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO entries (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now)
+            )
+            inserted = cursor.rowcount == 1
+            if not inserted:
+                self._conn.execute(
+                    "UPDATE entries SET value = ?, expires_at = ?, last_access = ? WHERE key = ?",
+                    (payload, expires_at, now, key)
+                )
+            if self._count is None:
+                # Counted on the first write rather than at open, so startup doesn't depend on the cache size
+                self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            elif inserted:
+                self._count += 1
+            
+            self._writes += 1
+            if self._count > self.max_entries or self._writes % self.sweep_interval == 0:
+                self._sweep(now)
+    
+    def delete(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if cursor.rowcount and self._count is not None:
+                self._count -= cursor.rowcount
+    
+    def _sweep(self, now):
+        """Drop expired entries, then evict least recently used ones over the cap (lock held)"""
+        expired = self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+        if self._count is None:
+            self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        else:
+            self._count -= expired
+        
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            self._count -= overflow
+    
+    def purge(self):
+        """Run an expiry and eviction sweep immediately"""
+        with self._lock:
+            self._sweep(time.time())
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
@@ -4,38 +4,118 @@ import hashlib
 import json
 import os
 import ipaddress
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.cache import SQLiteCache
+from app.geoip import GeoIPDatabase
+from app.ratelimit import RateLimiter, RateLimitExceeded
+from app.reputation import ReputationEngine
+from utils.metrics import API_REQUESTS, API_SECONDS, CACHE_REQUESTS
 
 class ThreatIntelligence:
     """Enhanced threat intelligence gathering from multiple sources"""
     
-    def __init__(self, cache_dir="./cache"):
+    BATCH_LIMIT = 100  # ip-api accepts at most 100 queries per /batch request
+    
+    def __init__(self, cache_dir="./cache", max_workers=8, api_url="http://ip-api.com",
+                 cache_ttl=3600, cache_max_entries=100000, negative_cache_ttl=60,
+                 requests_per_minute=45, batch_requests_per_minute=15,
+                 max_wait=30.0, max_retries=2, geoip_db=None, offline=False,
+                 reputation_lists=None):
         self.cache_dir = cache_dir 
-        os.makedirs(cache_dir, exist_ok=True)
+        self.api_url = api_url.rstrip("/")
+        
+        self.cache_ttl = cache_ttl  # seconds, 1 hour by default
+        self.cache_max_entries = cache_max_entries
+        self.negative_cache_ttl = negative_cache_ttl  # failed lookups are retried after this
         
-        self._load_cache()
-        self.cache_ttl = 3600  # 1 hour cache lifetime
+        # Optional local range database; offline mode never falls back to ip-api
+        self.geoip_db = geoip_db
+        self.offline = offline
+        self._geoip = None
+        # Optional blocklist config; without it reputation falls back to the simulated check
+        self.reputation_lists = reputation_lists
+        self._reputation = None
+        self._store = None
+        self._store_lock = threading.Lock()
+        
+        # One keep-alive session shared by all lookups, sized for the worker pool
+        self.max_workers = max(1, max_workers)
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({
+            "User-Agent": "ThreatSage/1.0 (https://github.com/Hanish0/ThreatSage)",
+            "Accept": "application/json",
+        })
+        
+        # ip-api meters the single and batch endpoints separately (free tier: 45 and 15 per minute)
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self._single_limiter = RateLimiter(capacity=requests_per_minute)
+        self._batch_limiter = RateLimiter(capacity=batch_requests_per_minute)
     
-    def _load_cache(self):
-        """Load cache from disk"""
-        cache_file = os.path.join(self.cache_dir, "ip_cache.json")
-        try:
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    self._cache = json.load(f)
-            else:
-                self._cache = {}
-        except Exception as e:
-            print(f"Warning: Could not load cache: {e}")
-            self._cache = {}
+    @property
+    def _cache(self):
+        """Open the cache store on first use rather than at construction"""
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    store = SQLiteCache(
+                        os.path.join(self.cache_dir, "ip_cache.sqlite3"),
+                        ttl=self.cache_ttl,
+                        max_entries=self.cache_max_entries
+                    )
+                    self._import_legacy_cache(store)
+                    self._store = store
+        return self._store
+    
+    @property
+    def geoip(self):
+        """The offline GeoIP database, loaded on first use (None if not configured)"""
+        if self._geoip is None and self.geoip_db:
+            with self._store_lock:
+                if self._geoip is None:
+                    self._geoip = GeoIPDatabase.load(self.geoip_db)
+        return self._geoip
     
-    def _save_cache(self):
-        """Save cache to disk"""
-        cache_file = os.path.join(self.cache_dir, "ip_cache.json")
+    @property
+    def reputation(self):
+        """The blocklist reputation engine, loaded on first use (None if not configured)"""
+        if self._reputation is None and self.reputation_lists:
+            with self._store_lock:
+                if self._reputation is None:
+                    self._reputation = ReputationEngine(self.reputation_lists)
+        return self._reputation
+    
+    def _import_legacy_cache(self, store):
+        """Move entries from the old whole-file JSON cache into the SQLite store once"""
+        legacy_file = os.path.join(self.cache_dir, "ip_cache.json")
+        if not os.path.exists(legacy_file):
+            return
         try:
-            with open(cache_file, 'w') as f:
-                json.dump(self._cache, f, indent=2)
+            with open(legacy_file, 'r') as f:
+                legacy = json.load(f)
+            now = time.time()
+            for key, (timestamp, data) in legacy.items():
+                remaining = self.cache_ttl - (now - timestamp)
+                if remaining > 0:
+                    store.set(key, data, ttl=remaining)
+            os.replace(legacy_file, legacy_file + ".migrated")
         except Exception as e:
-            print(f"Warning: Could not save cache: {e}")
+            print(f"Warning: Could not import legacy cache: {e}")
+    
+    def close(self):
+        """Release the HTTP session and the cache database"""
+        self._session.close()
+        with self._store_lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
     
     def _cache_key(self, item_type, item_value):
         """Generate a cache key for any type of indicator"""
@@ -43,28 +123,16 @@ class ThreatIntelligence:
     
     def _check_cache(self, item_type, item_value):
         """Check if we have cached data for this indicator"""
-        key = self._cache_key(item_type, item_value)
-        if key in self._cache:
-            timestamp, data = self._cache[key]
-            if time.time() - timestamp < self.cache_ttl:
-                return data
-        return None
+        cached = self._cache.get(self._cache_key(item_type, item_value))
+        CACHE_REQUESTS.inc(cache=item_type, result="hit" if cached else "miss")
+        return cached
     
-    def _update_cache(self, item_type, item_value, data):
+    def _update_cache(self, item_type, item_value, data, ttl=None):
         """Update cache with fresh data"""
-        key = self._cache_key(item_type, item_value)
-        self._cache[key] = (time.time(), data)
-        if len(self._cache) % 10 == 0:
-            self._save_cache()
+        self._cache.set(self._cache_key(item_type, item_value), data, ttl=ttl)
     
-    def enrich_ip(self, ip_address):
-        """
-        Enrich an IP address with threat intelligence
-        Returns a dictionary with IP intelligence
-        """
-        if not ip_address:
-            return {"Error": "No IP address provided"}
-            
+    def _private_ip_result(self, ip_address):
+        """Return the canned result for private addresses, or None for public ones"""
         try:
             ip_obj = ipaddress.ip_address(ip_address)
             if ip_obj.is_private:
@@ -78,73 +146,219 @@ class ThreatIntelligence:
                 }
         except ValueError:
             pass
-            
-        cached = self._check_cache("ip", ip_address)
-        if cached:
-            return cached
-        
-        basic_data = self._query_ip_api(ip_address)
-        
+        return None
+    
+    def _finish_enrichment(self, ip_address, basic_data, cache=True):
+        """Add reputation data to an ip-api result and cache it"""
         if "Error" in basic_data:
+            # Remember failures briefly so repeated alerts don't hammer the API
+            if cache:
+                self._update_cache("ip", ip_address, basic_data, ttl=self.negative_cache_ttl)
             return basic_data
         
         reputation = self._check_abuseipdb(ip_address)
         
         combined_data = {**basic_data, **reputation}
         
-        self._update_cache("ip", ip_address, combined_data)
+        if cache:
+            self._update_cache("ip", ip_address, combined_data)
         
         return combined_data
     
+    def _local_lookup(self, ip_address):
+        """
+        Resolve an IP without the network: private ranges, then the GeoIP database
+        GeoIP hits are not cached since the lookup is cheaper than a cache write
+        """
+        private = self._private_ip_result(ip_address)
+        if private:
+            return private
+        
+        if self.geoip is not None:
+            basic_data = self.geoip.lookup(ip_address)
+            if basic_data:
+                return self._finish_enrichment(ip_address, basic_data, cache=False)
+        
+        if self.offline:
+            return {"Error": "No offline GeoIP record for this address", "IP": ip_address}
+        return None
+    
+    def enrich_ip(self, ip_address):
+        """
+        Enrich an IP address with threat intelligence
+        Returns a dictionary with IP intelligence
+        """
+        if not ip_address:
+            return {"Error": "No IP address provided"}
+            
+        local = self._local_lookup(ip_address)
+        if local:
+            return local
+            
+        cached = self._check_cache("ip", ip_address)
+        if cached:
+            return self._current_reputation(ip_address, cached)
+        
+        return self._finish_enrichment(ip_address, self._query_ip_api(ip_address))
+    
+    def enrich_many(self, ip_addresses, max_workers=None):
+        """
+        Enrich several IP addresses with as few API requests as possible
+        
+        Private, GeoIP-database and cached addresses are answered locally. The remaining cache
+        misses are resolved through ip-api's /batch endpoint in chunks of
+        BATCH_LIMIT, with chunks sent concurrently over the shared session.
+        Returns a dictionary mapping each IP to its intelligence, in input order
+        """
+        unique_ips = list(dict.fromkeys(ip for ip in ip_addresses if ip))
+        results = {}
+        misses = []
+        
+        for ip in unique_ips:
+            local = self._local_lookup(ip)
+            cached = None if local else self._check_cache("ip", ip)
+            if local or cached:
+                results[ip] = local or self._current_reputation(ip, cached)
+            else:
+                misses.append(ip)
+        
+        chunks = [misses[i:i + self.BATCH_LIMIT] for i in range(0, len(misses), self.BATCH_LIMIT)]
+        workers = min(max_workers or self.max_workers, len(chunks))
+        
+        if workers <= 1:
+            batches = [self._query_ip_api_batch(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batches = list(executor.map(self._query_ip_api_batch, chunks))
+        
+        for batch in batches:
+            for ip, basic_data in batch.items():
+                results[ip] = self._finish_enrichment(ip, basic_data)
+        
+        return {ip: results[ip] for ip in unique_ips}
+    
+    def _format_ip_api_result(self, data, ip_address):
+        """Map one ip-api response object onto the enrichment dictionary shape"""
+        if data.get("status") == "success":
+            return {
+                "IP": data.get("query", ip_address),
+                "Country": data.get("country", "N/A"),
+                "Region": data.get("regionName", "N/A"),
+                "City": data.get("city", "N/A"),
+                "ISP": data.get("isp", "N/A"),
+                "Organization": data.get("org", "N/A"),
+                "ASN": data.get("as", "N/A"),
+                "Is Proxy": data.get("proxy", False),
+                "Is Hosting": data.get("hosting", False),
+                "Is Mobile": data.get("mobile", False),
+                "Timezone": data.get("timezone", "N/A"),
+                "Coordinates": f"{data.get('lat', 'N/A')},{data.get('lon', 'N/A')}",
+            }
+        return {"Error": f"IP lookup failed: {data.get('message','Unknown error')}"}
+    
+    def _send(self, method, url, limiter, **kwargs):
+        """
+        Send a request through a rate limiter
+        
+        Throttled (429), server-side (5xx) and connection failures back off
+        exponentially and are retried up to max_retries times.
+        """
+        endpoint = "batch" if limiter is self._batch_limiter else "single"
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(self.max_wait)
+            last_attempt = attempt == self.max_retries
+            
+            try:
+                with API_SECONDS.time(endpoint=endpoint):
+                    response = self._session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                API_REQUESTS.inc(endpoint=endpoint, status="error")
+                limiter.record_failure()
+                if last_attempt:
+                    raise
+                continue
+            
+            API_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            limiter.update_from_headers(response.headers)
+            if response.status_code == 429 or response.status_code >= 500:
+                try:
+                    retry_after = float(response.headers.get("X-Ttl") or response.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    retry_after = None
+                limiter.record_failure(retry_after)
+                if last_attempt:
+                    return response
+                continue
+            
+            limiter.record_success()
+            return response
+    
+    def _request_error(self, error, ip_address):
+        """Build the error dictionary for a failed HTTP request"""
+        if isinstance(error, RateLimitExceeded):
+            message = f"Lookup deferred: {str(error)}"
+        elif isinstance(error, requests.exceptions.ConnectTimeout):
+            message = "Connection timed out while fetching IP data"
+        elif isinstance(error, requests.exceptions.RequestException):
+            message = f"Request failed: {str(error)}"
+        else:
+            message = f"Unexpected error: {str(error)}"
+        return {"Error": message, "IP": ip_address, "Fallback": True}
+    
     def _query_ip_api(self, ip_address):
         """Query ip-api.com for basic IP intelligence with better error handling"""
         try:
-            url = f"http://ip-api.com/json/{ip_address}"
+            url = f"{self.api_url}/json/{ip_address}"
             
-            headers = {
-                "User-Agent": "ThreatSage/1.0 (https://github.com/Hanish0/ThreatSage)",
-                "Accept": "application/json",
-            }
-            
-            response = requests.get(url, headers=headers, timeout=5)
+            response = self._send("GET", url, self._single_limiter, timeout=5)
             
             if response.status_code != 200:
                 return {"Error": f"IP lookup failed with status code: {response.status_code}"}
                 
-            data = response.json()
+            return self._format_ip_api_result(response.json(), ip_address)
+        except Exception as e:
+            return self._request_error(e, ip_address)
+    
+    def _query_ip_api_batch(self, ip_addresses):
+        """
+        Query ip-api.com's /batch endpoint for up to BATCH_LIMIT addresses
+        Returns a dictionary mapping each IP to the same shape as _query_ip_api
+        """
+        try:
+            url = f"{self.api_url}/batch"
             
-            if data["status"] == "success":
-                return {
-                    "IP": data.get("query", ip_address),
-                    "Country": data.get("country", "N/A"),
-                    "Region": data.get("regionName", "N/A"),
-                    "City": data.get("city", "N/A"),
-                    "ISP": data.get("isp", "N/A"),
-                    "Organization": data.get("org", "N/A"),
-                    "ASN": data.get("as", "N/A"),
-                    "Is Proxy": data.get("proxy", False),
-                    "Is Hosting": data.get("hosting", False),
-                    "Is Mobile": data.get("mobile", False),
-                    "Timezone": data.get("timezone", "N/A"),
-                    "Coordinates": f"{data.get('lat', 'N/A')},{data.get('lon', 'N/A')}",
-                }
-            else:
-                return {"Error": f"IP lookup failed: {data.get('message','Unknown error')}"}
-        except requests.exceptions.ConnectTimeout:
-            return {"Error": "Connection timed out while fetching IP data", 
-                    "IP": ip_address, 
-                    "Fallback": True}
-        except requests.exceptions.RequestException as e:
-            return {"Error": f"Request failed: {str(e)}", 
-                    "IP": ip_address, 
-                    "Fallback": True}
+            response = self._send("POST", url, self._batch_limiter, json=list(ip_addresses), timeout=10)
+            
+            if response.status_code != 200:
+                error = {"Error": f"IP lookup failed with status code: {response.status_code}"}
+                return {ip: dict(error) for ip in ip_addresses}
+            
+            # Results come back in request order; fall back to the echoed query field
+            results = {}
+            for ip, data in zip(ip_addresses, response.json()):
+                results[ip] = self._format_ip_api_result(data, data.get("query", ip))
+            for ip in ip_addresses:
+                results.setdefault(ip, {"Error": "IP lookup failed: missing from batch response"})
+            return results
         except Exception as e:
-            return {"Error": f"Unexpected error: {str(e)}", 
-                    "IP": ip_address, 
-                    "Fallback": True}
+            return {ip: self._request_error(e, ip) for ip in ip_addresses}
+    
+    def _current_reputation(self, ip_address, data):
+        """
+        Re-check reputation for a cached result
+        Blocklists may have been reloaded since it was cached, and the lookup is cheap
+        """
+        if self.reputation is None or "Reputation" not in data or "Error" in data:
+            return data
+        data = {key: value for key, value in data.items() if key != "Reported Activities"}
+        data.update(self.reputation.check(ip_address))
+        return data
     
     def _check_abuseipdb(self, ip_address):
-        """Simulated AbuseIPDB reputation check"""
+        """Reputation from the configured blocklists, or the simulated AbuseIPDB check"""
+        if self.reputation is not None:
+            return self.reputation.check(ip_address)
+        
         suspicious = False
         high_confidence = False
         
@@ -190,4 +404,23 @@ class ThreatIntelligence:
             "Domain": domain,
             "Status": "Not implemented yet",
             "Note": "Domain enrichment will be available in a future release"
-        }
\ No newline at end of file
+        }
+
+
+_shared_instance = None
+_shared_lock = threading.Lock()
+
+def get_threat_intelligence(**kwargs):
+    """
+    Return the process-wide ThreatIntelligence instance, creating it on first use
+    
+    Keyword arguments are passed to the constructor and only take effect on the
+    call that creates the instance. The instance is closed at interpreter exit.
+    """
+    global _shared_instance
+    if _shared_instance is None:
+        with _shared_lock:
+            if _shared_instance is None:
+                _shared_instance = ThreatIntelligence(**kwargs)
+                atexit.register(_shared_instance.close)
+    return _shared_instance
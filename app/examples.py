@@ -11,7 +11,7 @@ setup_project_path()
 from utils.logger import configure_logging
 configure_logging()
 
-from app.enrichment import ThreatIntelligence
+from app.enrichment import get_threat_intelligence
 from app.agent import IncidentResponder
 from app.extractor import EntityExtractor
 from app.main import print_banner, print_info, print_warning, print_success, print_error, suppress_warnings
@@ -23,7 +23,7 @@ def demo_ip_enrichment():
     test_ip = "185.107.56.21"
     print(f"  - Enriching {test_ip}...")
     
-    threat_intel = ThreatIntelligence()
+    threat_intel = get_threat_intelligence()
     enriched_data = threat_intel.enrich_ip(test_ip)
     
     if "Error" in enriched_data:
@@ -74,7 +74,7 @@ def demo_full_analysis():
     print(f"    IPs: {', '.join(entities['ips'])}")
     print(f"    Actions: {', '.join(entities['actions'])}")
     
-    threat_intel = ThreatIntelligence()
+    threat_intel = get_threat_intelligence()
     ip_data = {}
     
     if entities['ips']:
@@ -108,7 +108,7 @@ def demo_visualization():
     
     test_ips = ["185.107.56.21", "45.13.22.98", "67.43.156.89"]
     
-    threat_intel = ThreatIntelligence()
+    threat_intel = get_threat_intelligence()
     ip_data = {}
     
     print_info("  - Enriching multiple IPs for visualization...")
@@ -127,7 +127,7 @@ def demo_visualization():
         responder.reason(ip_data[ip], raw_alert=f"Demo analysis for IP: {ip}")
     
     print_info("  - Generating threat history chart")
-    history = responder.memory.get("incidents", [])
+    history = list(responder.memory.incidents)
     chart_file = generate_threat_chart(history)
     print_success(f"    ✓ Threat history chart generated: {chart_file}")
     
@@ -1,13 +1,35 @@
 import re
+import os
+import mmap
 import ipaddress
+from functools import lru_cache
+
+@lru_cache(maxsize=65536)
+def _is_valid_ipv4(candidate):
+    """
+    Validate a dotted-quad candidate without building an ip_address object
+    
+    Matches ipaddress.ip_address for strings of four 1-3 digit groups: every
+    octet must be <= 255 and must not have a leading zero.
+    """
+    for octet in candidate.split('.'):
+        if int(octet) > 255 or (len(octet) > 1 and octet[0] == '0'):
+            return False
+    return True
+
+_LOG_IP_RE = re.compile(rb'\b(?:\d{1,3}\.){3}\d{1,3}\b')
 
 class EntityExtractor:
     """
     Extract entities like IPs, usernames, and actions from free-text security alerts
     """
     
+    # Every username match starts with one of these (lowercase) words
+    USERNAME_TRIGGERS = ('user', 'account', 'login')
+    
     def __init__(self):
-        self.ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+        # [0-9] rather than \d, which also matches other scripts' digits (and int() accepts them)
+        self.ip_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
         self.username_pattern = r'(?:user|account|username|login)[\s:]+([a-zA-Z0-9_\-\.]+)'
         self.time_pattern = r'\b(?:\d{1,2}[:]\d{2}(?::\d{2})?(?:\s*[AP]M)?)\b'
         self.action_keywords = [
@@ -15,6 +37,11 @@ class EntityExtractor:
             'failed', 'success', 'connect', 'connection', 'SSH', 'RDP',
             'brute-force', 'attack', 'scan', 'probe'
         ]
+        
+        self._ip_re = re.compile(self.ip_pattern)
+        self._username_re = re.compile(self.username_pattern, re.IGNORECASE)
+        self._time_re = re.compile(self.time_pattern)
+        self._keywords_lower = [(keyword, keyword.lower()) for keyword in self.action_keywords]
     
     def _is_valid_ip(self, ip_str):
         """Validate if string is a valid IP address"""
@@ -26,36 +53,93 @@ class EntityExtractor:
     
     def extract_ips(self, text):
         """Extract IP addresses from text"""
-        ip_matches = re.findall(self.ip_pattern, text)
-        return [ip for ip in ip_matches if self._is_valid_ip(ip)]
+        if '.' not in text:
+            return []
+        ip_matches = self._ip_re.findall(text)
+        return [ip for ip in ip_matches if _is_valid_ipv4(ip)]
     
-    def extract_usernames(self, text):
+    def extract_usernames(self, text, text_lower=None):
         """Extract usernames from text"""
-        username_matches = re.findall(self.username_pattern, text, re.IGNORECASE)
+        text_lower = text.lower() if text_lower is None else text_lower
+        # Only safe for ASCII: IGNORECASE also matches non-ASCII variants such as 'ſ' for 's'
+        if text.isascii() and not any(trigger in text_lower for trigger in self.USERNAME_TRIGGERS):
+            return []
+        username_matches = self._username_re.findall(text)
         return username_matches
     
     def extract_times(self, text):
         """Extract time references from text"""
-        time_matches = re.findall(self.time_pattern, text)
+        if ':' not in text:
+            return []
+        time_matches = self._time_re.findall(text)
         return time_matches
     
-    def extract_actions(self, text):
+    def extract_actions(self, text, text_lower=None):
         """Extract security-related actions from text"""
-        found_actions = []
-        text_lower = text.lower()
-        
-        for keyword in self.action_keywords:
-            if keyword.lower() in text_lower:
-                found_actions.append(keyword)
-                
-        return found_actions
+        text_lower = text.lower() if text_lower is None else text_lower
+        return [keyword for keyword, lowered in self._keywords_lower if lowered in text_lower]
     
     def extract_all(self, text):
         """Extract all entities from alert text"""
+        text_lower = text.lower()
         return {
             "ips": self.extract_ips(text),
-            "usernames": self.extract_usernames(text),
+            "usernames": self.extract_usernames(text, text_lower),
             "times": self.extract_times(text),
-            "actions": self.extract_actions(text),
+            "actions": self.extract_actions(text, text_lower),
             "original_text": text
-        }
\ No newline at end of file
+        }
+    
+    def extract_many(self, texts):
+        """Extract entities from an iterable of alert texts, yielding one result per text"""
+        extract_all = self.extract_all
+        for text in texts:
+            yield extract_all(text)
+    
+    def scan_log_file(self, path, chunk_size=64 * 1024 * 1024):
+        """
+        Count every IP address in a log file without reading it line by line
+        
+        The file is memory-mapped and scanned in chunks that end on a line
+        boundary, so matches never straddle two chunks and memory use depends on
+        the number of distinct IPs rather than the file size.
+        
+        Args:
+            path: Log file to scan
+            chunk_size: Approximate number of bytes scanned per regex pass
+        
+        Returns:
+            Dictionary mapping each IP to its hit count and the byte offsets of
+            its first and last occurrence, in order of first appearance
+        """
+        indicators = {}
+        if os.path.getsize(path) == 0:
+            return indicators
+        
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = min(start + chunk_size, size)
+                if end < size:
+                    newline = mm.rfind(b"\n", start, end)
+                    if newline != -1:
+                        end = newline + 1
+                
+                for match in _LOG_IP_RE.finditer(mm, start, end):
+                    candidate = match.group().decode("ascii")
+                    entry = indicators.get(candidate)
+                    if entry is None:
+                        if not _is_valid_ipv4(candidate):
+                            continue
+                        indicators[candidate] = {"count": 1, "first_offset": match.start(),
+                                                 "last_offset": match.start()}
+                    else:
+                        entry["count"] += 1
+                        entry["last_offset"] = match.start()
+                start = end
+        
+        return indicators
@@ -0,0 +1,220 @@
+"""
+ThreatSage - Offline GeoIP/ASN range database
+
+Build a compact binary database from a CSV dump of IPv4 ranges and resolve
+addresses locally with a binary search:
+
+    python -m app.geoip build ranges.csv data/geoip.bin
+    python -m app.geoip lookup data/geoip.bin 185.107.56.21
+
+The CSV needs a header row with start_ip and end_ip (dotted quads or
+integers) plus any of country, region, city, isp, org, asn, lat, lon and
+timezone.
+"""
+import argparse
+import csv
+import ipaddress
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+MAGIC = b"TSGEO1\0\0"
+RECORD_FIELDS = ("country", "region", "city", "isp", "org", "asn", "lat", "lon", "timezone")
+
+def _ip_to_int(value):
+    """Convert a dotted quad or integer string to an integer; ValueError if it is not an IPv4 address"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        if number > 0xFFFFFFFF:
+            raise ValueError(f"{value} is outside the IPv4 range")
+        return number
+    return int(ipaddress.IPv4Address(value))
+
+def _parse_ipv4(ip_address):
+    """Fast dotted-quad to integer conversion; None if the string is not IPv4"""
+    parts = ip_address.split(".")
+    if len(parts) != 4 or not all(part.isdigit() and len(part) <= 3 for part in parts):
+        return None
+    a, b, c, d = map(int, parts)
+    if a > 255 or b > 255 or c > 255 or d > 255:
+        return None
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+def _uint32_array(values=()):
+    """array of unsigned 32-bit integers, whatever the platform's C int size"""
+    typecode = "I" if array("I").itemsize == 4 else "L"
+    return array(typecode, values)
+
+def _flatten_ranges(ranges):
+    """
+    Split overlapping (start, end, record_id) ranges into disjoint ones
+    
+    Where ranges overlap, the one that starts later wins (so a nested range
+    beats the range around it), and the outer range resumes after it ends.
+    """
+    ranges.sort(key=lambda r: (r[0], -r[1]))
+    flat = []
+    covering = []  # (end, record_id) of the ranges around position, the winner last
+    position = 0
+    
+    def advance(limit):
+        """Emit the winning range for every covered address below limit"""
+        nonlocal position
+        while covering and position < limit:
+            end, record_id = covering[-1]
+            if end >= position:
+                stop = min(end, limit - 1)
+                flat.append((position, stop, record_id))
+                position = stop + 1
+            if end < position:
+                covering.pop()
+    
+    for start, end, record_id in ranges:
+        advance(start)
+        position = start
+        covering.append((end, record_id))
+    advance(0x100000000)
+    return flat
+
+
+class GeoIPDatabase:
+    """
+    Sorted IPv4 ranges with location/ASN records, searched with bisect
+
+    Range starts and ends are kept in two parallel uint32 arrays, and each
+    range points into a table of de-duplicated location records, so lookups
+    allocate nothing until the result dictionary is built.
+    """
+    
+    def __init__(self, starts, ends, record_ids, records):
+        self.starts = starts
+        self.ends = ends
+        self.record_ids = record_ids
+        self.records = records
+    
+    @classmethod
+    def from_csv(cls, path):
+        """Build a database from a CSV dump of IP ranges; nested ranges take precedence over the ranges around them"""
+        ranges = []
+        records = []
+        record_index = {}
+        
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    start = _ip_to_int(row["start_ip"])
+                    end = _ip_to_int(row["end_ip"])
+                except (KeyError, ValueError, ipaddress.AddressValueError):
+                    continue
+                if end < start:
+                    continue
+                record = tuple((row.get(field) or "").strip() for field in RECORD_FIELDS)
+                if record not in record_index:
+                    record_index[record] = len(records)
+                    records.append(record)
+                ranges.append((start, end, record_index[record]))
+        
+        ranges = _flatten_ranges(ranges)
+        return cls(
+            _uint32_array(r[0] for r in ranges),
+            _uint32_array(r[1] for r in ranges),
+            _uint32_array(r[2] for r in ranges),
+            records
+        )
+    
+    @classmethod
+    def load(cls, path):
+        """Load a database written by save()"""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a ThreatSage GeoIP database")
+            count, records_size = struct.unpack("<QQ", f.read(16))
+            
+            arrays = []
+            for _ in range(3):
+                values = _uint32_array()
+                values.frombytes(f.read(count * 4))
+                if sys.byteorder != "little":
+                    values.byteswap()
+                arrays.append(values)
+            records = [tuple(record) for record in json.loads(f.read(records_size).decode("utf-8"))]
+        
+        return cls(arrays[0], arrays[1], arrays[2], records)
+    
+    def save(self, path):
+        """Write the database in its compact binary format"""
+        records = json.dumps(self.records, separators=(",", ":")).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<QQ", len(self.starts), len(records)))
+            for values in (self.starts, self.ends, self.record_ids):
+                if sys.byteorder != "little":
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                f.write(values.tobytes())
+            f.write(records)
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def lookup(self, ip_address):
+        """
+        Resolve an IPv4 address
+        Returns a dictionary with the same fields as ThreatIntelligence._query_ip_api,
+        or None when the address is not covered
+        """
+        value = _parse_ipv4(ip_address)
+        if value is None:
+            return None
+        
+        i = bisect_right(self.starts, value) - 1
+        if i < 0 or value > self.ends[i]:
+            return None
+        
+        country, region, city, isp, org, asn, lat, lon, timezone = self.records[self.record_ids[i]]
+        return {
+            "IP": ip_address,
+            "Country": country or "N/A",
+            "Region": region or "N/A",
+            "City": city or "N/A",
+            "ISP": isp or "N/A",
+            "Organization": org or "N/A",
+            "ASN": asn or "N/A",
+            "Is Proxy": False,
+            "Is Hosting": False,
+            "Is Mobile": False,
+            "Timezone": timezone or "N/A",
+            "Coordinates": f"{lat or 'N/A'},{lon or 'N/A'}",
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the offline GeoIP database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    build = commands.add_parser("build", help="Build a binary database from a CSV dump")
+    build.add_argument("csv_file")
+    build.add_argument("output")
+    
+    lookup = commands.add_parser("lookup", help="Look up addresses in a binary database")
+    lookup.add_argument("database")
+    lookup.add_argument("ips", nargs="+")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "build":
+        database = GeoIPDatabase.from_csv(args.csv_file)
+        database.save(args.output)
+        print(f"[*] Wrote {len(database)} ranges ({len(database.records)} unique records) to {args.output}")
+    else:
+        database = GeoIPDatabase.load(args.database)
+        for ip in args.ips:
+            print(json.dumps(database.lookup(ip) or {"IP": ip, "Error": "Not found"}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,14 +15,14 @@ configure_logging()
 import warnings
 import logging
 import time
-import inquirer
 import ipaddress
 
-from app.enrichment import ThreatIntelligence
+from app.enrichment import get_threat_intelligence
 from app.agent import IncidentResponder
 from app.extractor import EntityExtractor
 from app.reporter import generate_report
 from app.visualizer import generate_html_map, generate_threat_chart
+from utils.metrics import stage_timer
 
 
 def suppress_warnings():
@@ -64,6 +64,11 @@ def print_info(text):
     """Print info message in blue"""
     colored_print(text, "36")
 
+def print_threat_score(score):
+    """Print a threat score colored by severity"""
+    score_color = "31" if score > 70 else "33" if score > 30 else "32"
+    print(f"  - Threat score: \033[{score_color}m{score}/100\033[0m")
+
 def is_valid_ip(ip_text):
     """Properly validate IP address using ipaddress module"""
     try:
@@ -72,25 +77,34 @@ def is_valid_ip(ip_text):
     except ValueError:
         return False
 
-def process_alert_or_ip(input_text, is_ip=False, generate_report_flag=False, generate_map=False, generate_chart=False, responder=None):
-    """Process an IP address or alert text with visualization options"""
+def process_alert_or_ip(input_text, is_ip=False, generate_report_flag=False, generate_map=False, generate_chart=False, responder=None, threat_intel=None, stream=False):
+    """
+    Process an IP address or alert text with visualization options
+    With stream set, the recommendation is printed as the model generates it
+    """
     print_info(f"[*] Processing {'IP' if is_ip else 'alert'}: {input_text}")
+    # Seconds spent in each stage, returned with the result
+    timings = {}
+    start = time.perf_counter()
     
     entities = {"ips": [], "usernames": [], "actions": [], "times": []}
     if is_ip:
         entities["ips"] = [input_text]  
     else:
-        extractor = EntityExtractor()
-        entities = extractor.extract_all(input_text)
+        with stage_timer("extract", timings):
+            extractor = EntityExtractor()
+            entities = extractor.extract_all(input_text)
     
-    threat_intel = ThreatIntelligence()
+    # Reuse the process-wide enrichment service unless one is provided
+    if threat_intel is None:
+        threat_intel = get_threat_intelligence()
     ip_data = {}
     
     if entities['ips']:
         print_info(f"\n[*] Enriching {len(entities['ips'])} IPs...")
-        for ip in entities['ips']:
-            ip_data[ip] = threat_intel.enrich_ip(ip)
-            
+        with stage_timer("enrich", timings):
+            ip_data = threat_intel.enrich_many(entities['ips'])
+        for ip in ip_data:
             if "Error" in ip_data[ip]:
                 print_error(f"    ✘ Error: {ip_data[ip]['Error']}")
             elif ip_data[ip].get("Is Internal", False):
@@ -108,48 +122,70 @@ def process_alert_or_ip(input_text, is_ip=False, generate_report_flag=False, gen
         responder = IncidentResponder()
     
     if entities['ips'] and ip_data.get(entities['ips'][0]):
-        analysis = responder.reason(ip_data[entities['ips'][0]], raw_alert=input_text)
+        if stream:
+            # The score is known before generation starts, so show it right away
+            print_threat_score(responder.calculate_threat_score(ip_data[entities['ips'][0]]))
+            print_info("\n[*] ThreatSage recommendation:")
+            print("  ", end="", flush=True)
+            on_token = lambda text: print(text.replace('\n', '\n  '), end="", flush=True)
+            with stage_timer("analyze", timings):
+                analysis = responder.reason(ip_data[entities['ips'][0]], raw_alert=input_text, on_token=on_token)
+            print()
+            timings.update(analysis.get("timings", {}))
+            print_info(f"[*] First output after {timings.get('first_token', 0):.2f}s, "
+                       f"finished after {timings['analyze']:.2f}s")
+        else:
+            with stage_timer("analyze", timings):
+                analysis = responder.reason(ip_data[entities['ips'][0]], raw_alert=input_text)
+            timings.update(analysis.get("timings", {}))
+            
+            print_threat_score(analysis['threat_score'])
+            print_info("\n[*] ThreatSage recommendation:")
+            print("  " + analysis['recommendation'].replace('\n', '\n  '))
         
         score = analysis['threat_score']
-        score_color = "31" if score > 70 else "33" if score > 30 else "32"
-        print(f"  - Threat score: \033[{score_color}m{score}/100\033[0m")
-        
-        print_info("\n[*] ThreatSage recommendation:")
-        print("  " + analysis['recommendation'].replace('\n', '\n  '))
         
         if score > 50 or generate_report_flag:
-            report_file = generate_report(entities, ip_data, analysis, input_text)
+            with stage_timer("report", timings):
+                report_file = generate_report(entities, ip_data, analysis, input_text)
             print_info(f"\n[*] Full report generated: {report_file}")
         
         visualizations = []
         
         if generate_map and ip_data:
             print_info("\n[*] Generating IP location map...")
-            map_file = generate_html_map(ip_data)
+            with stage_timer("map", timings):
+                map_file = generate_html_map(ip_data)
             visualizations.append(map_file)
             print_success(f"  ✓ IP Map generated: {map_file}")
         
         if generate_chart:
             print_info("\n[*] Generating threat history chart...")
-            history = responder.memory.get("incidents", [])
+            history = list(responder.memory.incidents)
             if history:
-                chart_file = generate_threat_chart(history)
+                with stage_timer("chart", timings):
+                    chart_file = generate_threat_chart(history)
                 visualizations.append(chart_file)
                 print_success(f"  ✓ Threat history chart generated: {chart_file}")
             else:
                 print_warning("  ⚠ No threat history available for charting")
         
+        timings["total"] = round(time.perf_counter() - start, 6)
+        
         return {
             "entities": entities,
             "ip_data": ip_data,
             "analysis": analysis,
-            "visualizations": visualizations
+            "visualizations": visualizations,
+            "timings": timings
         }
     else:
         print_error("\n[!] Unable to perform analysis due to lack of data.")
         return None
 
 def get_post_analysis_actions():
+    import inquirer
+    
     actions = [
         ("Generate report", "report"),
         ("Generate IP location map", "map"),
@@ -170,6 +206,9 @@ def get_post_analysis_actions():
     return answers['actions'] if answers else []
 
 def interactive_mode():
+    # Imported here so headless entry points that reuse this module don't need it
+    import inquirer
+    
     print_banner()
     print_info("[*] Welcome to ThreatSage Interactive Mode")
     print_info("[*] This tool helps analyze security threats and generate reports")
@@ -194,7 +233,7 @@ def interactive_mode():
             is_ip = is_valid_ip(input_text)  # Improved IP validation
             
             # Pass the shared responder to avoid creating a new instance
-            result = process_alert_or_ip(input_text, is_ip=is_ip, responder=responder)
+            result = process_alert_or_ip(input_text, is_ip=is_ip, responder=responder, stream=True)
 
             if result:
                 while True:
@@ -231,7 +270,7 @@ def interactive_mode():
                         if "chart" in actions:
                             print_info("\n[*] Generating threat history chart...")
                             # Use the shared responder instance for consistency
-                            history = responder.memory.get("incidents", [])
+                            history = list(responder.memory.incidents)
                             if not history:
                                 print_warning("  ⚠ No threat history available for charting")
                                 continue
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+class IncidentMemory:
+    """
+    Append-only incident memory with an in-memory index keyed by IP
+
+    Every recorded incident is one JSON line appended to the log, so the cost
+    of a write does not depend on how much history is kept. The log is
+    replayed at startup and compacted once it holds more than max_incidents
+    incidents beyond the last compaction. Per-IP state is kept for the
+    max_known_ips most recently recorded IPs, so a compaction never writes
+    more than that many snapshot lines however many IPs a feed has seen.
+    """
+    
+    def __init__(self, path="memory_log.jsonl", max_incidents=10000, max_verdicts_per_ip=5,
+                 legacy_file="memory_dump.txt", max_known_ips=100000):
+        """
+        Args:
+            path: Append-only log file
+            max_incidents: Number of incidents kept in the history
+            max_verdicts_per_ip: Number of recent verdicts kept for each IP
+            legacy_file: Old whole-file JSON memory, imported once if the log is missing
+            max_known_ips: IPs whose history is kept; the least recently recorded are forgotten first
+        """
+        self.path = path
+        self.max_incidents = max_incidents
+        self.max_verdicts_per_ip = max_verdicts_per_ip
+        self.max_known_ips = max_known_ips
+        
+        self.incidents = deque(maxlen=max_incidents)
+        self.known_ips = OrderedDict()
+        self._appended = 0
+        self._lock = threading.Lock()
+        
+        if not os.path.exists(path) and legacy_file and os.path.exists(legacy_file):
+            self._import_legacy(legacy_file)
+        else:
+            self._replay()
+        self._log = open(path, "a")
+    
+    def _ip_state(self, ip):
+        """Return the index entry for ip, creating it if needed, and mark it most recently used"""
+        state = self.known_ips.get(ip)
+        if state is None:
+            state = {"seen_count": 0, "previous_verdicts": deque(maxlen=self.max_verdicts_per_ip)}
+            self.known_ips[ip] = state
+            if len(self.known_ips) > self.max_known_ips:
+                self.known_ips.popitem(last=False)
+        else:
+            self.known_ips.move_to_end(ip)
+        return state
+    
+    def _apply(self, event):
+        """Apply one log event to the in-memory index"""
+        kind = event.get("type", "incident")
+        if kind == "ip":
+            state = self._ip_state(event["ip"])
+            state["seen_count"] = event.get("seen_count", 0)
+            state["previous_verdicts"].clear()
+            state["previous_verdicts"].extend(event.get("previous_verdicts", []))
+            return
+        
+        self.incidents.append({
+            "ip": event["ip"],
+            "timestamp": event["timestamp"],
+            "threat_score": event["threat_score"]
+        })
+        if kind == "incident":
+            state = self._ip_state(event["ip"])
+            state["seen_count"] += 1
+            state["previous_verdicts"].append({
+                "timestamp": event["timestamp"],
+                "threat_score": event["threat_score"],
+                "summary": event.get("summary", "")
+            })
+    
+    def _replay(self):
+        """Rebuild the index from the log"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                        self._apply(event)
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # a torn final line from an interrupted write
+                    # Snapshot lines from the last compaction don't count towards the next one
+                    if event.get("type", "incident") == "incident":
+                        self._appended += 1
+        except IOError as e:
+            print(f"Warning: Could not load memory log {self.path}: {e}")
+    
+    def _import_legacy(self, legacy_file):
+        """Load the old memory_dump.txt format and write it out as a compacted log"""
+        try:
+            with open(legacy_file, "r") as f:
+                content = f.read().strip()
+            legacy = json.loads(content) if content else {}
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not import legacy memory file: {e}")
+            return
+        
+        for ip, state in legacy.get("known_ips", {}).items():
+            self._apply({"type": "ip", "ip": ip, **state})
+        for incident in legacy.get("incidents", []):
+            self._apply({"type": "history", **incident})
+        
+        self._write_compacted()
+        os.replace(legacy_file, legacy_file + ".migrated")
+    
+    def _write_compacted(self):
+        """Rewrite the log as one snapshot per known IP followed by the retained history"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for ip, state in self.known_ips.items():
+                f.write(json.dumps({
+                    "type": "ip",
+                    "ip": ip,
+                    "seen_count": state["seen_count"],
+                    "previous_verdicts": list(state["previous_verdicts"])
+                }) + "\n")
+            for incident in self.incidents:
+                f.write(json.dumps({"type": "history", **incident}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._appended = 0
+    
+    def compact(self):
+        """Rewrite the log to drop events that fell out of retention"""
+        with self._lock:
+            self._compact()
+    
+    def _compact(self):
+        """compact() for callers already holding the lock"""
+        self._log.close()
+        self._write_compacted()
+        self._log = open(self.path, "a")
+    
+    def record(self, ip, threat_score, verdict):
+        """Append an incident for ip and update the index"""
+        event = {
+            "type": "incident",
+            "ip": ip,
+            "timestamp": time.time(),
+            "threat_score": threat_score,
+            "summary": verdict[:100] + "..." if len(verdict) > 100 else verdict
+        }
+        with self._lock:
+            self._apply(event)
+            self._log.write(json.dumps(event) + "\n")
+            self._appended += 1
+            if self._appended > self.max_incidents:
+                self._compact()
+    
+    def flush(self):
+        """Push buffered log writes to disk"""
+        with self._lock:
+            self._log.flush()
+    
+    def ip_history(self, ip):
+        """Return seen_count and recent verdicts for ip"""
+        with self._lock:
+            state = self.known_ips.get(ip)
+            if state is None:
+                return {"seen_count": 0, "previous_verdicts": []}
+            return {"seen_count": state["seen_count"], "previous_verdicts": list(state["previous_verdicts"])}
+    
+    def close(self):
+        """Flush and close the log"""
+        with self._lock:
+            self._log.close()
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+
+class RateLimitExceeded(Exception):
+    """Raised when a request could not be scheduled within the allowed wait"""
+
+
+class RateLimiter:
+    """
+    Token bucket scheduler for a rate-limited HTTP API
+
+    Tokens refill continuously at capacity/period per second. The bucket also
+    follows the server's own accounting through X-Rl (requests left in the
+    current window) and X-Ttl (seconds until the window resets), and backs off
+    exponentially after consecutive failures.
+    """
+    
+    def __init__(self, capacity=45, period=60.0, backoff_base=1.0, backoff_max=60.0):
+        """
+        Args:
+            capacity: Requests allowed per period
+            period: Length of the rate limit window in seconds
+            backoff_base: Delay after the first failure, doubled on each further one
+            backoff_max: Upper bound for the backoff delay
+        """
+        self.capacity = capacity
+        self.period = period
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        """Add the tokens earned since the last refill (lock held)"""
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.capacity / self.period)
+        self._last_refill = now
+    
+    def acquire(self, max_wait=30.0):
+        """
+        Block until a request may be sent, then consume one token
+        Raises RateLimitExceeded if that would take longer than max_wait seconds
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now,
+                           (1 - self._tokens) * self.period / self.capacity)
+            
+            if now + wait > deadline:
+                raise RateLimitExceeded(f"rate limit reached, next request allowed in {wait:.1f}s")
+            time.sleep(wait)
+    
+    def update_from_headers(self, headers):
+        """Align the bucket with the X-Rl / X-Ttl headers of a response"""
+        try:
+            remaining = int(headers.get("X-Rl"))
+            reset_in = float(headers.get("X-Ttl"))
+        except (TypeError, ValueError):
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, remaining)
+            if remaining <= 0:
+                self._blocked_until = max(self._blocked_until, now + reset_in)
+    
+    def record_success(self):
+        """Reset the failure streak"""
+        with self._lock:
+            self._failures = 0
+    
+    def record_failure(self, retry_after=None):
+        """
+        Register a failed request and delay the next one
+        Returns the delay in seconds before another request is allowed
+        """
+        with self._lock:
+            self._failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+            delay *= random.uniform(0.8, 1.2)  # jitter so concurrent workers don't retry in lockstep
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            return delay
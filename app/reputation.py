@@ -0,0 +1,253 @@
+"""
+ThreatSage - Local IP reputation from CIDR blocklists
+
+Blocklists are plain text files with one IPv4 address or CIDR block per line
+('#' starts a comment; anything after the first token is ignored, so
+Spamhaus DROP style "1.2.3.0/24 ; SBL123" lines work). A JSON config names
+the lists and the confidence and activities each one implies:
+
+    {
+      "lists": [
+        {"name": "spamhaus-drop", "path": "blocklists/drop.txt",
+         "confidence": "High", "activities": ["Spam and botnet infrastructure"]},
+        {"name": "ssh-bruteforce", "path": "blocklists/ssh.txt",
+         "confidence": "Low", "activities": ["SSH dictionary attacks"]}
+      ]
+    }
+"""
+import json
+import os
+import threading
+import time
+from array import array
+
+CONFIDENCE_RANK = {"Low": 0, "High": 1}
+
+def _parse_cidr(text):
+    """Parse "a.b.c.d" or "a.b.c.d/n" into (network int, prefix length), or None"""
+    address, _, length = text.partition("/")
+    parts = address.split(".")
+    if len(parts) != 4 or not all(part.isdigit() and len(part) <= 3 for part in parts):
+        return None
+    octets = [int(part) for part in parts]
+    if max(octets) > 255:
+        return None
+    prefix_len = 32
+    if length:
+        if not length.isdigit() or int(length) > 32:
+            return None
+        prefix_len = int(length)
+    value = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    mask = (0xFFFFFFFF << (32 - prefix_len)) & 0xFFFFFFFF
+    return value & mask, prefix_len
+
+
+class PrefixTree:
+    """
+    Path-compressed binary radix tree over IPv4 prefixes
+
+    Nodes live in parallel arrays (key, prefix length, two children, value),
+    so the tree holds at most two nodes per inserted prefix and a lookup
+    visits at most 33 nodes. Values are small non-negative integers.
+    """
+    
+    def __init__(self):
+        self.keys = array("L", [0])
+        self.lengths = array("b", [0])
+        self.children = (array("l", [-1]), array("l", [-1]))
+        self.values = array("l", [-1])
+    
+    def __len__(self):
+        return sum(1 for value in self.values if value != -1)
+    
+    def _new_node(self, key, length, value=-1):
+        self.keys.append(key)
+        self.lengths.append(length)
+        self.children[0].append(-1)
+        self.children[1].append(-1)
+        self.values.append(value)
+        return len(self.keys) - 1
+    
+    def insert(self, key, length, value, replace=None):
+        """
+        Store value for the prefix key/length
+        replace(old, new) decides which value wins when the prefix already has one
+        """
+        keys, lengths, children, values = self.keys, self.lengths, self.children, self.values
+        node = 0
+        while True:
+            node_len = lengths[node]
+            if node_len == length:
+                old = values[node]
+                values[node] = value if old == -1 or replace is None else replace(old, value)
+                return
+            
+            bit = (key >> (31 - node_len)) & 1
+            child = children[bit][node]
+            if child == -1:
+                children[bit][node] = self._new_node(key, length, value)
+                return
+            
+            child_len = lengths[child]
+            limit = min(child_len, length)
+            common = min(32 - ((keys[child] ^ key) & 0xFFFFFFFF).bit_length(), limit)
+            if common == child_len:
+                node = child
+                continue
+            
+            # Split the edge: a new node for the shared prefix takes the child's place
+            mask = (0xFFFFFFFF << (32 - common)) & 0xFFFFFFFF if common else 0
+            if common == length:
+                middle = self._new_node(key, length, value)
+            else:
+                middle = self._new_node(key & mask, common)
+                leaf = self._new_node(key, length, value)
+                children[(key >> (31 - common)) & 1][middle] = leaf
+            children[(keys[child] >> (31 - common)) & 1][middle] = child
+            children[bit][node] = middle
+            return
+    
+    def longest_match(self, address):
+        """Return the value of the longest prefix containing address, or -1"""
+        keys, lengths, values = self.keys, self.lengths, self.values
+        left, right = self.children
+        best = values[0]
+        node = left[0] if not (address >> 31) & 1 else right[0]
+        while node != -1:
+            node_len = lengths[node]
+            if (address ^ keys[node]) >> (32 - node_len):
+                break
+            if values[node] != -1:
+                best = values[node]
+            if node_len == 32:
+                break
+            node = right[node] if (address >> (31 - node_len)) & 1 else left[node]
+        return best
+
+
+class ReputationEngine:
+    """
+    Longest-prefix-match reputation lookups over configured blocklists
+
+    The tree and the lists its values index are kept as one (tree, lists)
+    snapshot, rebuilt off to the side and swapped in with a single
+    assignment, so lookups never see a half-loaded or mismatched state.
+    Changes to the config or any list file are checked for at most every
+    check_interval seconds and rebuilt on a background thread; lookups are
+    answered from the previous snapshot until the new one is ready.
+    """
+    
+    def __init__(self, config_file, check_interval=30.0):
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = (PrefixTree(), [])
+        self._reloader = None
+        self._mtimes = {}
+        self._last_check = 0.0
+        self.reload()
+    
+    def _file_mtimes(self, lists):
+        mtimes = {}
+        for path in [self.config_file] + [entry["path"] for entry in lists]:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+    
+    def _read_config(self):
+        with open(self.config_file, "r") as f:
+            config = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(self.config_file))
+        lists = []
+        for entry in config.get("lists", []):
+            path = entry["path"]
+            lists.append({
+                "name": entry.get("name", os.path.basename(path)),
+                "path": path if os.path.isabs(path) else os.path.join(base_dir, path),
+                "confidence": entry.get("confidence", "Low"),
+                "activities": list(entry.get("activities", [])),
+            })
+        return lists
+    
+    def reload(self):
+        """
+        Rebuild the tree from the config and list files, then swap it in
+        A missing or malformed config keeps the current tree and returns False
+        """
+        try:
+            lists = self._read_config()
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Warning: Could not load reputation config {self.config_file}: {e}")
+            # Remember the broken file's mtime so it is reported once, not on every check
+            mtimes = self._file_mtimes(self._snapshot[1])
+            with self._lock:
+                self._mtimes = mtimes
+                self._last_check = time.monotonic()
+            return False
+        tree = PrefixTree()
+        
+        def stronger(old, new):
+            rank = lambda index: CONFIDENCE_RANK.get(lists[index]["confidence"], 0)
+            return new if rank(new) > rank(old) else old
+        
+        for index, entry in enumerate(lists):
+            try:
+                with open(entry["path"], "r") as f:
+                    for line in f:
+                        token = line.split("#", 1)[0].split(None, 1)
+                        if not token:
+                            continue
+                        parsed = _parse_cidr(token[0].rstrip(";,"))
+                        if parsed:
+                            tree.insert(parsed[0], parsed[1], index, replace=stronger)
+            except IOError as e:
+                print(f"Warning: Could not load blocklist {entry['path']}: {e}")
+        
+        mtimes = self._file_mtimes(lists)
+        with self._lock:
+            self._snapshot = (tree, lists)
+            self._mtimes = mtimes
+            self._last_check = time.monotonic()
+        return True
+    
+    def reload_if_changed(self):
+        """
+        Start a background reload when the config or a list file changed since the last load
+        Returns True if a reload was started
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        if self._file_mtimes(self._snapshot[1]) == self._mtimes:
+            return False
+        with self._lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return False
+            # Building a tree of millions of prefixes takes seconds; don't hold up the lookup that noticed
+            self._reloader = threading.Thread(target=self.reload, daemon=True)
+            self._reloader.start()
+        return True
+    
+    def check(self, ip_address):
+        """
+        Look up an IPv4 address
+        Returns Reputation/Confidence/Reported Activities fields for enrichment
+        """
+        self.reload_if_changed()
+        parsed = _parse_cidr(ip_address)
+        tree, lists = self._snapshot
+        match = tree.longest_match(parsed[0]) if parsed else -1
+        
+        if match == -1:
+            return {"Reputation": "Clean", "Confidence": "Low", "Reputation Source": "Local blocklists"}
+        
+        entry = lists[match]
+        return {
+            "Reputation": "Suspicious",
+            "Confidence": entry["confidence"],
+            "Reported Activities": list(entry["activities"]),
+            "Reputation Source": entry["name"],
+        }
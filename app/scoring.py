@@ -0,0 +1,132 @@
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_RULES_FILE = "data/scoring_rules.json"
+
+DEFAULT_RULES = {
+    "proxy": 30,
+    "hosting": 20,
+    "history_per_incident": 10,
+    "history_max": 30,
+    "suspicious_high_confidence": 30,
+    "suspicious_low_confidence": 15,
+    "high_risk_country": 20,
+    "high_risk_countries": ["Russia", "China", "North Korea", "Iran"],
+    "max_score": 100
+}
+
+def load_scoring_rules(path=DEFAULT_RULES_FILE):
+    """Load rule weights from a JSON file, falling back to DEFAULT_RULES for missing keys"""
+    rules = dict(DEFAULT_RULES)
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                rules.update(json.load(f))
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not load scoring rules from {path}: {e}")
+    return rules
+
+
+class ScoringEngine:
+    """
+    Rule-based threat scoring over single records or columnar batches
+
+    score() handles one enrichment record. score_many() turns a batch into
+    columns and scores it in one vectorized pass with NumPy (or a plain Python
+    loop when NumPy is unavailable); both produce identical results.
+    """
+    
+    def __init__(self, rules=None, rules_file=DEFAULT_RULES_FILE):
+        """
+        Args:
+            rules: Dictionary of rule weights; overrides rules_file when given
+            rules_file: JSON file with rule weights and high_risk_countries
+        """
+        self.rules = dict(DEFAULT_RULES, **rules) if rules else load_scoring_rules(rules_file)
+        self.high_risk_countries = frozenset(self.rules["high_risk_countries"])
+    
+    def score(self, enriched_data, seen_count=0):
+        """Score one enrichment record; seen_count is how often its IP was seen before"""
+        rules = self.rules
+        score = 0
+        
+        if enriched_data.get("Is Proxy", False):
+            score += rules["proxy"]
+        if enriched_data.get("Is Hosting", False):
+            score += rules["hosting"]
+            
+        score += min(seen_count * rules["history_per_incident"], rules["history_max"])
+        
+        if enriched_data.get("Reputation") == "Suspicious":
+            if enriched_data.get("Confidence", "Low") == "High":
+                score += rules["suspicious_high_confidence"]
+            else:
+                score += rules["suspicious_low_confidence"]
+        
+        if enriched_data.get("Country") in self.high_risk_countries:
+            score += rules["high_risk_country"]
+            
+        return min(score, rules["max_score"])
+    
+    def to_columns(self, enriched_list, seen_counts=None):
+        """Extract the fields used for scoring into parallel columns"""
+        seen_counts = seen_counts if seen_counts is not None else [0] * len(enriched_list)
+        high_risk = self.high_risk_countries
+        return {
+            "proxy": [bool(data.get("Is Proxy", False)) for data in enriched_list],
+            "hosting": [bool(data.get("Is Hosting", False)) for data in enriched_list],
+            "suspicious": [data.get("Reputation") == "Suspicious" for data in enriched_list],
+            "high_confidence": [data.get("Confidence", "Low") == "High" for data in enriched_list],
+            "high_risk_country": [data.get("Country") in high_risk for data in enriched_list],
+            "seen_count": list(seen_counts),
+        }
+    
+    def score_columns(self, columns):
+        """Score a batch given as columns from to_columns; returns a list of ints"""
+        rules = self.rules
+        
+        if np is None:
+            return [
+                min(
+                    proxy * rules["proxy"]
+                    + hosting * rules["hosting"]
+                    + min(seen * rules["history_per_incident"], rules["history_max"])
+                    + (suspicious and (rules["suspicious_high_confidence"] if high
+                                       else rules["suspicious_low_confidence"]))
+                    + risky * rules["high_risk_country"],
+                    rules["max_score"]
+                )
+                for proxy, hosting, suspicious, high, risky, seen in zip(
+                    columns["proxy"], columns["hosting"], columns["suspicious"],
+                    columns["high_confidence"], columns["high_risk_country"], columns["seen_count"]
+                )
+            ]
+        
+        proxy = np.asarray(columns["proxy"], dtype=bool)
+        hosting = np.asarray(columns["hosting"], dtype=bool)
+        suspicious = np.asarray(columns["suspicious"], dtype=bool)
+        high_confidence = np.asarray(columns["high_confidence"], dtype=bool)
+        high_risk_country = np.asarray(columns["high_risk_country"], dtype=bool)
+        seen_count = np.asarray(columns["seen_count"], dtype=np.int64)
+        
+        scores = (
+            proxy * rules["proxy"]
+            + hosting * rules["hosting"]
+            + np.minimum(seen_count * rules["history_per_incident"], rules["history_max"])
+            + suspicious * np.where(high_confidence,
+                                    rules["suspicious_high_confidence"],
+                                    rules["suspicious_low_confidence"])
+            + high_risk_country * rules["high_risk_country"]
+        )
+        return np.minimum(scores, rules["max_score"]).tolist()
+    
+    def score_many(self, enriched_list, seen_counts=None):
+        """Score a batch of enrichment records in one pass"""
+        if not enriched_list:
+            return []
+        return self.score_columns(self.to_columns(enriched_list, seen_counts))
@@ -0,0 +1,402 @@
+"""
+ThreatSage - Local HTTP analysis service
+Keeps the model, enrichment cache and memory loaded between requests
+
+    POST /analyze   {"alert": "..."} or {"ip": "..."}, optional "force_llm"
+    POST /analyze/stream   same body; chunked NDJSON: {"token": ...} lines, then {"result": ...}
+    POST /enrich    {"ips": ["..."]}
+    POST /score     {"ip": "..."} or {"ip_data": {...}}
+    GET  /health
+    GET  /metrics   Prometheus text format
+"""
+import sys
+
+from app import setup_project_path
+setup_project_path()
+
+from utils.logger import configure_logging
+configure_logging()
+
+import argparse
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.enrichment import get_threat_intelligence
+from app.agent import IncidentResponder
+from app.extractor import EntityExtractor
+from app.main import is_valid_ip, suppress_warnings
+from utils import metrics
+from utils.metrics import SERVICE_REQUESTS, stage_timer
+
+MAX_BODY_BYTES = 1024 * 1024
+ENDPOINTS = ("/analyze", "/analyze/stream", "/enrich", "/score", "/health", "/metrics")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+# ip_data fields read by the scorer, which must be strings and booleans respectively
+SCORE_TEXT_FIELDS = ("IP", "Country", "Reputation", "Confidence")
+SCORE_FLAG_FIELDS = ("Is Proxy", "Is Hosting")
+
+
+class HTTPError(Exception):
+    """An error answered with the given status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisService:
+    """
+    Bounded job queue in front of a shared extractor, enrichment service and responder
+
+    Requests are queued and run on a pool of worker threads; when queue_size
+    jobs are already waiting new requests are refused with 503 so callers can
+    back off instead of piling up. The responder serializes generation since
+    the model is shared, while enrichment, scoring and template-tier analyses
+    keep flowing around it.
+    """
+
+    def __init__(self, responder=None, threat_intel=None, extractor=None,
+                 queue_size=64, workers=4):
+        self.responder = responder or IncidentResponder()
+        self.threat_intel = threat_intel or get_threat_intelligence()
+        self.extractor = extractor or EntityExtractor()
+        self.queue_size = queue_size
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="threatsage")
+        self._queue = None
+        self._tasks = []
+        self.processed = 0
+        self.rejected = 0
+
+    # Jobs, run on the worker threads
+
+    def analyze(self, payload, on_token=None):
+        """
+        Extract, enrich and reason about one alert or IP, like process_alert_or_ip
+        on_token receives the recommendation text as it is generated
+        """
+        text = payload.get("alert") or payload.get("ip")
+        if not text or not isinstance(text, str):
+            raise HTTPError(400, "Provide an 'alert' or 'ip' string")
+        timings = {}
+
+        if is_valid_ip(text):
+            entities = {"ips": [text], "usernames": [], "actions": [], "times": []}
+        else:
+            with stage_timer("extract", timings):
+                entities = self.extractor.extract_all(text)
+
+        with stage_timer("enrich", timings):
+            ip_data = self.threat_intel.enrich_many(entities["ips"]) if entities["ips"] else {}
+        if not entities["ips"] or not ip_data.get(entities["ips"][0]):
+            return {"entities": entities, "ip_data": ip_data, "analysis": None,
+                    "error": "No IP addresses found in the input", "timings": timings}
+
+        with stage_timer("analyze", timings):
+            analysis = self.responder.reason(
+                ip_data[entities["ips"][0]], raw_alert=text, force_llm=bool(payload.get("force_llm")),
+                on_token=on_token
+            )
+        timings.update(analysis.get("timings", {}))
+        return {"entities": entities, "ip_data": ip_data, "analysis": analysis, "timings": timings}
+
+    def enrich(self, payload):
+        """Enrich a list of IPs through the bulk lookup"""
+        ips = payload.get("ips")
+        if isinstance(payload.get("ip"), str):
+            ips = [payload["ip"]]
+        if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+            raise HTTPError(400, "Provide 'ips' as a list of strings")
+        return {"ip_data": self.threat_intel.enrich_many(ips)}
+
+    def score(self, payload):
+        """Threat score for an IP (enriched first) or an already enriched record"""
+        ip_data = payload.get("ip_data")
+        if isinstance(payload.get("ip"), str):
+            if not is_valid_ip(payload["ip"]):
+                raise HTTPError(400, f"Invalid IP address: {payload['ip']}")
+            ip_data = self.threat_intel.enrich_ip(payload["ip"])
+        elif isinstance(ip_data, dict):
+            invalid = [field for field in SCORE_TEXT_FIELDS
+                       if ip_data.get(field) is not None and not isinstance(ip_data[field], str)]
+            invalid += [field for field in SCORE_FLAG_FIELDS
+                        if ip_data.get(field) is not None and not isinstance(ip_data[field], bool)]
+            if invalid:
+                raise HTTPError(400, f"Invalid ip_data fields: {', '.join(invalid)}")
+        if not isinstance(ip_data, dict):
+            raise HTTPError(400, "Provide an 'ip' string or an 'ip_data' object")
+        return {"threat_score": self.responder.calculate_threat_score(ip_data), "ip_data": ip_data}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "model_loaded": self.responder._model is not None,
+            "inference": self.responder.backend_stats(),
+            "processed": self.processed,
+            "rejected": self.rejected,
+        }
+
+    # Queue
+
+    async def start(self):
+        """Create the queue and worker tasks on the running loop"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        self.responder.save_memory()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, payload, future = await self._queue.get()
+            try:
+                if not future.cancelled():
+                    result = await loop.run_in_executor(self._executor, job, payload)
+                    if not future.cancelled():
+                        future.set_result(result)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+
+    def enqueue(self, job, payload):
+        """Queue a job and return a future for its result; raises HTTPError(503) when the queue is full"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job, payload, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPError(503, "Analysis queue is full, retry later")
+        return future
+
+    async def submit(self, job, payload):
+        """Queue a job and wait for its result"""
+        return await self.enqueue(job, payload)
+
+    def stream_analysis(self, payload):
+        """
+        Queue an analysis whose recommendation text is streamed back
+        Returns an async generator of {"token"} items followed by one {"result"} or {"error"} item
+        """
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+        on_token = lambda text: loop.call_soon_threadsafe(tokens.put_nowait, text)
+        future = self.enqueue(functools.partial(self.analyze, on_token=on_token), payload)
+
+        async def events():
+            while True:
+                getter = asyncio.ensure_future(tokens.get())
+                done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield {"token": getter.result()}
+                    continue
+                getter.cancel()
+                break
+            # Tokens are queued before the job completes, so anything left is already here
+            while not tokens.empty():
+                yield {"token": tokens.get_nowait()}
+            try:
+                yield {"result": future.result()}
+            except Exception as e:
+                yield {"error": str(e)}
+
+        return events()
+
+    # HTTP
+
+    async def dispatch(self, method, path, body):
+        """Route a request to its job and return (status, response object)"""
+        routes = {"/analyze": self.analyze, "/enrich": self.enrich, "/score": self.score}
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+
+        if path in ("/health", "/metrics"):
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, self.health() if path == "/health" else metrics.render()
+        if path not in routes and path != "/analyze/stream":
+            raise HTTPError(404, f"Unknown endpoint {path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+
+        try:
+            payload = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+
+        if path == "/analyze/stream":
+            return 200, self.stream_analysis(payload)
+        return 200, await self.submit(routes[path], payload)
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it alive when asked"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                keep_alive = False
+                started = time.perf_counter()
+                path = ""
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length) if length else b""
+                except HTTPError as e:
+                    status, result = e.status, {"error": str(e)}
+                except ValueError:
+                    # The request line or headers couldn't be parsed, so the connection can't be trusted
+                    status, result, keep_alive = 400, {"error": "Malformed HTTP request"}, False
+                else:
+                    try:
+                        status, result = await self.dispatch(method.upper(), path, body)
+                    except HTTPError as e:
+                        status, result = e.status, {"error": str(e)}
+                    except ValueError as e:
+                        # Bad input caught by a job, such as an invalid IP
+                        status, result = 400, {"error": str(e)}
+                    except Exception as e:
+                        status, result = 500, {"error": f"Analysis failed: {e}"}
+
+                await self._respond(writer, status, result, keep_alive)
+                endpoint = path.split("?", 1)[0].rstrip("/")
+                SERVICE_REQUESTS.observe(time.perf_counter() - started,
+                                         endpoint=endpoint if endpoint in ENDPOINTS else "other", status=status)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, result, keep_alive):
+        if hasattr(result, "__aiter__"):
+            await self._respond_stream(writer, result, keep_alive)
+            return
+        # Text results (the metrics page) are sent as-is, everything else as JSON
+        if isinstance(result, str):
+            body, content_type = result.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(result, default=str).encode(), "application/json"
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def _respond_stream(self, writer, events, keep_alive):
+        """Send events as newline-delimited JSON with chunked transfer encoding"""
+        head = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: application/x-ndjson",
+            "Transfer-Encoding: chunked",
+            "Cache-Control: no-cache",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+        await writer.drain()
+        async for event in events:
+            data = (json.dumps(event, default=str) + "\n").encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080, preload=True):
+        """Load the model, then serve until cancelled"""
+        await self.start()
+        if preload:
+            # Pay the model load once, before the first request arrives
+            await asyncio.get_running_loop().run_in_executor(self._executor, lambda: self.responder.model)
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"[*] ThreatSage service listening on http://{address[0]}:{address[1]}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ThreatSage analysis over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("--model", default="gpt2",
+                        help="HuggingFace model used for recommendations")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Requests allowed to wait before new ones get 503")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Worker threads for enrichment and analysis jobs")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Load the model on the first request instead of at startup")
+    parser.add_argument("--backend", choices=["pipeline", "int8", "onnx"], default=None,
+                        help="Inference backend (default: $THREATSAGE_BACKEND or pipeline)")
+    parser.add_argument("--llm-threshold", type=int, default=None,
+                        help="Only alerts scoring at least this much go to the model")
+    parser.add_argument("--geoip-db", default=None,
+                        help="Offline GeoIP database built with 'python -m app.geoip build'")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never query ip-api; resolve IPs only from --geoip-db")
+    parser.add_argument("--reputation-lists", default=None, metavar="CONFIG",
+                        help="JSON config of CIDR blocklists used for IP reputation")
+    parser.add_argument("--api-url", default="http://ip-api.com",
+                        help="Base URL of the ip-api compatible enrichment service")
+    args = parser.parse_args(argv)
+
+    service = AnalysisService(
+        responder=IncidentResponder(model_name=args.model, llm_threshold=args.llm_threshold,
+                                    backend=args.backend),
+        threat_intel=get_threat_intelligence(
+            api_url=args.api_url, geoip_db=args.geoip_db, offline=args.offline,
+            reputation_lists=args.reputation_lists
+        ),
+        queue_size=max(1, args.queue_size),
+        workers=args.workers,
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port, preload=not args.no_preload))
+    except KeyboardInterrupt:
+        print("\n[*] Shutting down ThreatSage service.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    suppress_warnings()
+    sys.exit(main())
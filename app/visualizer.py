@@ -1,14 +1,145 @@
 import os
 import json
+import math
 import time
+from collections import Counter
 from datetime import datetime
 
-def generate_html_map(ip_data):
+# Worst first when a map cell holds IPs with different reputations
+REPUTATION_RANK = {"Not Applicable": 0, "Clean": 1, "Unknown": 2, "Suspicious": 3}
+REPUTATION_COLORS = {"Not Applicable": "#95a5a6", "Clean": "#2ecc71", "Unknown": "#f39c12", "Suspicious": "#e74c3c"}
+
+
+def _coordinates(data):
+    """(lat, lon) from an enrichment record, or None when it has no usable location"""
+    if "Error" in data:
+        return None
+    try:
+        lat, lon = data["Coordinates"].split(",")
+        lat, lon = float(lat), float(lon)
+    except (KeyError, ValueError, AttributeError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return None
+    return lat, lon
+
+
+def choose_cell_size(points, max_cells=5000, cell_size=0.1):
+    """
+    Smallest grid cell size, doubling from cell_size, that keeps the map under max_cells cells
+    points is a list of (lat, lon) pairs
+    """
+    while cell_size < 90:
+        cells = {(math.floor(lat / cell_size), math.floor(lon / cell_size)) for lat, lon in points}
+        if len(cells) <= max_cells:
+            break
+        cell_size *= 2
+    return cell_size
+
+
+def aggregate_locations(ip_data, cell_size=None, ips_per_cell=10, max_cells=5000):
+    """
+    Group IP locations into cell_size-degree grid cells for the map
+    
+    Each cell keeps its IP count, the worst reputation among its IPs, its
+    most common country and up to ips_per_cell sample IPs (the worst ones
+    first). Without a cell_size, cells start at 0.1 degrees (roughly 11km)
+    and grow until there are at most max_cells of them, so the page stays
+    small however many IPs are plotted.
+    
+    The result is columnar: one list per field with one entry per cell,
+    strings stored once in a lookup table and referenced by index, and the
+    samples of cell i found at sample_offset[i]:sample_offset[i + 1].
+    """
+    reputations = sorted(REPUTATION_RANK, key=REPUTATION_RANK.get)
+    strings = []
+    string_index = {}
+    
+    def intern(value):
+        value = str(value)
+        index = string_index.get(value)
+        if index is None:
+            index = string_index[value] = len(strings)
+            strings.append(value)
+        return index
+    
+    points = []
+    for ip, data in ip_data.items():
+        location = _coordinates(data)
+        if location is not None:
+            points.append((ip, data, location))
+    if cell_size is None:
+        cell_size = choose_cell_size([location for _, _, location in points], max_cells)
+    
+    cells = {}
+    for ip, data, (lat, lon) in points:
+        reputation = data.get("Reputation", "Unknown")
+        if reputation not in REPUTATION_RANK:
+            reputation = "Unknown"
+        rank = REPUTATION_RANK[reputation]
+        
+        key = (math.floor(lat / cell_size), math.floor(lon / cell_size))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {"lat": 0.0, "lon": 0.0, "count": 0, "rank": rank,
+                                 "countries": Counter(), "samples": []}
+        cell["lat"] += lat
+        cell["lon"] += lon
+        cell["count"] += 1
+        cell["rank"] = max(cell["rank"], rank)
+        cell["countries"][data.get("Country", "Unknown")] += 1
+        
+        sample = (rank, ip, data.get("ISP", "Unknown"))
+        samples = cell["samples"]
+        if len(samples) < ips_per_cell:
+            samples.append(sample)
+        else:
+            # Full: a worse IP pushes out the mildest sample
+            mildest = min(range(len(samples)), key=lambda i: samples[i][0])
+            if samples[mildest][0] < rank:
+                samples[mildest] = sample
+    
+    columns = {
+        "cell_size": cell_size,
+        "ip_count": 0,
+        "reputations": reputations,
+        "strings": strings,
+        "lat": [], "lon": [], "count": [], "reputation": [], "country": [],
+        "sample_offset": [0], "sample_ip": [], "sample_isp": [], "sample_reputation": [],
+    }
+    for cell in cells.values():
+        # Place the marker at the cell's mean position rather than its corner
+        columns["lat"].append(round(cell["lat"] / cell["count"], 4))
+        columns["lon"].append(round(cell["lon"] / cell["count"], 4))
+        columns["count"].append(cell["count"])
+        columns["reputation"].append(cell["rank"])
+        # Cells on a border can hold several countries; name the most common one
+        (country, _), *others = cell["countries"].most_common()
+        if others:
+            country = f"{country} (+{len(others)} other{'s' if len(others) > 1 else ''})"
+        columns["country"].append(intern(country))
+        columns["ip_count"] += cell["count"]
+        for rank, ip, isp in sorted(cell["samples"], key=lambda s: -s[0]):
+            columns["sample_ip"].append(ip)
+            columns["sample_isp"].append(intern(isp))
+            columns["sample_reputation"].append(rank)
+        columns["sample_offset"].append(len(columns["sample_ip"]))
+    return columns
+
+
+def generate_html_map(ip_data, cell_size=None, ips_per_cell=10, max_cells=5000):
     """
     Generate an HTML file with a world map showing IP locations
     
+    Nearby IPs are merged into grid cells (see aggregate_locations) and the
+    cells are clustered in the browser with Leaflet.markercluster, so maps
+    with many thousands of IPs still open quickly.
+    
     Args:
         ip_data: Dictionary of IP intelligence data
+        cell_size: Grid cell size in degrees (0.1 is roughly 11km); chosen from max_cells if None
+        ips_per_cell: Most IPs listed in a cell's popup
+        max_cells: Most map cells when cell_size is chosen automatically
     
     Returns:
         Filename of the generated HTML map
@@ -18,21 +149,10 @@ def generate_html_map(ip_data):
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     filename = f"visualizations/ip-map-{timestamp}.html"
     
-    locations = []
-    for ip, data in ip_data.items():
-        if "Error" not in data and "Coordinates" in data and data["Coordinates"] != "N/A":
-            try:
-                lat, lon = data["Coordinates"].split(",")
-                locations.append({
-                    "ip": ip,
-                    "lat": float(lat),
-                    "lon": float(lon),
-                    "country": data.get("Country", "Unknown"),
-                    "isp": data.get("ISP", "Unknown"),
-                    "reputation": data.get("Reputation", "Unknown")
-                })
-            except (ValueError, AttributeError):
-                continue
+    cells = aggregate_locations(ip_data, cell_size, ips_per_cell, max_cells)
+    # Compact separators, and no "</" so the data can't close the script tag
+    cell_json = json.dumps(cells, separators=(",", ":")).replace("</", "<\\/")
+    colors = json.dumps([REPUTATION_COLORS[name] for name in cells["reputations"]])
     
     html_content = f"""
     <!DOCTYPE html>
@@ -63,6 +183,8 @@ def generate_html_map(ip_data):
                 border: 1px solid #ccc;
                 border-radius: 5px;
                 margin-bottom: 5px;
+                max-height: 300px;
+                overflow-y: auto;
             }}
             .suspicious {{
                 color: #e74c3c;
@@ -71,56 +193,116 @@ def generate_html_map(ip_data):
             .clean {{
                 color: #2ecc71;
             }}
+            .cell-cluster {{
+                border-radius: 50%;
+                border: 2px solid rgba(0, 0, 0, 0.4);
+                color: white;
+                font-weight: bold;
+                text-align: center;
+                opacity: 0.85;
+            }}
         </style>
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/leaflet.css" />
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.5.3/MarkerCluster.css" />
     </head>
     <body>
         <div id="header">
             <h1>ThreatSage IP Location Map</h1>
-            <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+               &middot; {cells['ip_count']} IPs in {len(cells['count'])} locations</p>
         </div>
         <div id="map"></div>
         
         <script src="https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/leaflet.js"></script>
+        <script src="https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.5.3/leaflet.markercluster.js"></script>
         <script>
             // Initialize map
-            var map = L.map('map').setView([20, 0], 2);
+            var map = L.map('map', {{preferCanvas: true}}).setView([20, 0], 2);
             
             // Add OpenStreetMap tile layer
             L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
                 attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
             }}).addTo(map);
             
-            // IP location data
-            var ipLocations = {json.dumps(locations)};
+            // Aggregated IP locations, one entry per grid cell in each column
+            var cells = {cell_json};
+            var colors = {colors};
+            var suspiciousRank = cells.reputations.indexOf("Suspicious");
             
-            // Add markers for each IP
-            ipLocations.forEach(function(loc) {{
-                var markerColor = loc.reputation === "Suspicious" ? "#e74c3c" : "#2ecc71";
+            function escapeHtml(text) {{
+                return String(text).replace(/[&<>"']/g, function(c) {{
+                    return {{'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}}[c];
+                }});
+            }}
                 
-                var marker = L.circleMarker([loc.lat, loc.lon], {{
-                    radius: 8,
-                    fillColor: markerColor,
+            function reputationSpan(rank) {{
+                var label = cells.reputations[rank];
+                return '<span class="' + (rank === suspiciousRank ? 'suspicious' : 'clean') + '">' + label + '</span>';
+            }}
+
+            // Popups are built on click rather than up front for every cell
+            function popupContent(i) {{
+                var start = cells.sample_offset[i], end = cells.sample_offset[i + 1];
+                var country = escapeHtml(cells.strings[cells.country[i]]);
+                if (cells.count[i] === 1) {{
+                    return '<div class="info-box">' +
+                        '<h3>IP: ' + escapeHtml(cells.sample_ip[start]) + '</h3>' +
+                        '<p><strong>Country:</strong> ' + country + '</p>' +
+                        '<p><strong>ISP:</strong> ' + escapeHtml(cells.strings[cells.sample_isp[start]]) + '</p>' +
+                        '<p><strong>Reputation:</strong> ' + reputationSpan(cells.reputation[i]) + '</p>' +
+                        '</div>';
+                }}
+                var rows = [];
+                for (var j = start; j < end; j++) {{
+                    rows.push('<li>' + escapeHtml(cells.sample_ip[j]) + ' (' +
+                        escapeHtml(cells.strings[cells.sample_isp[j]]) + ') ' +
+                        reputationSpan(cells.sample_reputation[j]) + '</li>');
+                }}
+                var more = cells.count[i] - (end - start);
+                return '<div class="info-box">' +
+                    '<h3>' + cells.count[i] + ' IPs</h3>' +
+                    '<p><strong>Country:</strong> ' + country + '</p>' +
+                    '<p><strong>Worst reputation:</strong> ' + reputationSpan(cells.reputation[i]) + '</p>' +
+                    '<ul>' + rows.join('') + '</ul>' +
+                    (more > 0 ? '<p>and ' + more + ' more</p>' : '') +
+                    '</div>';
+            }}
+
+            // Clusters show the total IP count and take the color of their worst cell
+            var clusters = L.markerClusterGroup({{
+                chunkedLoading: true,
+                showCoverageOnHover: false,
+                iconCreateFunction: function(cluster) {{
+                    var total = 0, worst = 0;
+                    cluster.getAllChildMarkers().forEach(function(marker) {{
+                        total += cells.count[marker.options.cell];
+                        worst = Math.max(worst, cells.reputation[marker.options.cell]);
+                    }});
+                    var size = total < 100 ? 34 : total < 10000 ? 42 : 50;
+                    return L.divIcon({{
+                        html: '<div class="cell-cluster" style="background:' + colors[worst] +
+                              ';width:' + size + 'px;height:' + size + 'px;line-height:' + (size - 4) + 'px">' +
+                              total + '</div>',
+                        className: '',
+                        iconSize: [size, size]
+                    }});
+                }}
+            }});
+
+            var markers = [];
+            for (var i = 0; i < cells.count.length; i++) {{
+                markers.push(L.circleMarker([cells.lat[i], cells.lon[i]], {{
+                    cell: i,
+                    radius: Math.min(6 + 2 * Math.log10(cells.count[i]), 14),
+                    fillColor: colors[cells.reputation[i]],
                     color: "#000",
                     weight: 1,
                     opacity: 1,
                     fillOpacity: 0.8
-                }}).addTo(map);
-                
-                // Create popup content
-                var popupContent = `
-                    <div class="info-box">
-                        <h3>IP: ${{loc.ip}}</h3>
-                        <p><strong>Country:</strong> ${{loc.country}}</p>
-                        <p><strong>ISP:</strong> ${{loc.isp}}</p>
-                        <p><strong>Reputation:</strong> <span class="${{loc.reputation === "Suspicious" ? "suspicious" : "clean"}}">
-                            ${{loc.reputation}}
-                        </span></p>
-                    </div>
-                `;
-                
-                marker.bindPopup(popupContent);
-            }});
+                }}).bindPopup(function(layer) {{ return popupContent(layer.options.cell); }}));
+            }}
+            clusters.addLayers(markers);
+            map.addLayer(clusters);
         </script>
     </body>
     </html>
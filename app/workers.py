@@ -0,0 +1,178 @@
+"""
+ThreatSage - Multi-process inference pool
+Spreads generation over several processes, each with its own model copy
+"""
+import math
+import multiprocessing
+import os
+
+from app.agent import load_generation_pipeline, generate_assessments
+from app.backends import get_backend
+
+# Per-process state, set up by _init_worker in each pool process
+_worker_model = None
+_worker_backend = None
+_worker_model_name = None
+_worker_error = None
+
+
+def _init_worker(model_name, threads, backend_name):
+    """Pin the math libraries to this worker's share of the cores, then load the model"""
+    global _worker_model, _worker_backend, _worker_model_name, _worker_error
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    try:
+        _worker_model, _worker_model_name, _worker_backend = load_generation_pipeline(
+            model_name, get_backend(backend_name)
+        )
+    except Exception as e:
+        # Raising here would make the pool restart the worker forever; report it with the first task instead
+        _worker_error = f"{type(e).__name__}: {e}"
+
+
+def _generate_group(task):
+    """Generate assessments for one group of prompts inside a worker, with the model actually loaded"""
+    if _worker_error is not None:
+        raise RuntimeError(f"Worker could not load a model: {_worker_error}")
+    prompts, batch_size, generation_kwargs = task
+    return {
+        "texts": generate_assessments(_worker_model, prompts, batch_size, generation_kwargs),
+        "model": _worker_model_name,
+        "backend": _worker_backend.name,
+        "stats": _worker_backend.stats(),
+    }
+
+
+class InferencePool:
+    """
+    Pool of worker processes that generate recommendations for an IncidentResponder
+
+    Scoring, templates, the recommendation cache and incident memory stay in
+    the parent, which is the only process writing memory; workers only turn
+    prompts into text. Prompts are split into groups spread over the workers
+    and results come back in submission order. Each worker gets
+    threads_per_process torch threads so the processes don't oversubscribe
+    the cores.
+
+    The pool has the same reason_many signature as IncidentResponder, so it
+    can stand in for one in batch.analyze_stage.
+
+    If a worker can't load a model, dies, or a group takes longer than
+    timeout seconds, the pool is shut down and generation continues in the
+    parent process.
+    """
+
+    def __init__(self, responder, processes=None, threads_per_process=None, start_method="spawn", timeout=900):
+        cores = os.cpu_count() or 1
+        if processes is None:
+            threads_per_process = threads_per_process or min(4, cores)
+            processes = max(1, cores // threads_per_process)
+        self.processes = max(1, processes)
+        self.threads_per_process = max(1, threads_per_process or cores // self.processes)
+
+        self.responder = responder
+        self.timeout = timeout
+        self._worker_stats = {}
+        # spawn rather than fork: forking after torch has started its thread pools can deadlock
+        context = multiprocessing.get_context(start_method)
+        self._pool = context.Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(responder.model_name, self.threads_per_process, responder.backend.name)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the workers and flush incident memory"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.responder.save_memory()
+
+    def _abandon_pool(self, error):
+        """Kill the workers after a failure; later generation runs in this process"""
+        print(f"Warning: Inference pool failed, generating in this process instead. Error: {error}")
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+    def _use_worker_model(self, model_name, backend_name):
+        """Follow a worker that fell back to another model or backend, so recommendations are cached under it"""
+        responder = self.responder
+        if model_name != responder.model_name or backend_name != responder.backend.name:
+            print(f"Warning: Workers loaded {model_name} with the {backend_name} backend "
+                  f"instead of {responder.model_name} with {responder.backend.name}")
+            # Keep the throughput recorded so far; only the backend's name and model change
+            stats = responder.backend.stats()
+            responder.model_name = model_name
+            responder.backend = get_backend(backend_name)
+            responder.backend.record(stats["tokens_generated"], stats["generation_seconds"])
+
+    def generate_many(self, prompts, batch_size=8):
+        """Generate one assessment per prompt across the workers, in input order"""
+        if not prompts:
+            return []
+        if self._pool is None:
+            return self.responder._generate_many(prompts, batch_size)
+
+        # Small enough groups that every worker gets a share, capped at batch_size
+        group_size = max(1, min(batch_size, math.ceil(len(prompts) / self.processes)))
+        generation_kwargs = self.responder._generation_kwargs()
+        tasks = [(prompts[i:i + group_size], group_size, generation_kwargs)
+                 for i in range(0, len(prompts), group_size)]
+
+        generated = []
+        try:
+            results = self._pool.imap(_generate_group, tasks)
+            for _ in tasks:
+                # A worker that dies takes its task with it; the timeout keeps that from hanging the run
+                group = results.next(self.timeout)
+                self._use_worker_model(group["model"], group["backend"])
+                self._worker_stats[group["stats"]["pid"]] = group["stats"]
+                generated.extend(group["texts"])
+        except Exception as e:
+            self._abandon_pool(str(e) or type(e).__name__)
+            generated.extend(self.responder._generate_many(prompts[len(generated):], batch_size))
+        return generated
+
+    def backend_stats(self):
+        """
+        Throughput from the parent, model load and memory figures from the workers
+        process_rss_bytes sums the workers as of their latest task; parent_rss_bytes is this process
+        """
+        stats = self.responder.backend_stats()
+        workers = [{key: worker[key] for key in ("pid", "backend", "model", "load_seconds", "model_bytes",
+                                                 "process_rss_bytes")}
+                   for worker in self._worker_stats.values()]
+        stats["workers"] = workers
+        if workers and self._pool is not None:
+            stats["parent_rss_bytes"] = stats["process_rss_bytes"]
+            stats["process_rss_bytes"] = sum(worker["process_rss_bytes"] for worker in workers)
+            stats["model"] = workers[0]["model"]
+            stats["loaded"] = True
+            stats["load_seconds"] = max(worker["load_seconds"] or 0 for worker in workers)
+            stats["model_bytes"] = workers[0]["model_bytes"]
+        return stats
+
+    def reason_many(self, enriched_list, alerts=None, batch_size=8, force_llm=False):
+        """IncidentResponder.reason_many, with generation done by the worker pool"""
+        return self.responder.reason_many(
+            enriched_list, alerts, batch_size=batch_size, force_llm=force_llm,
+            generate=self.generate_many
+        )
+
+    def reason(self, enriched_data, raw_alert=None, force_llm=False):
+        """Single-alert convenience wrapper around reason_many"""
+        return self.reason_many([enriched_data], [raw_alert], force_llm=force_llm)[0]
@@ -0,0 +1,177 @@
+"""IncidentResponder analysis paths that don't need a real model"""
+import re
+
+import numpy as np
+import pytest
+
+from app.agent import STREAM_INTERRUPTED, IncidentResponder
+
+ANSWER = "Block the address at the perimeter and review recent logins."
+
+RECORDS = [
+    {"IP": "203.0.113.1", "Country": "Russia", "Is Proxy": True},                   # 50
+    {"IP": "203.0.113.2", "Country": "Germany"},                                    # 0
+    {"IP": "203.0.113.3", "Reputation": "Suspicious", "Confidence": "High"},        # 30
+    {"IP": "203.0.113.4", "Country": "Iran", "Is Hosting": True},                   # 40
+    {"IP": "203.0.113.5", "Is Proxy": True},                                        # 30
+]
+
+
+class FakeTokenizer:
+    """Word-level tokenizer; ids are handed out as words are first seen"""
+    model_max_length = 1024
+    pad_token_id = 0
+
+    def __init__(self):
+        self.words = ["<pad>"]
+
+    def encode(self, text, add_special_tokens=True):
+        ids = []
+        for word in text.split():
+            if word not in self.words:
+                self.words.append(word)
+            ids.append(self.words.index(word))
+        return ids
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        return " ".join(self.words[int(i)] for i in ids)
+
+
+class FakePipeline:
+    """Stands in for a text-generation pipeline, feeding a streamer word by word when given one"""
+
+    def __init__(self, answer=ANSWER, fail_after=None):
+        self.tokenizer = FakeTokenizer()
+        self.answer = answer
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def __call__(self, prompt, streamer=None, **kwargs):
+        self.calls += 1
+        words = self.tokenizer.encode(self.answer)
+        if streamer is not None:
+            streamer.put(np.array([self.tokenizer.encode(prompt)]))
+            for i, word in enumerate(words):
+                if i == self.fail_after:
+                    raise RuntimeError("generation broke")
+                streamer.put(np.array([word]))
+            streamer.end()
+        elif self.fail_after is not None:
+            raise RuntimeError("generation broke")
+        return [{"generated_text": f"{prompt} {self.answer}"}]
+
+
+def prompt_ip(prompt):
+    return re.search(r"- IP: (\S+)", prompt).group(1)
+
+
+@pytest.fixture
+def responder(tmp_path):
+    responder = IncidentResponder(memory_file=str(tmp_path / "memory.jsonl"), cache_dir=str(tmp_path / "cache"),
+                                  recommendation_cache=False, scoring_rules_file=None)
+    yield responder
+    responder.memory.close()
+
+
+def test_reason_many_keeps_input_order(responder):
+    responder.llm_threshold = 20
+    calls = []
+
+    def generate(prompts, batch_size):
+        calls.append([prompt_ip(prompt) for prompt in prompts])
+        # The 203.0.113.4 prompt fails on its own
+        return [None if prompt_ip(prompt) == "203.0.113.4" else f"Assessment for {prompt_ip(prompt)}"
+                for prompt in prompts]
+
+    results = responder.reason_many(RECORDS, [f"alert {i}" for i in range(5)], generate=generate)
+
+    assert calls == [["203.0.113.1", "203.0.113.3", "203.0.113.4", "203.0.113.5"]]
+    assert [result["threat_score"] for result in results] == [50, 0, 30, 40, 30]
+    assert [result["tier"] for result in results] == ["model", "template", "model", "model", "model"]
+    recommendations = [result["recommendation"] for result in results]
+    assert recommendations[0] == "Assessment for 203.0.113.1"
+    assert recommendations[1].startswith("Threat score 0/100 (Low risk).")
+    assert recommendations[2] == "Assessment for 203.0.113.3"
+    assert recommendations[3].startswith("Unable to provide detailed analysis")
+    assert recommendations[4] == "Assessment for 203.0.113.5"
+
+
+def test_reason_many_distrusts_a_miscounted_batch(responder):
+    responder.llm_threshold = 20
+    results = responder.reason_many(RECORDS, generate=lambda prompts, batch_size: ["only one"])
+
+    assert all(result["recommendation"] != "only one" for result in results)
+    assert results[1]["tier"] == "template"
+    assert all(results[i]["recommendation"].startswith("Unable to provide") for i in (0, 2, 3, 4))
+
+
+def test_low_risk_alert_skips_the_model(responder, monkeypatch):
+    def load_model(model_name):
+        raise AssertionError("the model should not be loaded")
+
+    monkeypatch.setattr(responder, "_load_model", load_model)
+    responder.llm_threshold = 20
+    analysis = responder.reason({"IP": "203.0.113.2", "Country": "Germany"}, "ssh login")
+
+    assert analysis["tier"] == "template"
+    assert analysis["threat_score"] == 0
+    assert responder._model is None
+
+
+def test_recommendation_key_ignores_low_value_fields(responder):
+    record = {"IP": "203.0.113.1", "Country": "Russia", "Is Proxy": True, "City": "Moscow", "ISP": "Example"}
+    moved = dict(record, City="Kazan", ISP="Other", Timezone="Europe/Moscow", Error="timeout")
+    key = responder._recommendation_key(record, "ssh login", 50)
+
+    assert responder._recommendation_key(moved, "ssh login", 50) == key
+    assert responder._recommendation_key(dict(record, Country="Iran"), "ssh login", 50) != key
+
+
+def streaming_responder(responder, model):
+    responder._model = model
+    responder.reuse_prompt_cache = False
+    responder.recommendation_cache = True
+    return responder
+
+
+def run_stream(responder, record):
+    chunks = []
+    stream = responder.reason_stream(record, "ssh login")
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as done:
+            return chunks, done.value
+
+
+def test_reason_stream_yields_the_recommendation(responder):
+    pytest.importorskip("transformers")
+    model = FakePipeline()
+    chunks, analysis = run_stream(streaming_responder(responder, model), RECORDS[0])
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == ANSWER
+    assert analysis["recommendation"] == ANSWER
+    assert analysis["tier"] == "model"
+    assert not analysis["cached"]
+
+
+def test_streamed_recommendation_is_stored(responder):
+    model = FakePipeline()
+    chunks, analysis = run_stream(streaming_responder(responder, model), RECORDS[0])
+    assert "".join(chunks) == ANSWER
+
+    key = responder._recommendation_key(RECORDS[0], "ssh login", analysis["threat_score"])
+    assert responder.recommendations.get(key) == ANSWER
+
+
+def test_interrupted_stream_is_not_stored(responder):
+    model = FakePipeline(fail_after=3)
+    chunks, analysis = run_stream(streaming_responder(responder, model), RECORDS[0])
+
+    assert analysis["recommendation"].startswith("Unable to provide detailed analysis")
+    assert chunks[-1] == analysis["recommendation"]
+    if len(chunks) > 1:
+        assert chunks[-2] == STREAM_INTERRUPTED
+    key = responder._recommendation_key(RECORDS[0], "ssh login", analysis["threat_score"])
+    assert responder.recommendations.get(key) is None
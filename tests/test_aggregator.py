@@ -0,0 +1,107 @@
+"""AlertAggregator windows, wall-clock closing and syslog timestamps"""
+import time
+from datetime import datetime, timedelta
+
+from app.aggregator import IDLE, AlertAggregator, alert_timestamp
+
+
+def alert(alert_id, timestamp, ips=("10.0.0.1",), usernames=("root",), actions=("login failed",)):
+    return {
+        "id": alert_id,
+        "timestamp": timestamp,
+        "entities": {"ips": list(ips), "usernames": list(usernames), "actions": list(actions)},
+    }
+
+
+def test_alerts_within_the_window_merge():
+    aggregator = AlertAggregator(window_seconds=60)
+    assert aggregator.add(alert(1, 1000)) == []
+    assert aggregator.add(alert(2, 1050)) == []
+    # Usernames match case-insensitively and entity order does not matter
+    assert aggregator.add(alert(3, 1100, usernames=("ROOT",))) == []
+
+    (incident,) = aggregator.flush()
+    assert incident["occurrences"] == 3
+    assert incident["alert_ids"] == [1, 2, 3]
+    assert (incident["first_seen"], incident["last_seen"]) == (1000, 1100)
+
+
+def test_gap_longer_than_the_window_starts_a_new_incident():
+    aggregator = AlertAggregator(window_seconds=60)
+    aggregator.add(alert(1, 1000))
+    aggregator.add(alert(2, 1030, ips=("10.0.0.2",)))
+
+    closed = aggregator.add(alert(3, 1080))
+    assert [(incident["id"], incident["occurrences"]) for incident in closed] == [(1, 1)]
+    closed = aggregator.add(alert(4, 1200, ips=("10.0.0.3",)))
+    assert [incident["id"] for incident in closed] == [2, 3]
+    assert [incident["id"] for incident in aggregator.flush()] == [4]
+
+
+def test_different_keys_stay_apart():
+    aggregator = AlertAggregator(window_seconds=60)
+    aggregator.add(alert(1, 1000))
+    aggregator.add(alert(2, 1001, actions=("sudo",)))
+    aggregator.add(alert(3, 1002, ips=("10.0.0.1", "10.0.0.2")))
+    assert len(aggregator.flush()) == 3
+
+
+def test_max_open_emits_the_oldest_incident_early():
+    aggregator = AlertAggregator(window_seconds=60, max_open=2)
+    aggregator.add(alert(1, 1000, ips=("10.0.0.1",)))
+    aggregator.add(alert(2, 1001, ips=("10.0.0.2",)))
+    closed = aggregator.add(alert(3, 1002, ips=("10.0.0.3",)))
+    assert [incident["id"] for incident in closed] == [1]
+
+
+def test_parse_errors_pass_straight_through():
+    aggregator = AlertAggregator()
+    failed = {"id": 9, "error": "bad line"}
+    assert aggregator.add(failed) == [failed]
+
+
+def test_tick_closes_idle_incidents():
+    aggregator = AlertAggregator(window_seconds=0.05)
+    aggregator.add(alert(1, 1000))
+    assert aggregator.tick() == []
+    time.sleep(0.1)
+    assert [incident["id"] for incident in aggregator.tick()] == [1]
+    assert aggregator.flush() == []
+
+
+def test_aggregate_stream_with_idle_markers():
+    aggregator = AlertAggregator(window_seconds=0.05)
+
+    def stream():
+        yield alert(1, 1000)
+        yield alert(2, 1000.01)
+        time.sleep(0.1)
+        yield IDLE
+        yield alert(3, 1000.02)
+
+    incidents = list(aggregator.aggregate(stream()))
+    assert [(incident["id"], incident["occurrences"]) for incident in incidents] == [(1, 2), (3, 1)]
+
+
+def test_timestamp_formats():
+    assert alert_timestamp({"timestamp": 1234.5}) == 1234.5
+    assert alert_timestamp({"timestamp": "1970-01-01T00:00:10Z"}) == 10.0
+    assert alert_timestamp({"timestamp": "garbage"}, default=7.0) == 7.0
+    assert alert_timestamp({"alert": "no timestamp here"}, default=7.0) == 7.0
+
+
+def syslog_alert(moment):
+    return {"alert": moment.strftime("%b %d %H:%M:%S") + " host sshd[1]: Failed password for root"}
+
+
+def test_syslog_timestamps_are_in_the_past_year():
+    now = datetime.now().replace(microsecond=0)
+    earlier = now - timedelta(hours=3)
+    if earlier.year == now.year:
+        assert alert_timestamp(syslog_alert(earlier)) == earlier.timestamp()
+
+    # A date ahead of now can only be last year's, e.g. "Dec 31" read on Jan 1
+    ahead = now + timedelta(days=10)
+    if (ahead.month, ahead.day) != (2, 29):
+        expected = ahead.replace(year=now.year - 1)
+        assert alert_timestamp(syslog_alert(ahead)) == expected.timestamp()
@@ -0,0 +1,108 @@
+"""Headless batch pipeline from input lines to JSONL results, with stub enrichment and responder"""
+import io
+import json
+
+from app.batch import parse_alert_line, run_pipeline, write_results
+from app.extractor import EntityExtractor
+
+INPUT = "\n".join([
+    json.dumps({"id": "a1", "alert": "Failed SSH login for root from 203.0.113.5", "timestamp": 1000}),
+    json.dumps({"ip": "198.51.100.7"}),
+    "Oct 17 03:44:01 web sshd[42]: Invalid user admin from 192.0.2.10 port 22",
+    "",
+    json.dumps({"id": "no-text", "severity": "high"}),
+    json.dumps({"msg": "Disk usage above 90% on db01"}),
+    "not json {",
+]) + "\n"
+
+
+class LoggingExtractor(EntityExtractor):
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def extract_all(self, text):
+        self.events.append(("extract", text))
+        return super().extract_all(text)
+
+
+class StubThreatIntel:
+    def __init__(self, events):
+        self.events = events
+
+    def enrich_many(self, ips):
+        self.events.append(("enrich", list(ips)))
+        return {ip: {"IP": ip, "Country": "Testland"} for ip in ips}
+
+
+class StubResponder:
+    def __init__(self, events):
+        self.events = events
+
+    def reason_many(self, enriched_list, alerts=None, batch_size=8):
+        self.events.append(("analyze", [data["IP"] for data in enriched_list]))
+        return [{"threat_score": 10, "recommendation": f"Look at {data['IP']}: {alert}"}
+                for data, alert in zip(enriched_list, alerts)]
+
+
+def run(text, **kwargs):
+    events = []
+    results = run_pipeline(io.StringIO(text), extractor=LoggingExtractor(events),
+                           threat_intel=StubThreatIntel(events), responder=StubResponder(events), **kwargs)
+    output = io.StringIO()
+    count = write_results(results, output)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == len(records)
+    return records, events
+
+
+def test_parse_alert_line():
+    assert parse_alert_line("  ", 3) is None
+    assert parse_alert_line('{"ip": "198.51.100.7"}', 4) == {"id": 4, "alert": "198.51.100.7", "is_ip": True}
+    assert parse_alert_line('{"message": "x", "@timestamp": "2024-01-01T00:00:00Z"}', 5)["timestamp"] == \
+        "2024-01-01T00:00:00Z"
+    assert parse_alert_line("raw syslog text", 6) == {"id": 6, "alert": "raw syslog text", "is_ip": False}
+    assert "error" in parse_alert_line('{"id": 7}', 7)
+
+
+def test_results_follow_input_order():
+    records, _ = run(INPUT, batch_size=2, llm_batch_size=2)
+
+    assert [record["id"] for record in records] == ["a1", 2, 3, "no-text", 6, 7]
+    first, bare_ip, syslog, no_text, no_ip, garbage = records
+    assert first["entities"]["ips"] == ["203.0.113.5"]
+    assert first["ip_data"]["203.0.113.5"]["Country"] == "Testland"
+    assert first["analysis"]["recommendation"] == "Look at 203.0.113.5: Failed SSH login for root from 203.0.113.5"
+    assert first["timestamp"] == 1000
+    assert bare_ip["analysis"]["recommendation"].startswith("Look at 198.51.100.7")
+    assert syslog["entities"]["usernames"] == ["admin"]
+    assert no_text["error"] == "No alert text found in record"
+    assert no_ip["error"] == "No IP addresses found in the input"
+    assert "analysis" not in no_ip and "analysis" not in garbage
+    assert all("is_ip" not in record for record in records)
+
+
+def test_stages_run_in_order_and_stream():
+    _, events = run(INPUT, batch_size=2, llm_batch_size=2)
+
+    def first(kind, ip):
+        return next(i for i, event in enumerate(events) if event[0] == kind and ip in event[1])
+
+    # Each alert is extracted, then enriched, then analyzed
+    for ip in ("203.0.113.5", "192.0.2.10"):
+        assert first("extract", ip) < first("enrich", ip) < first("analyze", ip)
+    assert ("enrich", ["203.0.113.5", "198.51.100.7"]) in events
+    assert ("analyze", ["203.0.113.5", "198.51.100.7"]) in events
+    # Small groups: the first alerts are analyzed before the last lines are even extracted
+    assert first("analyze", "203.0.113.5") < first("extract", "Disk usage")
+
+
+def test_aggregated_alerts_are_analyzed_once():
+    line = json.dumps({"alert": "Failed SSH login for root from 203.0.113.5", "timestamp": 1000})
+    repeat = json.dumps({"alert": "Failed SSH login for root from 203.0.113.5", "timestamp": 1030})
+    records, events = run(line + "\n" + repeat + "\n", aggregate_window=60)
+
+    (record,) = records
+    assert record["occurrences"] == 2
+    assert record["analysis"]["recommendation"].endswith("(repeated 2 times)")
+    assert [kind for kind, _ in events].count("analyze") == 1
@@ -0,0 +1,87 @@
+"""SQLiteCache expiry and least-recently-used eviction"""
+import time
+
+import pytest
+
+from app.cache import SQLiteCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache" / "test.db"), ttl=60, max_entries=3, sweep_interval=1)
+    yield cache
+    cache.close()
+
+
+def test_round_trip(cache):
+    cache.set("a", {"Country": "Alpha", "score": [1, 2]})
+    assert cache.get("a") == {"Country": "Alpha", "score": [1, 2]}
+    cache.set("a", "replaced")
+    assert cache.get("a") == "replaced"
+    assert len(cache) == 1
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def test_expired_entries_are_dropped(cache):
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2)
+    assert cache.get("short") == 1
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    assert len(cache) == 1
+
+
+def test_purge_sweeps_expired_entries(cache):
+    cache.set("gone", 1, ttl=-1)
+    cache.set("kept", 2)
+    cache.purge()
+    assert len(cache) == 1
+
+
+def test_least_recently_used_is_evicted(cache):
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+        time.sleep(0.01)
+    cache.get("a")  # a is now more recent than b
+    time.sleep(0.01)
+    cache.set("d", "d")
+
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+
+
+def test_cap_holds_on_every_insert_between_sweeps(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "sweep.db"), max_entries=3, sweep_interval=1000)
+    for i in range(50):
+        cache.set(f"key{i}", i)
+        assert len(cache) == min(i + 1, 3)
+    assert cache.get("key49") == 49
+    cache.close()
+
+
+def test_cap_holds_for_a_reopened_store(tmp_path):
+    path = str(tmp_path / "reopen.db")
+    cache = SQLiteCache(path, max_entries=10, sweep_interval=1000)
+    for i in range(10):
+        cache.set(f"key{i}", i)
+    cache.close()
+
+    cache = SQLiteCache(path, max_entries=3, sweep_interval=1000)
+    cache.set("new", "value")
+    assert len(cache) == 3
+    assert cache.get("new") == "value"
+    cache.close()
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "persist.db")
+    cache = SQLiteCache(path)
+    cache.set("ip", {"Country": "Alpha"})
+    cache.close()
+
+    cache = SQLiteCache(path)
+    assert cache.get("ip") == {"Country": "Alpha"}
+    cache.close()
@@ -0,0 +1,113 @@
+"""ThreatIntelligence lookups against the local ip-api stub"""
+import time
+
+import pytest
+import requests
+
+from app.enrichment import ThreatIntelligence
+from utils.ipapi_stub import fake_lookup, start_stub_server
+
+# Public IPv6 address: not private, and the stub answers it with an ip-api style failure
+FAILING_IP = "2606:4700::1111"
+
+
+def public_ips(count, first_octet=8):
+    return [f"{first_octet}.{i // 250}.{i % 250}.1" for i in range(count)]
+
+
+@pytest.fixture
+def stub():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def intel(stub, tmp_path):
+    intel = ThreatIntelligence(cache_dir=str(tmp_path / "cache"), api_url=f"http://127.0.0.1:{stub.server_port}",
+                               batch_requests_per_minute=1000, max_wait=2.0)
+    yield intel
+    intel.close()
+
+
+def test_enrich_many_batches_cache_misses(stub, intel):
+    ips = public_ips(250) + [FAILING_IP]
+    results = intel.enrich_many(ips + ips[:10])
+
+    assert list(results) == ips
+    assert sorted(len(queried) for method, queried in stub.requests) == [51, 100, 100]
+    assert {method for method, _ in stub.requests} == {"POST"}
+    for ip in ips[:-1]:
+        expected = fake_lookup(ip)
+        assert results[ip]["IP"] == ip
+        assert results[ip]["Country"] == expected["country"]
+        assert results[ip]["ASN"] == expected["as"]
+    assert results[FAILING_IP]["Error"] == "IP lookup failed: invalid query"
+
+
+def test_cached_ips_are_not_queried_again(stub, intel):
+    ips = public_ips(120) + [FAILING_IP]
+    first = intel.enrich_many(ips)
+    stub.requests.clear()
+
+    new_ips = public_ips(5, first_octet=9)
+    second = intel.enrich_many(ips + new_ips + ["10.0.0.1"])
+
+    assert stub.requests == [("POST", new_ips)]
+    assert all(second[ip] == first[ip] for ip in ips)
+    assert second["10.0.0.1"]["Is Internal"]
+
+
+@pytest.fixture
+def limited_stub():
+    server = start_stub_server(rate_limit=1)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def limited_intel(server, tmp_path):
+    return ThreatIntelligence(cache_dir=str(tmp_path / "cache"), api_url=f"http://127.0.0.1:{server.server_port}",
+                              max_wait=0.5, max_retries=0)
+
+
+def test_exhausted_quota_header_pauses_lookups(limited_stub, tmp_path):
+    intel = limited_intel(limited_stub, tmp_path)
+    try:
+        # The only request of the window comes back with X-Rl 0 and an X-Ttl of up to a minute
+        assert "Error" not in intel.enrich_ip("8.8.4.4")
+        assert intel.enrich_ip("8.8.8.8")["Error"].startswith("Lookup deferred")
+        assert limited_stub.request_count == 1
+    finally:
+        intel.close()
+
+
+def test_throttled_response_pauses_lookups(limited_stub, tmp_path):
+    # Another client used up the quota, so our first request is answered 429
+    requests.get(f"http://127.0.0.1:{limited_stub.server_port}/json/9.9.9.9", timeout=5)
+    intel = limited_intel(limited_stub, tmp_path)
+    try:
+        assert intel.enrich_ip("8.8.8.8")["Error"] == "IP lookup failed with status code: 429"
+        assert intel.enrich_ip("1.1.1.1")["Error"].startswith("Lookup deferred")
+        assert limited_stub.request_count == 2
+    finally:
+        intel.close()
+
+
+def test_failed_lookups_are_cached_until_the_negative_ttl(stub, tmp_path):
+    intel = ThreatIntelligence(cache_dir=str(tmp_path / "cache"), api_url=f"http://127.0.0.1:{stub.server_port}",
+                               negative_cache_ttl=0.3)
+    try:
+        assert "Error" in intel.enrich_ip(FAILING_IP)
+        assert "Error" not in intel.enrich_ip("8.8.8.8")
+        assert "Error" in intel.enrich_ip(FAILING_IP)
+        assert len(stub.requests) == 2
+
+        time.sleep(0.4)
+        intel.enrich_ip(FAILING_IP)
+        intel.enrich_ip("8.8.8.8")
+        # Only the failure expired; the successful lookup is still cached
+        assert stub.requests[2:] == [("GET", [FAILING_IP])]
+    finally:
+        intel.close()
@@ -0,0 +1,15 @@
+"""IPv4 extraction from alert text"""
+from app.extractor import EntityExtractor
+
+
+def test_extracts_valid_ipv4_addresses():
+    extractor = EntityExtractor()
+    text = "Failed login from 192.168.1.10 and 10.0.0.255, not 256.1.1.1 or 1.2.3"
+    assert extractor.extract_ips(text) == ["192.168.1.10", "10.0.0.255"]
+
+
+def test_ignores_non_ascii_digits():
+    extractor = EntityExtractor()
+    # Arabic-Indic and fullwidth digits match \d but are not IPv4 addresses
+    assert extractor.extract_ips("from ١٠.0.0.1") == []
+    assert extractor.extract_ips("from １.2.3.4 and 5.6.7.8") == ["5.6.7.8"]
@@ -0,0 +1,107 @@
+"""GeoIP range lookups at the edges, CSV row validation and the binary format round trip"""
+import pytest
+
+from app.geoip import GeoIPDatabase
+
+CSV_HEADER = "start_ip,end_ip,country,region,city,isp,org,asn,lat,lon,timezone\n"
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(CSV_HEADER + "\n".join([
+        "0.0.0.0,0.0.0.255,Reserved,,,,,,,,",
+        "10.0.0.0,10.0.0.255,Alpha,,,Alpha ISP,,AS1,1.5,2.5,UTC",
+        # Adjacent range sharing a record with the first Alpha range
+        "10.0.1.0,10.0.1.255,Alpha,,,Alpha ISP,,AS1,1.5,2.5,UTC",
+        "167772672,167772927,Beta,,,,,,,,",  # 10.0.2.0-10.0.2.255 as integers
+        "255.255.255.0,255.255.255.255,Broadcast,,,,,,,,",
+        # Rows that must be skipped
+        "10.0.9.255,10.0.9.0,Backwards,,,,,,,,",
+        "4294967296,4294967300,TooBig,,,,,,,,",
+        "10.0.10.0,not an ip,Broken,,,,,,,,",
+    ]) + "\n")
+    return GeoIPDatabase.from_csv(str(path))
+
+
+def country(database, ip):
+    result = database.lookup(ip)
+    return result and result["Country"]
+
+
+def test_range_edges(database):
+    assert country(database, "10.0.0.0") == "Alpha"
+    assert country(database, "10.0.0.255") == "Alpha"
+    assert country(database, "10.0.1.0") == "Alpha"
+    assert country(database, "9.255.255.255") is None
+    assert country(database, "10.0.2.0") == "Beta"
+    assert country(database, "10.0.2.255") == "Beta"
+    assert country(database, "10.0.3.0") is None
+
+
+def test_first_and_last_addresses(database):
+    assert country(database, "0.0.0.0") == "Reserved"
+    assert country(database, "255.255.255.255") == "Broadcast"
+    assert country(database, "255.255.254.255") is None
+
+
+def test_invalid_rows_are_skipped(database):
+    assert len(database) == 5
+    assert len(database.records) == 4
+    assert country(database, "10.0.9.100") is None
+    assert country(database, "10.0.10.0") is None
+
+
+def test_invalid_addresses(database):
+    for ip in ("256.0.0.1", "10.0.0", "::1", "", "10.0.0.1.2"):
+        assert database.lookup(ip) is None
+
+
+def test_lookup_fields(database):
+    result = database.lookup("10.0.0.7")
+    assert result["IP"] == "10.0.0.7"
+    assert result["ISP"] == "Alpha ISP"
+    assert result["ASN"] == "AS1"
+    assert result["Coordinates"] == "1.5,2.5"
+    assert database.lookup("10.0.2.1")["Coordinates"] == "N/A,N/A"
+
+
+def test_save_and_load_round_trip(database, tmp_path):
+    path = tmp_path / "geoip.bin"
+    database.save(str(path))
+    loaded = GeoIPDatabase.load(str(path))
+
+    assert list(loaded.starts) == list(database.starts)
+    assert list(loaded.ends) == list(database.ends)
+    for ip in ("0.0.0.0", "10.0.0.7", "10.0.2.255", "10.0.3.0", "255.255.255.255"):
+        assert loaded.lookup(ip) == database.lookup(ip)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a geoip database")
+    with pytest.raises(ValueError):
+        GeoIPDatabase.load(str(path))
+
+
+def test_nested_ranges(tmp_path):
+    path = tmp_path / "nested.csv"
+    path.write_text(CSV_HEADER + "\n".join([
+        "10.0.0.0,10.0.255.255,Outer,,,,,,,,",
+        "10.0.1.0,10.0.1.255,Inner,,,,,,,,",
+        "10.0.1.128,10.0.1.128,Host,,,,,,,,",
+        "10.0.200.0,10.1.0.255,Overlap,,,,,,,,",
+    ]) + "\n")
+    database = GeoIPDatabase.from_csv(str(path))
+
+    assert country(database, "10.0.0.255") == "Outer"
+    assert country(database, "10.0.1.0") == "Inner"
+    assert country(database, "10.0.1.128") == "Host"
+    assert country(database, "10.0.1.129") == "Inner"
+    assert country(database, "10.0.2.5") == "Outer"
+    assert country(database, "10.0.199.255") == "Outer"
+    assert country(database, "10.0.200.0") == "Overlap"
+    assert country(database, "10.1.0.255") == "Overlap"
+    assert country(database, "10.1.1.0") is None
+    assert list(database.starts) == sorted(database.starts)
+    assert all(end < start for end, start in zip(database.ends, database.starts[1:]))
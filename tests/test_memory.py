@@ -0,0 +1,116 @@
+"""IncidentMemory log replay, compaction and the known-IP bound"""
+import json
+
+from app.memory import IncidentMemory
+
+
+def open_memory(tmp_path, **kwargs):
+    kwargs.setdefault("legacy_file", None)
+    return IncidentMemory(str(tmp_path / "memory.jsonl"), **kwargs)
+
+
+def snapshot(memory):
+    return (
+        {ip: memory.ip_history(ip) for ip in memory.known_ips},
+        list(memory.incidents),
+    )
+
+
+def log_lines(tmp_path):
+    return (tmp_path / "memory.jsonl").read_text().splitlines()
+
+
+def test_replay_restores_the_index(tmp_path):
+    memory = open_memory(tmp_path, max_verdicts_per_ip=2)
+    for i in range(5):
+        memory.record("10.0.0.1", 40 + i, f"verdict {i}")
+    memory.record("10.0.0.2", 90, "x" * 150)
+    before = snapshot(memory)
+    memory.close()
+
+    reopened = open_memory(tmp_path, max_verdicts_per_ip=2)
+    assert snapshot(reopened) == before
+    history = reopened.ip_history("10.0.0.1")
+    assert history["seen_count"] == 5
+    assert [v["summary"] for v in history["previous_verdicts"]] == ["verdict 3", "verdict 4"]
+    assert reopened.ip_history("10.0.0.2")["previous_verdicts"][0]["summary"] == "x" * 100 + "..."
+    assert reopened.ip_history("10.9.9.9") == {"seen_count": 0, "previous_verdicts": []}
+    reopened.close()
+
+
+def test_torn_final_line_is_ignored(tmp_path):
+    memory = open_memory(tmp_path)
+    memory.record("10.0.0.1", 50, "verdict")
+    memory.close()
+    with open(tmp_path / "memory.jsonl", "a") as f:
+        f.write('{"type": "incident", "ip": "10.0.0.1", "timest')
+
+    reopened = open_memory(tmp_path)
+    assert reopened.ip_history("10.0.0.1")["seen_count"] == 1
+    reopened.close()
+
+
+def test_compaction_bounds_the_log(tmp_path):
+    memory = open_memory(tmp_path, max_incidents=5)
+    for i in range(23):
+        memory.record(f"10.0.0.{i % 3}", i, f"verdict {i}")
+    before = snapshot(memory)
+    memory.close()
+
+    # At most one snapshot line per IP, the retained history and the incidents since the last compaction
+    assert len(log_lines(tmp_path)) <= 3 + 5 + 5
+    assert [incident["threat_score"] for incident in before[1]] == [18, 19, 20, 21, 22]
+
+    reopened = open_memory(tmp_path, max_incidents=5)
+    assert snapshot(reopened) == before
+    assert reopened.ip_history("10.0.0.0")["seen_count"] == 8
+    reopened.close()
+
+
+def test_snapshot_lines_do_not_count_towards_compaction(tmp_path):
+    memory = open_memory(tmp_path, max_incidents=5)
+    for i in range(5):
+        memory.record(f"10.0.0.{i}", i, "verdict")
+    memory.compact()
+    memory.close()
+
+    reopened = open_memory(tmp_path, max_incidents=5)
+    reopened.record("10.0.0.9", 1, "verdict")
+    reopened.close()
+    # One incident since the compaction: appended, not compacted away
+    assert json.loads(log_lines(tmp_path)[-1])["ip"] == "10.0.0.9"
+    assert len(log_lines(tmp_path)) == 5 + 5 + 1
+
+
+def test_known_ips_keep_the_most_recently_recorded(tmp_path):
+    memory = open_memory(tmp_path, max_known_ips=3, max_incidents=100)
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+        memory.record(ip, 10, "verdict")
+    memory.record("10.0.0.1", 10, "verdict")
+    memory.record("10.0.0.4", 10, "verdict")
+
+    assert list(memory.known_ips) == ["10.0.0.3", "10.0.0.1", "10.0.0.4"]
+    assert memory.ip_history("10.0.0.2")["seen_count"] == 0
+    memory.compact()
+    memory.close()
+
+    ip_lines = [line for line in log_lines(tmp_path) if json.loads(line)["type"] == "ip"]
+    assert len(ip_lines) == 3
+
+
+def test_legacy_file_is_imported_once(tmp_path):
+    legacy = tmp_path / "memory_dump.txt"
+    legacy.write_text(json.dumps({
+        "known_ips": {"10.0.0.1": {"seen_count": 2, "previous_verdicts": [{"summary": "old"}]}},
+        "incidents": [{"ip": "10.0.0.1", "timestamp": 1.0, "threat_score": 60}],
+    }))
+    memory = open_memory(tmp_path, legacy_file=str(legacy))
+    assert memory.ip_history("10.0.0.1")["seen_count"] == 2
+    assert len(memory.incidents) == 1
+    memory.close()
+
+    assert not legacy.exists()
+    assert (tmp_path / "memory_dump.txt.migrated").exists()
+    reopened = open_memory(tmp_path, legacy_file=str(legacy))
+    assert reopened.ip_history("10.0.0.1")["previous_verdicts"] == [{"summary": "old"}]
+    reopened.close()
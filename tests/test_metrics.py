@@ -0,0 +1,51 @@
+import pytest
+
+from utils import metrics
+from utils.metrics import Counter, Histogram
+
+
+@pytest.fixture
+def registered():
+    """Metrics created by a test, dropped from the global registry afterwards"""
+    created = []
+    yield created.append
+    with metrics._registry_lock:
+        for metric in created:
+            metrics._registry.remove(metric)
+
+
+def test_help_and_type_lines(registered):
+    counter = Counter("test_events_total", "Events seen\nby the test \\ suite")
+    registered(counter)
+    counter.inc(2)
+
+    assert counter.render() == [
+        "# HELP test_events_total Events seen\\nby the test \\\\ suite",
+        "# TYPE test_events_total counter",
+        "test_events_total 2",
+    ]
+    assert "# TYPE test_events_total counter\ntest_events_total 2\n" in metrics.render()
+
+
+def test_histogram_buckets_are_cumulative(registered):
+    histogram = Histogram("test_latency_seconds", "Latency", ("route",), buckets=(1.0, 0.1, 0.5))
+    registered(histogram)
+    for value in (0.05, 0.3, 0.3, 0.7, 4.0):
+        histogram.observe(value, route="a")
+
+    assert histogram.render()[2:] == [
+        'test_latency_seconds_bucket{route="a",le="0.1"} 1',
+        'test_latency_seconds_bucket{route="a",le="0.5"} 3',
+        'test_latency_seconds_bucket{route="a",le="1.0"} 4',
+        'test_latency_seconds_bucket{route="a",le="+Inf"} 5',
+        'test_latency_seconds_sum{route="a"} 5.35',
+        'test_latency_seconds_count{route="a"} 5',
+    ]
+
+
+def test_label_values_are_escaped(registered):
+    counter = Counter("test_requests_total", "Requests", ("path", "status"))
+    registered(counter)
+    counter.inc(path='C:\\logs\\"alerts"\nnext', status=200)
+
+    assert counter.render()[2] == 'test_requests_total{path="C:\\\\logs\\\\\\"alerts\\"\\nnext",status="200"} 1'
@@ -0,0 +1,99 @@
+"""
+Generation from the cached PROMPT_PREAMBLE must match plain generation
+
+Needs transformers and torch, and downloads gpt2 on the first run.
+Set THREATSAGE_TEST_MODEL to use another (local) model.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from app.agent import PROMPT_PREAMBLE, IncidentResponder, prompt_cache_supported
+
+MODEL = os.environ.get("THREATSAGE_TEST_MODEL", "gpt2")
+
+ENRICHED = {
+    "IP": "185.220.101.4",
+    "Country": "Germany",
+    "ISP": "Tor exit relay",
+    "Reputation": "Suspicious",
+    "Reported Activities": ["Brute Force"],
+}
+
+
+@pytest.fixture(scope="module")
+def responder(tmp_path_factory):
+    if not prompt_cache_supported():
+        pytest.skip("installed transformers is too old for the prompt cache")
+    workdir = tmp_path_factory.mktemp("prompt-cache")
+    responder = IncidentResponder(
+        model_name=MODEL, recommendation_cache=False, cache_dir=str(workdir),
+        memory_file=str(workdir / "memory.jsonl")
+    )
+    try:
+        responder.model
+    except Exception as e:
+        pytest.skip(f"could not load {MODEL}: {e}")
+    if responder.model_name != MODEL:
+        pytest.skip(f"could not load {MODEL}")
+    # Greedy decoding, so both paths are deterministic
+    responder._generation_kwargs = lambda: {"max_new_tokens": 24, "do_sample": False, "truncation": True}
+    return responder
+
+
+@pytest.mark.parametrize("alert", [
+    "Failed SSH login for user admin from 185.220.101.4 at 03:12",
+    "Port scan detected from 185.220.101.4 against 192.168.1.20",
+])
+def test_cached_generation_matches_plain(responder, alert):
+    prompt = responder._build_prompt(ENRICHED, alert, 80)
+    
+    cached = responder._generate_with_prompt_cache(prompt)
+    assert cached is not None
+    assert responder.reuse_prompt_cache
+    
+    responder.reuse_prompt_cache = False
+    try:
+        plain = responder._generate_text(prompt)
+    finally:
+        responder.reuse_prompt_cache = True
+    
+    assert cached == plain
+
+
+def test_mismatched_prefix_tokens_skip_the_cache(responder):
+    prompt = responder._build_prompt(ENRICHED, "SSH brute force", 80)
+    responder._generate_with_prompt_cache(prompt)
+    prefix_ids, past_key_values = responder._prompt_cache
+    
+    # As if a merge across the preamble boundary had changed its last token
+    changed = prefix_ids.clone()
+    changed[0, -1] = (changed[0, -1] + 1) % responder.model.tokenizer.vocab_size
+    responder._prompt_cache = (changed, past_key_values)
+    try:
+        assert responder._generate_with_prompt_cache(prompt) is None
+    finally:
+        responder._prompt_cache = (prefix_ids, past_key_values)
+
+
+def test_failure_after_streaming_started_does_not_stream_the_prompt(responder, monkeypatch):
+    language_model = responder.model.model
+    
+    def failing_generate(input_ids, streamer=None, **kwargs):
+        # Fail partway: the prompt and one new token have reached the streamer
+        streamer.put(input_ids.cpu())
+        streamer.put(input_ids[0, -1:].cpu())
+        raise RuntimeError("generation failed partway")
+    
+    monkeypatch.setattr(language_model, "generate", failing_generate)
+    monkeypatch.setattr(responder, "reuse_prompt_cache", True)
+    chunks = []
+    analysis = responder.reason(ENRICHED, "Failed SSH login for user admin", on_token=chunks.append)
+    
+    streamed = "".join(chunks)
+    assert PROMPT_PREAMBLE[:40] not in streamed
+    assert "Unable to provide detailed analysis" in analysis["recommendation"]
+    assert streamed.endswith(analysis["recommendation"])
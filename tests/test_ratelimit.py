@@ -0,0 +1,79 @@
+"""Token bucket accounting, server headers and backoff in RateLimiter"""
+import time
+
+import pytest
+
+from app.ratelimit import RateLimiter, RateLimitExceeded
+
+
+def test_bucket_allows_capacity_then_refuses():
+    limiter = RateLimiter(capacity=3, period=60.0)
+    for _ in range(3):
+        limiter.acquire(max_wait=0)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=0)
+
+
+def test_tokens_refill_over_time():
+    limiter = RateLimiter(capacity=2, period=0.2)
+    limiter.acquire(max_wait=0)
+    limiter.acquire(max_wait=0)
+    # One token comes back every 0.1s
+    limiter.acquire(max_wait=1.0)
+
+
+def test_headers_block_until_the_window_resets():
+    limiter = RateLimiter(capacity=45, period=60.0)
+    limiter.update_from_headers({"X-Rl": "0", "X-Ttl": "30"})
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=1.0)
+
+
+def test_headers_lower_the_remaining_tokens():
+    limiter = RateLimiter(capacity=45, period=60.0)
+    limiter.update_from_headers({"X-Rl": "1", "X-Ttl": "30"})
+    limiter.acquire(max_wait=0)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=0)
+
+
+def test_missing_headers_are_ignored():
+    limiter = RateLimiter(capacity=1, period=60.0)
+    limiter.update_from_headers({})
+    limiter.update_from_headers({"X-Rl": "soon", "X-Ttl": "1"})
+    limiter.acquire(max_wait=0)
+
+
+def test_backoff_doubles_and_resets():
+    limiter = RateLimiter(backoff_base=1.0, backoff_max=5.0)
+    delays = [limiter.record_failure() for _ in range(5)]
+    assert 0.8 <= delays[0] <= 1.2
+    assert 1.6 <= delays[1] <= 2.4
+    assert delays[4] <= 5.0 * 1.2
+    assert limiter.record_failure(retry_after=30) == 30
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=0)
+
+    limiter.record_success()
+    assert limiter.record_failure() <= 1.2
+
+
+def test_exhausted_window_pauses_until_the_reset():
+    # Fast refill, so the wait is the server's reset time rather than the bucket's own pace
+    limiter = RateLimiter(capacity=45, period=0.45)
+    limiter.update_from_headers({"X-Rl": "0", "X-Ttl": "0.3"})
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=0.1)
+
+    start = time.monotonic()
+    limiter.acquire(max_wait=2.0)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_throttled_response_pauses_for_its_retry_after():
+    limiter = RateLimiter(capacity=45, period=60.0, backoff_base=0.01)
+    limiter.record_failure(retry_after=0.3)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(max_wait=0.1)
+    time.sleep(0.3)
+    limiter.acquire(max_wait=0)
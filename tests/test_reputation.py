@@ -0,0 +1,131 @@
+"""Longest-prefix matching in the blocklist radix tree, and reputation config reloads"""
+import json
+import os
+import random
+import threading
+import time
+
+from app.reputation import PrefixTree, ReputationEngine, _parse_cidr
+
+
+def brute_force_match(prefixes, address):
+    """Index of the longest prefix covering address, or -1"""
+    best, best_length = -1, -1
+    for index, (network, length) in enumerate(prefixes):
+        mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+        if address & mask == network and length > best_length:
+            best, best_length = index, length
+    return best
+
+
+def test_longest_match_agrees_with_brute_force():
+    rng = random.Random(1234)
+    prefixes = []
+    seen = set()
+    while len(prefixes) < 400:
+        length = rng.choice([0, 1, 8, 12, 16, 20, 24, 28, 31, 32] + [rng.randint(0, 32)])
+        mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+        # Cluster networks under a few /8s so prefixes nest and share paths
+        network = ((rng.choice([10, 172, 192]) << 24) | rng.getrandbits(24)) & mask
+        if (network, length) not in seen:
+            seen.add((network, length))
+            prefixes.append((network, length))
+
+    tree = PrefixTree()
+    for index, (network, length) in enumerate(prefixes):
+        tree.insert(network, length, index)
+
+    addresses = [rng.getrandbits(32) for _ in range(2000)]
+    # Addresses right at and just past the edges of each network
+    for network, length in prefixes:
+        size = 1 << (32 - length)
+        addresses += [network, (network + size - 1) & 0xFFFFFFFF, (network + size) & 0xFFFFFFFF]
+
+    for address in addresses:
+        assert tree.longest_match(address) == brute_force_match(prefixes, address)
+
+
+def test_replace_keeps_the_stronger_value():
+    tree = PrefixTree()
+    tree.insert(0x0A000000, 8, 1)
+    tree.insert(0x0A000000, 8, 2, replace=max)
+    tree.insert(0x0A000000, 8, 0, replace=max)
+    assert tree.longest_match(0x0A010203) == 2
+    assert tree.longest_match(0x0B000000) == -1
+
+
+def test_parse_cidr():
+    assert _parse_cidr("10.1.2.3/8") == (0x0A000000, 8)
+    assert _parse_cidr("10.1.2.3") == (0x0A010203, 32)
+    assert _parse_cidr("0.0.0.0/0") == (0, 0)
+    for text in ("256.0.0.1", "10.0.0/8", "10.0.0.1/33", "10.0.0.1/x", "a.b.c.d", "1.2.3.4.5"):
+        assert _parse_cidr(text) is None
+
+
+def write_config(directory, lists):
+    config = directory / "reputation.json"
+    config.write_text(json.dumps({"lists": lists}))
+    return config
+
+
+def test_engine_checks_and_reloads(tmp_path):
+    (tmp_path / "low.txt").write_text("# comment\n10.0.0.0/8\n203.0.113.7 ; single host\n")
+    (tmp_path / "high.txt").write_text("10.1.0.0/16\n")
+    config = write_config(tmp_path, [
+        {"name": "low", "path": "low.txt", "confidence": "Low", "activities": ["Scanning"]},
+        {"name": "high", "path": "high.txt", "confidence": "High", "activities": ["Botnet"]},
+    ])
+    engine = ReputationEngine(str(config), check_interval=0)
+
+    assert engine.check("10.1.2.3")["Reputation Source"] == "high"
+    assert engine.check("10.2.0.1")["Confidence"] == "Low"
+    assert engine.check("203.0.113.7")["Reported Activities"] == ["Scanning"]
+    assert engine.check("203.0.113.8")["Reputation"] == "Clean"
+    assert engine.check("not an ip")["Reputation"] == "Clean"
+
+    (tmp_path / "low.txt").write_text("192.0.2.0/24\n")
+    assert engine.reload()
+    assert engine.check("10.2.0.1")["Reputation"] == "Clean"
+    assert engine.check("192.0.2.55")["Reputation"] == "Suspicious"
+
+
+def test_broken_config_keeps_the_current_lists(tmp_path, capsys):
+    (tmp_path / "list.txt").write_text("10.0.0.0/8\n")
+    config = write_config(tmp_path, [{"path": "list.txt"}])
+    engine = ReputationEngine(str(config), check_interval=0)
+
+    config.write_text("{not json")
+    assert not engine.reload()
+    assert "Warning" in capsys.readouterr().out
+    assert engine.check("10.0.0.1")["Reputation"] == "Suspicious"
+    # The broken file is reported once, not on every lookup
+    engine.check("10.0.0.2")
+    assert capsys.readouterr().out == ""
+
+
+def test_changed_lists_are_rebuilt_in_the_background(tmp_path):
+    blocklist = tmp_path / "list.txt"
+    blocklist.write_text("10.0.0.0/8\n")
+    config = write_config(tmp_path, [{"path": "list.txt"}])
+    engine = ReputationEngine(str(config), check_interval=0)
+
+    read_config = engine._read_config
+    release = threading.Event()
+
+    def slow_read_config():
+        release.wait(5)
+        return read_config()
+
+    engine._read_config = slow_read_config
+    blocklist.write_text("192.0.2.0/24\n")
+    later = time.time() + 10
+    os.utime(blocklist, (later, later))
+
+    # The lookup that notices the change is answered from the current lists
+    assert engine.check("10.0.0.1")["Reputation"] == "Suspicious"
+    assert engine.check("192.0.2.1")["Reputation"] == "Clean"
+    release.set()
+    engine._reloader.join(5)
+
+    assert engine.check("10.0.0.1")["Reputation"] == "Clean"
+    assert engine.check("192.0.2.1")["Reputation"] == "Suspicious"
@@ -0,0 +1,88 @@
+"""ScoringEngine against the original per-incident scorer, on both the NumPy and plain Python paths"""
+import json
+import random
+
+import pytest
+
+from app import scoring
+from app.scoring import DEFAULT_RULES, ScoringEngine
+
+
+def original_score(enriched_data, seen_count):
+    """IncidentResponder.calculate_threat_score from before the scoring engine, history passed in"""
+    score = 0
+    if enriched_data.get("Is Proxy", False):
+        score += 30
+    if enriched_data.get("Is Hosting", False):
+        score += 20
+    score += min(seen_count * 10, 30)
+    if enriched_data.get("Reputation") == "Suspicious":
+        confidence = enriched_data.get("Confidence", "Low")
+        if confidence == "High":
+            score += 30
+        else:
+            score += 15
+    if enriched_data.get("Country") in ["Russia", "China", "North Korea", "Iran"]:
+        score += 20
+    return min(score, 100)
+
+
+def random_records(count, seed=7):
+    rng = random.Random(seed)
+    records, seen_counts = [], []
+    for i in range(count):
+        record = {"IP": f"10.0.{i // 256}.{i % 256}"}
+        for field, values in (
+            ("Is Proxy", [True, False, 1, 0, None]),
+            ("Is Hosting", [True, False]),
+            ("Reputation", ["Suspicious", "Clean", "Unknown", None]),
+            ("Confidence", ["High", "Low", "Medium"]),
+            ("Country", ["Russia", "China", "North Korea", "Iran", "Germany", "N/A", None]),
+        ):
+            # Leave some fields out entirely, as failed lookups do
+            if rng.random() < 0.8:
+                record[field] = rng.choice(values)
+        records.append(record)
+        seen_counts.append(rng.choice([0, 0, 1, 2, 3, 4, 50]))
+    return records, seen_counts
+
+
+@pytest.fixture
+def engine():
+    return ScoringEngine(rules_file=None)
+
+
+def test_score_matches_the_original(engine):
+    records, seen_counts = random_records(2000)
+    for record, seen in zip(records, seen_counts):
+        assert engine.score(record, seen) == original_score(record, seen)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_score_many_matches_the_original(engine, monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(scoring, "np", None)
+    records, seen_counts = random_records(2000)
+
+    scores = engine.score_many(records, seen_counts)
+    assert scores == [original_score(r, s) for r, s in zip(records, seen_counts)]
+    assert all(type(score) is int for score in scores)
+
+
+def test_score_many_edge_cases(engine):
+    assert engine.score_many([]) == []
+    assert engine.score_many([{"Is Proxy": True}, {}]) == [30, 0]
+
+
+def test_rules_file_overrides_weights(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"proxy": 5, "high_risk_countries": ["Atlantis"], "max_score": 40}))
+    engine = ScoringEngine(rules_file=str(path))
+    assert engine.rules["hosting"] == DEFAULT_RULES["hosting"]
+
+    record = {"Is Proxy": True, "Is Hosting": True, "Country": "Atlantis"}
+    assert engine.score(record) == 40
+    assert engine.score({"Is Proxy": True, "Country": "Russia"}) == 5
+    assert engine.score_many([record, {"Is Proxy": True, "Country": "Russia"}]) == [40, 5]
@@ -0,0 +1,59 @@
+"""Request validation in the analysis service's /score job"""
+import pytest
+
+from app.agent import IncidentResponder
+from app.service import AnalysisService, HTTPError
+
+
+class StubThreatIntel:
+    """Enrichment that records the IPs it was asked about"""
+
+    def __init__(self):
+        self.lookups = []
+
+    def enrich_ip(self, ip):
+        self.lookups.append(ip)
+        return {"IP": ip, "Country": "Russia", "Is Proxy": True, "Reputation": "Clean"}
+
+
+@pytest.fixture
+def service(tmp_path):
+    responder = IncidentResponder(recommendation_cache=False, memory_file=str(tmp_path / "memory.jsonl"),
+                                  scoring_rules_file=None)
+    service = AnalysisService(responder=responder, threat_intel=StubThreatIntel(), workers=1)
+    yield service
+    service._executor.shutdown()
+    responder.memory.close()
+
+
+def test_score_enriches_a_valid_ip(service):
+    result = service.score({"ip": "203.0.113.9"})
+    assert result["threat_score"] == 50
+    assert service.threat_intel.lookups == ["203.0.113.9"]
+
+
+def test_score_rejects_an_invalid_ip_before_enriching(service):
+    with pytest.raises(HTTPError) as error:
+        service.score({"ip": "notanip"})
+    assert error.value.status == 400
+    assert service.threat_intel.lookups == []
+
+
+@pytest.mark.parametrize("ip_data", [
+    {"Country": ["x"]},
+    {"IP": {"a": 1}},
+    {"Reputation": 3},
+    {"Is Proxy": "yes"},
+])
+def test_score_rejects_mistyped_ip_data(service, ip_data):
+    with pytest.raises(HTTPError) as error:
+        service.score({"ip_data": ip_data})
+    assert error.value.status == 400
+
+
+def test_score_accepts_an_enrichment_record(service):
+    ip_data = {"IP": "203.0.113.9", "Country": "Iran", "Is Hosting": True, "Reputation": "Suspicious",
+               "Confidence": "High", "Reported Activities": ["Scanning"], "Region": None}
+    assert service.score({"ip_data": ip_data})["threat_score"] == 70
+    with pytest.raises(HTTPError):
+        service.score({})
@@ -0,0 +1,78 @@
+"""Grid aggregation behind the IP map"""
+from app.visualizer import REPUTATION_RANK, aggregate_locations, choose_cell_size
+
+
+def record(lat, lon, reputation="Clean", country="Alpha", isp="ISP"):
+    return {"Coordinates": f"{lat},{lon}", "Reputation": reputation, "Country": country, "ISP": isp}
+
+
+def cells_by_country(columns):
+    """country label -> (count, worst reputation, sample IPs) for each cell"""
+    result = {}
+    offsets = columns["sample_offset"]
+    for i, count in enumerate(columns["count"]):
+        label = columns["strings"][columns["country"][i]]
+        samples = columns["sample_ip"][offsets[i]:offsets[i + 1]]
+        result[label] = (count, columns["reputations"][columns["reputation"][i]], samples)
+    return result
+
+
+def test_nearby_ips_share_a_cell():
+    ip_data = {
+        "10.0.0.1": record(51.501, -0.121),
+        "10.0.0.2": record(51.509, -0.129, reputation="Suspicious"),
+        "10.0.0.3": record(48.85, 2.35, country="Beta"),
+        "10.0.0.4": {"Error": "lookup failed"},
+        "10.0.0.5": record("N/A", "N/A"),
+        "10.0.0.6": {"Coordinates": "nan,1"},
+    }
+    columns = aggregate_locations(ip_data, cell_size=0.1)
+
+    assert columns["ip_count"] == 3
+    assert len(columns["count"]) == 2
+    cells = cells_by_country(columns)
+    assert cells["Alpha"] == (2, "Suspicious", ["10.0.0.2", "10.0.0.1"])
+    assert cells["Beta"] == (1, "Clean", ["10.0.0.3"])
+
+    i = columns["count"].index(2)
+    assert (columns["lat"][i], columns["lon"][i]) == (51.505, -0.125)
+
+
+def test_samples_keep_the_worst_ips():
+    ip_data = {f"10.0.0.{i}": record(10.01, 10.01) for i in range(20)}
+    ip_data["10.0.1.1"] = record(10.01, 10.01, reputation="Suspicious")
+    ip_data["10.0.1.2"] = record(10.01, 10.01, reputation="Weird")  # counted as Unknown
+    columns = aggregate_locations(ip_data, cell_size=0.1, ips_per_cell=3)
+
+    assert columns["count"] == [22]
+    assert columns["sample_offset"] == [0, 3]
+    assert columns["sample_ip"][:2] == ["10.0.1.1", "10.0.1.2"]
+    assert columns["sample_reputation"][:2] == [REPUTATION_RANK["Suspicious"], REPUTATION_RANK["Unknown"]]
+
+
+def test_mixed_country_cells_name_the_most_common():
+    ip_data = {
+        "10.0.0.1": record(47.001, 8.001, country="Alpha"),
+        "10.0.0.2": record(47.002, 8.002, country="Alpha"),
+        "10.0.0.3": record(47.003, 8.003, country="Beta"),
+        "10.0.0.4": record(47.004, 8.004, country="Gamma"),
+        "10.0.0.5": record(20.0, 20.0, country="Delta"),
+        "10.0.0.6": record(20.0, 20.0, country="Delta"),
+        "10.0.0.7": record(20.0, 20.0, country="Epsilon"),
+    }
+    cells = cells_by_country(aggregate_locations(ip_data, cell_size=0.1))
+    assert set(cells) == {"Alpha (+2 others)", "Delta (+1 other)"}
+
+
+def test_cell_size_grows_to_the_cell_cap():
+    points = [(lat / 10, lon / 10) for lat in range(-300, 300, 7) for lon in range(-600, 600, 7)]
+    assert choose_cell_size(points[:10], max_cells=100) == 0.1
+    cell_size = choose_cell_size(points, max_cells=100)
+    assert cell_size > 0.1
+
+    ip_data = {f"ip{i}": record(lat, lon) for i, (lat, lon) in enumerate(points)}
+    columns = aggregate_locations(ip_data, max_cells=100)
+    assert columns["cell_size"] == cell_size
+    assert len(columns["count"]) <= 100
+    assert sum(columns["count"]) == columns["ip_count"] == len(points)
+    assert columns["sample_offset"][-1] == len(columns["sample_ip"])
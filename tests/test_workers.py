@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import re
+
+import pytest
+
+import app.backends
+from app.agent import IncidentResponder
+from app.backends import InferenceBackend
+from app.workers import InferencePool
+
+pytestmark = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                                reason="the echo backend reaches the workers by forking")
+
+
+def prompt_ip(prompt):
+    return re.search(r"- IP: (\S+)", prompt).group(1)
+
+
+class EchoTokenizer:
+    pad_token_id = 0
+    padding_side = "right"
+
+
+class EchoPipeline:
+    """Answers each prompt with the IP it asks about"""
+    tokenizer = EchoTokenizer()
+
+    def __call__(self, prompts, batch_size=1, **kwargs):
+        return [[{"generated_text": f"{prompt} echo {prompt_ip(prompt)} from {os.getpid()}"}] for prompt in prompts]
+
+
+class EchoBackend(InferenceBackend):
+    name = "echo"
+    supports_prompt_cache = False
+
+    def _build(self, model_name):
+        return EchoPipeline()
+
+
+@pytest.fixture
+def responder(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.backends.BACKENDS, EchoBackend.name, EchoBackend)
+    responder = IncidentResponder(model_name="echo-model", backend="echo", recommendation_cache=False,
+                                  memory_file=str(tmp_path / "memory.jsonl"), cache_dir=str(tmp_path / "cache"),
+                                  scoring_rules_file=None)
+    yield responder
+    responder.memory.close()
+
+
+@pytest.fixture
+def pool(responder):
+    with InferencePool(responder, processes=1, start_method="fork", timeout=30) as pool:
+        yield pool
+
+
+def test_generate_many_keeps_order(pool):
+    prompts = [f"- IP: 198.51.100.{i}\nSecurity Assessment:" for i in range(5)]
+    texts = pool.generate_many(prompts, batch_size=2)
+
+    assert [text.split()[1] for text in texts] == [f"198.51.100.{i}" for i in range(5)]
+    assert all(text.split()[-1] != str(os.getpid()) for text in texts)
+
+
+def test_reason_many_uses_the_workers(pool):
+    records = [{"IP": f"198.51.100.{i}", "Is Proxy": True} for i in range(3)]
+    results = pool.reason_many(records, ["alert"] * 3)
+
+    assert [result["recommendation"].split()[1] for result in results] == [record["IP"] for record in records]
+    assert all(result["tier"] == "model" for result in results)
+
+    stats = pool.backend_stats()
+    assert len(stats["workers"]) == 1
+    assert stats["workers"][0]["pid"] != os.getpid()
+    assert stats["workers"][0]["backend"] == "echo"
+    assert stats["tokens_generated"] > 0
+
+
+def test_worker_fallback_keeps_backend_stats(pool, responder):
+    responder.backend.record(12, 3.0)
+    pool._use_worker_model("gpt2", "pipeline")
+
+    stats = responder.backend_stats()
+    assert responder.model_name == "gpt2"
+    assert stats["backend"] == "pipeline"
+    assert stats["tokens_generated"] == 12
+    assert stats["generation_seconds"] == 3.0
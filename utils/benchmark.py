@@ -0,0 +1,257 @@
+"""
+Benchmark every ThreatSage pipeline stage offline
+
+Enrichment goes to a local ip-api stub and generation to a stub model, so no
+network or model download is needed. Each stage is timed at several input
+sizes and the results are printed as JSON:
+
+    python -m utils.benchmark
+    python -m utils.benchmark --sizes 10 100 --repeat 5 -o bench.json
+    python -m utils.benchmark --baseline bench.json --tolerance 0.25   # non-zero exit on regressions
+    python -m utils.benchmark --model sshleifer/tiny-gpt2              # time a real (tiny) model
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from utils.ipapi_stub import start_stub_server
+
+DEFAULT_SIZES = [10, 100, 1000]
+STAGES = ["extract_all", "enrich_ip_cold", "enrich_ip_warm", "calculate_threat_score",
+          "reason", "generate_report", "generate_html_map", "generate_threat_chart"]
+
+_ALERT_TEMPLATES = [
+    "Failed SSH login for user {user} from {ip} at 03:{minute:02d}",
+    "Multiple failed login attempts for username: {user} from IP {ip}",
+    "Firewall blocked outbound connection from 10.0.0.{octet} to {ip}:4444",
+    "Port scan detected from {ip} against 192.168.1.{octet}",
+    "Suspicious file download by {user} from {ip} at 11:{minute:02d} PM",
+]
+
+
+class StubGenerator:
+    """Stands in for a transformers text-generation pipeline with a fixed answer"""
+
+    class _Tokenizer:
+        pad_token_id = None
+        padding_side = "right"
+
+    class _Model:
+        class config:
+            eos_token_id = 0
+
+    answer = (" This activity matches credential brute forcing (MITRE ATT&CK T1110). "
+              "Block the source IP and reset affected credentials.")
+
+    def __init__(self):
+        self.tokenizer = self._Tokenizer()
+        self.model = self._Model()
+
+    def __call__(self, prompts, **kwargs):
+        if isinstance(prompts, list):
+            return [[{"generated_text": prompt + self.answer}] for prompt in prompts]
+        return [{"generated_text": prompts + self.answer}]
+
+
+def sample_ips(count, seed=0):
+    """Distinct public-looking IPv4 addresses"""
+    rng = random.Random(seed)
+    ips = set()
+    while len(ips) < count:
+        ips.add(f"{rng.choice([23, 45, 62, 91, 176, 185, 203])}.{rng.randrange(256)}."
+                f"{rng.randrange(256)}.{rng.randrange(1, 255)}")
+    return sorted(ips)
+
+
+def sample_alerts(ips, seed=0):
+    """One synthetic alert per IP"""
+    rng = random.Random(seed)
+    return [rng.choice(_ALERT_TEMPLATES).format(
+        ip=ip, user=rng.choice(["admin", "root", "jsmith", "svc_backup"]),
+        minute=rng.randrange(60), octet=rng.randrange(1, 255)
+    ) for ip in ips]
+
+
+def _time(function, repeat):
+    """Best wall-clock time of repeat calls, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, stages=STAGES, model_name=None, workdir=None):
+    """
+    Time each stage at each size
+    Returns a list of {stage, size, seconds, per_item_ms} dictionaries (or an error entry)
+    """
+    # Imported here so the benchmark runs inside its scratch directory
+    from app.agent import IncidentResponder
+    from app.enrichment import ThreatIntelligence
+    from app.extractor import EntityExtractor
+    from app.reporter import generate_report
+    from app.visualizer import generate_html_map, generate_threat_chart
+
+    server = start_stub_server()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    extractor = EntityExtractor()
+    results = []
+
+    def fresh_intel(name):
+        # Lift the ip-api free-tier limits, the stub has none
+        return ThreatIntelligence(
+            cache_dir=os.path.join(workdir, name), api_url=api_url,
+            requests_per_minute=10 ** 6, batch_requests_per_minute=10 ** 6
+        )
+
+    def fresh_responder(name):
+        responder = IncidentResponder(
+            model_name=model_name or "gpt2", recommendation_cache=False,
+            memory_file=os.path.join(workdir, f"{name}.jsonl"), cache_dir=os.path.join(workdir, name)
+        )
+        if model_name is None:
+            responder._model = StubGenerator()
+        return responder
+
+    try:
+        for size in sizes:
+            ips = sample_ips(size, seed=size)
+            alerts = sample_alerts(ips, seed=size)
+            intel = fresh_intel(f"warm-{size}")
+            ip_data = {ip: intel.enrich_ip(ip) for ip in ips}
+            records = list(ip_data.values())
+            responder = fresh_responder(f"memory-{size}")
+            history = [{"ip": ip, "timestamp": time.time() - i * 60, "threat_score": (i * 37) % 100}
+                       for i, ip in enumerate(ips)]
+            cold_runs = iter(range(repeat))
+
+            def cold():
+                cold_intel = fresh_intel(f"cold-{size}-{next(cold_runs)}")
+                for ip in ips:
+                    cold_intel.enrich_ip(ip)
+                cold_intel.close()
+
+            def reason():
+                for data, alert in zip(records, alerts):
+                    responder.reason(data, raw_alert=alert)
+
+            def report():
+                analysis = responder.reason(records[0], raw_alert=alerts[0])
+                for alert in alerts:
+                    generate_report(extractor.extract_all(alert), ip_data, analysis, alert)
+
+            timed = {
+                "extract_all": lambda: [extractor.extract_all(alert) for alert in alerts],
+                "enrich_ip_cold": cold,
+                "enrich_ip_warm": lambda: [intel.enrich_ip(ip) for ip in ips],
+                "calculate_threat_score": lambda: [responder.calculate_threat_score(data) for data in records],
+                "reason": reason,
+                "generate_report": report,
+                "generate_html_map": lambda: generate_html_map(ip_data),
+                "generate_threat_chart": lambda: generate_threat_chart(history),
+            }
+
+            for stage in stages:
+                try:
+                    seconds = _time(timed[stage], repeat)
+                    results.append({
+                        "stage": stage, "size": size, "seconds": round(seconds, 6),
+                        "per_item_ms": round(seconds * 1000 / size, 4),
+                    })
+                except Exception as e:
+                    results.append({"stage": stage, "size": size, "error": str(e)})
+
+            intel.close()
+            responder.memory.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compare results with a previous run
+    Returns the stages whose time grew by more than tolerance (a fraction)
+    """
+    previous = {(r["stage"], r["size"]): r for r in baseline.get("results", []) if "seconds" in r}
+    regressions = []
+    for result in results:
+        before = previous.get((result["stage"], result["size"]))
+        if before and "seconds" in result and result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append({
+                "stage": result["stage"], "size": result["size"],
+                "baseline_seconds": before["seconds"], "seconds": result["seconds"],
+                "change": round(result["seconds"] / before["seconds"] - 1, 3) if before["seconds"] else None,
+            })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ThreatSage pipeline stages offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Number of alerts/IPs per run (default: 10 100 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is kept")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--model", default=None,
+                        help="Real HuggingFace model for the reason stage (default: stub generator)")
+    parser.add_argument("-o", "--output", default=None, help="Write JSON results to this file")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against --baseline as a fraction (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    original_dir = os.getcwd()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    # Reports, maps and caches land in a scratch directory rather than the project
+    with tempfile.TemporaryDirectory(prefix="threatsage-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            results = run_benchmarks(args.sizes, max(1, args.repeat), args.stages, args.model, workdir)
+        finally:
+            os.chdir(original_dir)
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": args.model or "stub",
+            "repeat": args.repeat,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+    if baseline is not None:
+        output["regressions"] = compare(results, baseline, args.tolerance)
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if baseline is not None and output["regressions"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Local stand-in for the ip-api.com JSON API
+
+Serves deterministic answers for GET /json/<ip> and POST /batch so enrichment
+can be exercised without network access:
+
+    python -m utils.ipapi_stub --port 8765
+    ThreatIntelligence(api_url="http://127.0.0.1:8765")
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTRIES = [
+    ("Germany", "Hesse", "Frankfurt am Main", 50.11, 8.68, "Europe/Berlin"),
+    ("United States", "Virginia", "Ashburn", 39.04, -77.49, "America/New_York"),
+    ("The Netherlands", "North Holland", "Amsterdam", 52.37, 4.90, "Europe/Amsterdam"),
+    ("Russia", "Moscow", "Moscow", 55.75, 37.62, "Europe/Moscow"),
+    ("Brazil", "Sao Paulo", "Sao Paulo", -23.55, -46.63, "America/Sao_Paulo"),
+]
+
+
+def fake_lookup(ip):
+    """Build a deterministic ip-api style response for an address"""
+    if not ip or ip.count(".") != 3:
+        return {"status": "fail", "message": "invalid query", "query": ip}
+    digest = int(hashlib.md5(ip.encode()).hexdigest(), 16)
+    country, region, city, lat, lon, timezone = COUNTRIES[digest % len(COUNTRIES)]
+    asn = 10000 + digest % 50000
+    return {
+        "status": "success",
+        "query": ip,
+        "country": country,
+        "regionName": region,
+        "city": city,
+        "lat": lat,
+        "lon": lon,
+        "timezone": timezone,
+        "isp": f"Stub ISP {asn}",
+        "org": f"Stub Org {asn}",
+        "as": f"AS{asn} Stub Networks",
+    }
+
+
+class IPAPIStubHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the ip-api.com endpoints ThreatSage uses"""
+
+    def _send_json(self, status, payload, remaining=None, reset_in=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if remaining is not None:
+            self.send_header("X-Rl", str(remaining))
+            self.send_header("X-Ttl", str(reset_in))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _take_quota(self):
+        """
+        Count a request against the per-minute quota, if one is configured
+        Returns (allowed, remaining, reset_in) like ip-api's X-Rl/X-Ttl headers
+        """
+        server = self.server
+        with server.quota_lock:
+            server.request_count += 1
+            if not server.rate_limit:
+                return True, None, None
+            now = time.monotonic()
+            if now - server.window_start >= 60:
+                server.window_start = now
+                server.window_used = 0
+            reset_in = max(1, int(60 - (now - server.window_start)))
+            if server.window_used >= server.rate_limit:
+                return False, 0, reset_in
+            server.window_used += 1
+            return True, server.rate_limit - server.window_used, reset_in
+
+    def do_GET(self):
+        if not self.path.startswith("/json/"):
+            self._send_json(404, {"status": "fail", "message": "not found"})
+            return
+        allowed, remaining, reset_in = self._take_quota()
+        if not allowed:
+            self._send_json(429, {"status": "fail", "message": "rate limited"}, remaining, reset_in)
+            return
+        ip = self.path[len("/json/"):].split("?")[0]
+        self.server.requests.append(("GET", [ip]))
+        self._send_json(200, fake_lookup(ip), remaining, reset_in)
+
+    def do_POST(self):
+        if not self.path.startswith("/batch"):
+            self._send_json(404, {"status": "fail", "message": "not found"})
+            return
+        allowed, remaining, reset_in = self._take_quota()
+        if not allowed:
+            self._send_json(429, {"status": "fail", "message": "rate limited"}, remaining, reset_in)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            queries = json.loads(self.rfile.read(length) or b"[]")
+        except json.JSONDecodeError:
+            self._send_json(400, {"status": "fail", "message": "invalid json"})
+            return
+        if not isinstance(queries, list) or len(queries) > 100:
+            self._send_json(422, {"status": "fail", "message": "too many queries"})
+            return
+        ips = [q.get("query") if isinstance(q, dict) else q for q in queries]
+        self.server.requests.append(("POST", ips))
+        self._send_json(200, [fake_lookup(ip) for ip in ips], remaining, reset_in)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(host="127.0.0.1", port=0, rate_limit=None):
+    """Create the stub server; rate_limit is an optional per-minute request quota"""
+    server = ThreadingHTTPServer((host, port), IPAPIStubHandler)
+    server.request_count = 0
+    server.requests = []  # (method, queried IPs) of every answered lookup
+    server.rate_limit = rate_limit
+    server.window_start = time.monotonic()
+    server.window_used = 0
+    server.quota_lock = threading.Lock()
+    return server
+
+
+def start_stub_server(host="127.0.0.1", port=0, rate_limit=None):
+    """
+    Start the stub server on a background thread
+    Returns the server; its base URL is f"http://{host}:{server.server_port}"
+    """
+    server = make_stub_server(host, port, rate_limit)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stub of the ip-api.com API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=int, default=None,
+                        help="Requests allowed per minute before answering 429")
+    args = parser.parse_args()
+
+    stub = make_stub_server(args.host, args.port, args.rate_limit)
+    print(f"[*] ip-api stub listening on http://{args.host}:{args.port}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -30,19 +30,27 @@ def configure_logging():
         logging.getLogger(logger_name).setLevel(logging.ERROR)
 
     logging.basicConfig(level=logging.CRITICAL)
+
+def configure_ml_logging():
+    """
+    Quiet the ML frameworks once they are actually needed
     
-    try:
-        import tensorflow as tf
-        tf.get_logger().setLevel('ERROR')
-        tf.autograph.set_verbosity(0)
-        
-        from tensorflow.python.util import module_wrapper as wrap
-        wrap._PER_MODULE_WARNING_LIMIT = 0
-    except ImportError:
-        pass
+    Kept separate from configure_logging so that importing the CLI does not pull
+    in tensorflow or torch; call it right before loading a model.
+    """
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        try:
+            tf.get_logger().setLevel('ERROR')
+            tf.autograph.set_verbosity(0)
+            
+            from tensorflow.python.util import module_wrapper as wrap
+            wrap._PER_MODULE_WARNING_LIMIT = 0
+        except (ImportError, AttributeError):
+            pass
         
     try:
         import torch
         torch.set_warn_always(False)
     except ImportError:
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,64 @@
+"""
+Measure ThreatSage startup cost
+
+Imports each entry point in a fresh interpreter and reports the wall-clock
+import time and whether any heavy ML framework was pulled in:
+
+    python -m utils.startup
+    python -m utils.startup --max-seconds 1.0   # non-zero exit if any module is slower
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ENTRY_MODULES = ["app.main", "app.batch", "app.scenarios", "app.examples", "app.enrichment", "app.extractor"]
+HEAVY_MODULES = ["transformers", "torch", "tensorflow"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure_startup(module, repeat=3):
+    """
+    Import module in fresh interpreters and return the best of repeat runs
+    Returns a dictionary with the module name, seconds and heavy modules loaded
+    """
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=project_root, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            return {"module": module, "error": lines[-1] if lines else f"exit code {completed.returncode}"}
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        if best is None or run["seconds"] < best["seconds"]:
+            best = run
+    return {"module": module, "seconds": round(best["seconds"], 4), "heavy_imports": best["heavy"]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of ThreatSage entry points")
+    parser.add_argument("modules", nargs="*", default=ENTRY_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if any module takes longer than this to import")
+    args = parser.parse_args(argv)
+
+    results = [measure_startup(module, args.repeat) for module in args.modules]
+    print(json.dumps(results, indent=2))
+
+    if args.max_seconds is not None:
+        slow = [r for r in results if "error" in r or r["seconds"] > args.max_seconds]
+        return 1 if slow else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())